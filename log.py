@@ -1,10 +1,24 @@
 #!/usr/bin/env python2
 # -*- coding: utf-8 -*-
+import codecs
+import gzip
+import json
 import logging
 import logging.handlers
+import os
+import shutil
+import sys
+import threading
+import time
+try:
+  import Queue as queue
+except ImportError:
+  import queue
+from mypwn.mystring import hexdump
 
 __all__ = [
-    'getLogger', 'log',
+    'getLogger', 'log', 'Lazy', 'QueuedHandler', 'TerminalHandler', 'Progress',
+    'JsonFormatter', 'JsonLinesHandler',
 ]
 
 _msgtype_prefixes = {
@@ -37,6 +51,10 @@ class Logger(object):
     if logger is None:
       logger = logging.getLogger('mypwn')
     self._logger = logger
+    # isEnabledFor() cache, valid while these two stay the same
+    self._cache_level = None
+    self._cache_disable = None
+    self._threshold = logging.NOTSET
 
   def _getlevel(self, levelString):
     if isinstance(levelString, int):
@@ -44,10 +62,19 @@ class Logger(object):
     return logging._levelNames[levelString.upper()]
 
   def _log(self, level, msg, args, kwargs, msgtype):
+    # nothing is built for a disabled level; this is isEnabledFor() inlined
+    logger = self._logger
+    if logger.level != self._cache_level or \
+        logger.manager.disable != self._cache_disable:
+      if not self.isEnabledFor(level):
+        return
+    elif level < self._threshold:
+      return
     extra = kwargs.get('extra', {})
     extra.setdefault('mypwn_msgtype', msgtype)
     kwargs['extra'] = extra
-    self._logger.log(level, msg, *args, **kwargs)
+    # the level was checked above, skip the check in `logging.Logger.log`
+    logger._log(level, msg, args, **kwargs)
 
   def indented(self, message, *args, **kwargs):
     """indented(message, *args, level = logging.INFO, **kwargs)
@@ -59,6 +86,12 @@ class Logger(object):
     level = self._getlevel(kwargs.pop('level', logging.INFO))
     self._log(level, message, args, kwargs, 'indented')
 
+  def progress(self, name, total=None, rate=10, interval=5):
+    """progress(name, total=None, rate=10, interval=5) -> Progress
+    Returns a :class:`Progress` status line for a long running task.
+    """
+    return Progress(self, name, total, rate, interval)
+
   def success(self, message, *args, **kwargs):
     """success(message, *args, **kwargs)
     Logs a success message.
@@ -75,20 +108,22 @@ class Logger(object):
     """info_once(message, *args, **kwargs)
     Logs an info message.  The same message is never printed again.
     """
+    if not self.isEnabledFor(logging.INFO):
+      return
     m = message % args
     if m not in self._one_time_infos:
-      if self.isEnabledFor(logging.INFO):
-        self._one_time_infos.add(m)
+      self._one_time_infos.add(m)
       self._log(logging.INFO, message, args, kwargs, 'info_once')
 
   def warning_once(self, message, *args, **kwargs):
     """warning_once(message, *args, **kwargs)
     Logs a warning message.  The same message is never printed again.
     """
+    if not self.isEnabledFor(logging.WARNING):
+      return
     m = message % args
     if m not in self._one_time_warnings:
-      if self.isEnabledFor(logging.INFO):
-        self._one_time_warnings.add(m)
+      self._one_time_warnings.add(m)
       self._log(logging.WARNING, message, args, kwargs, 'warning_once')
 
   def warn_once(self, *args, **kwargs):
@@ -109,8 +144,18 @@ class Logger(object):
     """
     self._log(logging.INFO, message, args, kwargs, 'info')
 
-  def hexdump(self, message, *args, **kwargs):
-    pass
+  def hexdump(self, data, begin=0, end=None, skip=True, **kwargs):
+    """hexdump(data, begin=0, end=None, skip=True, level = logging.INFO, **kwargs)
+    Logs `hexdump -C` of data[begin:end], see :func:`mypwn.mystring.hexdump`.
+    Nothing is formatted if the level is disabled.
+    Arguments:
+      level(int): Alternate log level.  Defaults to :const:`logging.INFO`.
+    """
+    level = self._getlevel(kwargs.pop('level', logging.INFO))
+    if not self.isEnabledFor(level):
+      return
+    dump = hexdump(data, begin, end, skip).rstrip('\n')
+    self._log(level, '%s', (dump,), kwargs, 'indented')
 
   def warning(self, message, *args, **kwargs):
     """warning(message, *args, **kwargs)
@@ -155,19 +200,27 @@ class Logger(object):
   def isEnabledFor(self, level):
     """isEnabledFor(level) -> bool
     See if the underlying logger is enabled for the specified level.
+    The effective level is cached until the level of the underlying logger
+    or :func:`logging.disable` changes, so this is two attribute reads on
+    the fast path.
     """
-    effectiveLevel = self._logger.getEffectiveLevel()
-
-    if effectiveLevel == 1:
-      effectiveLevel = context.log_level
-    return effectiveLevel <= level
+    logger = self._logger
+    if logger.level != self._cache_level or \
+        logger.manager.disable != self._cache_disable:
+      if logger.level == logging.NOTSET:
+        # inherited from a parent, which we cannot watch cheaply
+        return logger.isEnabledFor(level)
+      self._cache_level = logger.level
+      self._cache_disable = logger.manager.disable
+      self._threshold = max(logger.getEffectiveLevel(),
+                            self._cache_disable + 1)
+    return level >= self._threshold
 
   def setLevel(self, level):
     """setLevel(level)
     Set the logging level for the underlying logger.
     """
-    with context.local(log_level=level):
-      self._logger.setLevel(context.log_level)
+    self._logger.setLevel(self._getlevel(level))
 
   def addHandler(self, handler):
     """addHandler(handler)
@@ -186,8 +239,120 @@ class Logger(object):
     return self._logger.level
   @level.setter
   def level(self, value):
-    with context.local(log_level=value):
-      self._logger.level = context.log_level
+    self._logger.level = self._getlevel(value)
+
+
+class Lazy(object):
+  """
+  Lazy(func, *args, **kwargs)
+  A log argument whose text is ``func(*args, **kwargs)``, computed only if
+  the record is emitted.  Use it for expensive reprs::
+
+    log.debug('leak:\\n%s', Lazy(hexdump, data))
+  """
+  __slots__ = ('func', 'args', 'kwargs', 'value')
+
+  def __init__(self, func, *args, **kwargs):
+    self.func = func
+    self.args = args
+    self.kwargs = kwargs
+    self.value = Lazy
+
+  def get(self):
+    if self.value is Lazy:
+      self.value = self.func(*self.args, **self.kwargs)
+    return self.value
+
+  def __str__(self):
+    return str(self.get())
+
+  def __repr__(self):
+    return repr(self.get())
+
+
+class Progress(object):
+  """
+  A status line for brute-force loops, created by :meth:`Logger.progress`.
+
+  Every :meth:`status` call counts one attempt.  When a handler of the
+  logger writes to a terminal (:class:`TerminalHandler`, :class:`QueuedHandler`)
+  the line is logged as an ``animated`` record at most `rate` times per
+  second, which the handler redraws in place, with attempts/sec and the ETA
+  when `total` is known; otherwise a plain ``[x]`` line is logged every
+  `interval` seconds.  Between redraws :meth:`status` only bumps a counter
+  and reads the clock, and its message is not even formatted.
+
+  Example::
+
+    p = log.progress('Brute forcing canary', total=256)
+    for b in range(256):
+      p.status('trying 0x%02x', b)
+      if try_byte(b):
+        p.success('found 0x%02x', b)
+        break
+    else:
+      p.failure('not found')
+  """
+
+  def __init__(self, logger, name, total=None, rate=10, interval=5):
+    self._logger = logger
+    self.name = name
+    self.total = total
+    self.count = 0
+    self.animated = _animates(logger._logger)
+    self._period = 1.0 / rate if self.animated else interval
+    self._start = time.time()
+    self._next = self._start
+
+  def status(self, message='', *args):
+    """status(message='', *args)
+    Counts one attempt and redraws the line if it is due.
+    """
+    self.count += 1
+    now = time.time()
+    if now < self._next:
+      return
+    self._next = now + self._period
+    if self._logger.isEnabledFor(logging.INFO):
+      self._draw(now, message % args if args else message)
+
+  def _stats(self, now):
+    elapsed = now - self._start
+    speed = self.count / elapsed if elapsed > 0 else 0.0
+    stats = '%d attempts, %.1f/s' % (self.count, speed)
+    if self.total and speed:
+      left = max(self.total - self.count, 0) / speed
+      stats += ', ETA %d:%02d:%02d' % (left // 3600, left // 60 % 60, left % 60)
+    return stats
+
+  def _draw(self, now, text):
+    line = '%s: %s (%s)' % (self.name, text, self._stats(now))
+    if self.animated:
+      self._logger._log(logging.INFO, '[%s] %s',
+                        (_msgtype_prefixes['status'], line), {}, 'animated')
+    else:
+      self._logger._log(logging.INFO, '%s', (line,), {}, 'status')
+
+  def _finish(self, message, args, msgtype):
+    if self.animated:
+      # an empty animated record clears the line
+      self._logger._log(logging.INFO, '', (), {}, 'animated')
+    elapsed = time.time() - self._start
+    text = message % args if args else message
+    self._logger._log(logging.INFO, '%s: %s (%d attempts in %.1fs)',
+                      (self.name, text, self.count, elapsed), {}, msgtype)
+
+  def success(self, message='Done', *args):
+    """success(message='Done', *args)
+    Clears the status line and logs a success message.
+    """
+    self._finish(message, args, 'success')
+
+  def failure(self, message='Failed', *args):
+    """failure(message='Failed', *args)
+    Clears the status line and logs a failure message.
+    """
+    self._finish(message, args, 'failure')
 
 
 class Formatter(logging.Formatter):
@@ -237,24 +402,376 @@ class Formatter(logging.Formatter):
       prefix = '[?] '
 
     msg = prefix + msg
-    msg = self.nlindent.join(msg.splitlines())
+    if '\n' in msg or '\r' in msg:
+      msg = self.nlindent.join(msg.splitlines())
     return msg
 
 
-def getLogger(name='root', loglevel='INFO'):
+def _animates(logger):
+  """True if a handler `logger` records reach redraws animated records"""
+  while logger is not None:
+    for handler in logger.handlers:
+      is_terminal = getattr(handler, 'is_terminal', None)
+      if is_terminal is not None and is_terminal():
+        return True
+    if not logger.propagate:
+      break
+    logger = logger.parent
+  return False
+
+def _isatty(stream):
+  isatty = getattr(stream, 'isatty', None)
+  return bool(isatty and isatty())
+
+class _StatusLine(object):
+  """
+  The status line at the bottom of a terminal: ``animated`` records redraw
+  it in place (an empty one clears it), any other record is written above
+  it, and it is drawn again below.
+  """
+
+  def __init__(self):
+    self.text = None
+
+  def render(self, record, msg):
+    """Returns what to write to the terminal for `record` formatted as `msg`"""
+    if getattr(record, 'mypwn_msgtype', None) == 'animated':
+      self.text = msg or None
+      return '\r\x1b[K' + msg
+    if self.text is None:
+      return msg + '\n'
+    return '\r\x1b[K' + msg + '\n' + self.text
+
+
+class TerminalHandler(logging.StreamHandler):
+  """
+  A :class:`logging.StreamHandler` (to ``sys.stderr`` by default) that keeps
+  the ``animated`` status line of :class:`Progress` at the bottom of a
+  terminal, so other records never get mixed into it.  On a stream that is
+  not a terminal, ``animated`` records are dropped.
+  This is the handler :func:`getLogger` attaches by default.
+  """
+
+  def __init__(self, stream=None):
+    logging.StreamHandler.__init__(self, stream)
+    self._status = _StatusLine()
+
+  def is_terminal(self):
+    return _isatty(self.stream)
+
+  def emit(self, record):
+    if getattr(record, 'mypwn_msgtype', None) == 'animated' and \
+        not self.is_terminal():
+      return
+    try:
+      self.stream.write(self._status.render(record, self.format(record)))
+      self.flush()
+    except (KeyboardInterrupt, SystemExit):
+      raise
+    except Exception:
+      self.handleError(record)
+
+
+def _clock_monotonic():
+  """
+  Returns a function giving seconds from an arbitrary point, never going
+  backwards: time.monotonic(), else clock_gettime(CLOCK_MONOTONIC) from
+  libc (nanoseconds, Python 2 on Linux), else os.times() whose 10 ms ticks
+  cannot order records that close.
+  """
+  monotonic = getattr(time, 'monotonic', None)
+  if monotonic is not None:
+    return monotonic
+  try:
+    import ctypes
+    clock_gettime = ctypes.CDLL('libc.so.6', use_errno=True).clock_gettime
+  except (ImportError, OSError, AttributeError):
+    return lambda: os.times()[4]
+
+  class timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+  clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+  CLOCK_MONOTONIC = 1
+
+  def monotonic():
+    ts = timespec()
+    if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)):
+      errno = ctypes.get_errno()
+      raise OSError(errno, os.strerror(errno))
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+  return monotonic
+
+_monotonic = _clock_monotonic()
+
+# attributes every LogRecord has, anything else came from ``extra``
+_record_attributes = frozenset(
+  logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | \
+  frozenset(['message', 'asctime', 'stack_info'])
+
+# JsonFormatter fields an ``extra`` field must not overwrite
+_json_fields = frozenset(['time', 'mono', 'level', 'msgtype', 'msg',
+                          'process', 'thread', 'logger', 'exc'])
+
+def _jsonable(value):
+  """
+  Returns `value` with every byte string made JSON-safe: decoded if it is
+  UTF-8, else escaped like repr() does (``'\\xde\\xad'``), so binary leaks
+  are logged as they are.
+  """
+  if isinstance(value, bytes):
+    try:
+      return value.decode('utf-8')
+    except UnicodeDecodeError:
+      return codecs.escape_encode(value)[0].decode('ascii')
+  if isinstance(value, (list, tuple)):
+    return [_jsonable(v) for v in value]
+  if isinstance(value, dict):
+    return dict((_jsonable(k), _jsonable(v)) for (k, v) in value.items())
+  return value
+
+class JsonFormatter(logging.Formatter):
+  """
+  Formats a record as one JSON object per line, for aggregating many runs.
+  Fields: ``time`` (wall clock), ``mono`` (monotonic clock), ``level``,
+  ``msgtype`` (the ``mypwn_msgtype``), ``msg``, ``process``, ``thread``,
+  ``logger``, ``exc`` if there is exception info, plus every ``extra``
+  field; one named like a field above is written as ``extra_<name>``
+  instead (``extra={'time': t}`` gives ``extra_time``).  Values that are not JSON types are written as their repr, byte
+  strings that are not UTF-8 with ``\\x`` escapes.
+  """
+
+  def format(self, record):
+    entry = {
+      'time'    : record.created,
+      'mono'    : getattr(record, 'mypwn_mono', None) or _monotonic(),
+      'level'   : record.levelname,
+      'msgtype' : getattr(record, 'mypwn_msgtype', None),
+      'msg'     : record.getMessage(),
+      'process' : record.process,
+      'thread'  : record.thread,
+      'logger'  : record.name,
+    }
+    if record.exc_info:
+      entry['exc'] = self.formatException(record.exc_info)
+    for key, value in record.__dict__.items():
+      if key not in _record_attributes and not key.startswith('mypwn_'):
+        entry['extra_' + key if key in _json_fields else key] = value
+    return json.dumps(_jsonable(entry), default=repr, sort_keys=True)
+
+
+class JsonLinesHandler(logging.Handler):
+  """
+  Writes records formatted by :class:`JsonFormatter` to `filename` (or
+  `stream`).  Lines are buffered and written `capacity` records at a time,
+  or at once for ERROR and above, and on :meth:`flush`.
+  With `max_bytes`, a file that grows past it is rotated to
+  ``filename.1.gz``, older ones shifting up to ``filename.<backup_count>.gz``.
+
+  Select it with :func:`getLogger`::
+
+    log = getLogger('mypwn', handler=JsonLinesHandler('attempts.jsonl'))
+    log.info('attempt done', extra={'target': host, 'latency': 0.12})
+  """
+
+  def __init__(self, filename=None, stream=None, capacity=256,
+               max_bytes=0, backup_count=5):
+    logging.Handler.__init__(self)
+    if (filename is None) == (stream is None):
+      raise ValueError("give exactly one of filename or stream")
+    self.filename = filename
+    self.stream = stream if stream is not None else open(filename, 'a')
+    self.capacity = capacity
+    self.max_bytes = max_bytes
+    self.backup_count = backup_count
+    self.buffer = []
+    self.setFormatter(JsonFormatter())
+
+  def emit(self, record):
+    if getattr(record, 'mypwn_msgtype', None) == 'animated':
+      return # status line redraws are not events
+    # take the clock now, the line may be formatted much later
+    record.mypwn_mono = _monotonic()
+    try:
+      self.buffer.append(self.format(record))
+    except Exception:
+      self.handleError(record)
+      return
+    if len(self.buffer) >= self.capacity or record.levelno >= logging.ERROR:
+      self.flush()
+
+  def flush(self):
+    self.acquire()
+    try:
+      if self.buffer and self.stream is not None:
+        self.stream.write('\n'.join(self.buffer) + '\n')
+        self.stream.flush()
+        self.buffer = []
+        if self.max_bytes and self.filename and \
+            self.stream.tell() >= self.max_bytes:
+          self._rotate()
+    finally:
+      self.release()
+
+  def _rotate(self):
+    self.stream.close()
+    backups = ['%s.%d.gz' % (self.filename, i)
+               for i in range(1, self.backup_count + 1)]
+    for i in range(len(backups) - 1, 0, -1):
+      if os.path.exists(backups[i - 1]):
+        os.rename(backups[i - 1], backups[i])
+    if backups:
+      with open(self.filename, 'rb') as src:
+        with gzip.open(backups[0], 'wb') as dst:
+          shutil.copyfileobj(src, dst)
+    self.stream = open(self.filename, 'w')
+
+  def close(self):
+    self.flush()
+    if self.filename and self.stream is not None:
+      self.stream.close()
+      self.stream = None
+    logging.Handler.close(self)
+
+
+class QueuedHandler(logging.Handler):
+  """
+  A handler that never blocks the logging thread on I/O.
+  Records go into a bounded queue and a background thread formats them and
+  writes them to `stream` (default ``sys.stderr``) or `filename` in batches
+  of up to `batch` records, one write and flush per batch.
+  When the queue is full the record is dropped and counted in
+  :attr:`dropped`; the writer reports the count in the output.
+  Records are formatted by the writer thread, so arguments that are
+  mutated after the log call may show their new value.
+  Pending records are written by :meth:`flush` and :meth:`close`, which
+  :mod:`logging` calls at exit.
+  On a terminal the ``animated`` status line is kept at the bottom like
+  :class:`TerminalHandler` does; elsewhere those records are dropped.
+
+  Use it with :func:`getLogger`::
+
+    log = getLogger('mypwn', handler=QueuedHandler())
+  """
+
+  def __init__(self, stream=None, filename=None, maxsize=10000, batch=512):
+    logging.Handler.__init__(self)
+    self._own_stream = filename is not None
+    if self._own_stream:
+      stream = open(filename, 'a')
+    self.stream = stream if stream is not None else sys.stderr
+    self.queue = queue.Queue(maxsize)
+    self.batch = batch
+    self.dropped = 0
+    self._reported = 0
+    self._status = _StatusLine()
+    self._closed = False
+    self._thread = threading.Thread(target=self._writer, name='mypwn-log')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def is_terminal(self):
+    return _isatty(self.stream)
+
+  def emit(self, record):
+    try:
+      self.queue.put_nowait(record)
+    except queue.Full:
+      self.acquire()
+      try:
+        self.dropped += 1
+      finally:
+        self.release()
+
+  def _writer(self):
+    while True:
+      records = [self.queue.get()]
+      try:
+        while len(records) < self.batch:
+          records.append(self.queue.get_nowait())
+      except queue.Empty:
+        pass
+
+      terminal = self.is_terminal()
+      out = []
+      for record in records:
+        if record is None: # sentinel from close()
+          continue
+        if not terminal and \
+            getattr(record, 'mypwn_msgtype', None) == 'animated':
+          continue
+        try:
+          out.append(self._status.render(record, self.format(record)))
+        except Exception:
+          self.handleError(record)
+      dropped = self.dropped
+      if dropped != self._reported:
+        out.append(self._status.render(None, '[%s] %d log records dropped' % (
+          _msgtype_prefixes['warning'], dropped - self._reported)))
+        self._reported = dropped
+      if out:
+        try:
+          self.stream.write(''.join(out))
+          self.stream.flush()
+        except Exception:
+          # reported once per batch, like StreamHandler does per record
+          real = [r for r in records if r is not None]
+          self.handleError(real[0] if real else logging.makeLogRecord({}))
+      for _ in records:
+        self.queue.task_done()
+      if None in records:
+        return
+
+  def flush(self):
+    """Blocks until every queued record is written."""
+    if self._thread.is_alive():
+      self.queue.join()
+
+  def close(self):
+    """Writes pending records and stops the writer thread."""
+    if not self._closed:
+      self._closed = True
+      if self._thread.is_alive():
+        self.queue.put(None)
+        self._thread.join()
+      if self._own_stream:
+        self.stream.close()
+    logging.Handler.close(self)
+
+
+def getLogger(name='root', loglevel='INFO', handler=None):
+  """getLogger(name='root', loglevel='INFO', handler=None) -> Logger
+  Returns the :class:`Logger` `name`.  On first use a
+  :class:`TerminalHandler` is attached, or `handler` if given.
+  Passing `handler` for an existing logger replaces its handlers, which
+  are flushed and closed.
+  A handler without a formatter gets a :class:`Formatter`.
+  """
   logger = logging.getLogger(name)
 
+  if handler is not None:
+    if handler.formatter is None:
+      handler.setFormatter(Formatter())
+    for old in list(logger.handlers):
+      logger.removeHandler(old)
+      if old is not handler:
+        old.flush()
+        old.close()
+    if not logger.level:
+      logger.setLevel(getattr(logging, loglevel.upper(), logging.INFO))
+    logger.addHandler(handler)
+    return Logger(logger)
+
   # if logger 'name' already exists, return it to avoid logging duplicate
   # messages by attaching multiple handlers of the same type
   if logger.handlers:
-    return logger
+    return Logger(logger)
   # if logger 'name' does not already exist, create it and attach handlers
   else:
     # set logLevel to loglevel or to INFO if requested level is incorrect
     loglevel = getattr(logging, loglevel.upper(), logging.INFO)
     logger.setLevel(loglevel)
 
-    handler = logging.StreamHandler()
+    handler = TerminalHandler()
     formatter = Formatter()
     handler.setFormatter(formatter)
     logger.addHandler(handler)
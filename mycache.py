@@ -0,0 +1,130 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+import os
+import errno
+import tempfile
+import time
+try:
+  import cPickle as pickle
+except ImportError:
+  import pickle
+try:
+  import fcntl
+except ImportError:
+  fcntl = None # no locking: concurrent updates may lose entries
+
+__all__ = [
+    'cache_dir', 'cache_path', 'load', 'store', 'update',
+    'file_identity', 'load_files', 'update_files',
+  ]
+
+# entries kept by update_files() by default
+FILES_LIMIT = 1 << 16
+
+def cache_dir():
+  '''
+  Returns the directory of on-disk caches, creating it if needed.
+  $MYPWN_CACHE_DIR overrides the default ~/.cache/mypwn
+  '''
+  path = os.environ.get('MYPWN_CACHE_DIR')
+  if not path:
+    path = os.path.join(os.path.expanduser('~'), '.cache', 'mypwn')
+  try:
+    os.makedirs(path)
+  except OSError as e:
+    if e.errno != errno.EEXIST:
+      raise
+  return path
+
+def cache_path(name):
+  '''Returns full path of the cache file `name' '''
+  return os.path.join(cache_dir(), name)
+
+def load(name, default=None):
+  '''
+  Returns object pickled in the cache file `name', or `default' if the file
+  is missing or unreadable (a stale cache is never an error).
+  '''
+  try:
+    with open(cache_path(name), 'rb') as fd:
+      return pickle.load(fd)
+  except Exception:
+    return default
+
+def store(name, obj):
+  '''
+  Pickles `obj' into the cache file `name'. The file is written to a
+  temporary name first and renamed, so readers never see a partial cache.
+  '''
+  path = cache_path(name)
+  fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp, path)
+  except Exception:
+    os.unlink(tmp)
+    raise
+
+def update(name, merge, default=None):
+  '''
+  Replaces the content `obj' of the cache file `name' (or `default') by
+  merge(obj) and returns it. The read, merge and write hold an exclusive
+  lock on `name'.lock, so concurrent updates build on each other instead
+  of the last writer dropping the others' entries.
+  '''
+  with open(cache_path(name + '.lock'), 'a') as lock:
+    if fcntl is not None:
+      fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+    obj = merge(load(name, default))
+    store(name, obj)
+    return obj
+
+def file_identity(st):
+  '''Returns the key telling a file apart from its older versions, from os.stat()'''
+  return (st.st_dev, st.st_ino, st.st_size, st.st_mtime)
+
+def load_files(name):
+  '''
+  Returns {path: (identity, value, stored)} of the cache file `name'
+  written by update_files(). An entry is valid only while identity equals
+  file_identity() of path.
+  '''
+  return load(name, {})
+
+def update_files(name, entries, merge=None, limit=None):
+  '''
+  Adds {path: (identity, value)} to the cache file `name' (see update())
+  and returns the new content. merge(old, new) combines the values of a
+  path whose identity did not change, the new value replaces it otherwise.
+
+  Past `limit' entries (FILES_LIMIT by default), the ones whose file is
+  gone or changed are dropped, then the oldest stored until 3/4 of
+  `limit' are left, never the entries being added.
+  '''
+  if limit is None:
+    limit = FILES_LIMIT
+  now = time.time()
+  def add(cached):
+    for (path, (identity, value)) in entries.items():
+      old = cached.get(path)
+      if merge is not None and old is not None and old[0] == identity:
+        value = merge(old[1], value)
+      cached[path] = (identity, value, now)
+    if len(cached) > limit:
+      _prune(cached, max(limit * 3 // 4, len(entries)))
+    return cached
+  return update(name, add, {})
+
+def _prune(cached, size):
+  for (path, entry) in cached.items():
+    try:
+      if file_identity(os.stat(path)) == entry[0]:
+        continue
+    except OSError:
+      pass
+    del cached[path]
+  if len(cached) > size:
+    oldest = sorted(cached, key=lambda path: cached[path][2])
+    for path in oldest[:len(cached) - size]:
+      del cached[path]
@@ -5,9 +5,25 @@
 
 __all__ = ['AESCipher', 'RSACipher', 'Checksum']
 
+import bisect
+import hashlib
+import math
+import mmap
+import os
+import time
 from Crypto import Random
 from Crypto.Cipher import AES
 from base64 import b64encode, b64decode
+from functools import reduce
+from operator import mul
+from mypwn import mycache
+from mypwn import myprime
+
+try:
+    _buffer = buffer # zero-copy slice of an mmap on Python 2
+except NameError:
+    def _buffer(obj, offset, size):
+        return memoryview(obj)[offset:offset + size]
 
 try:
     import gmpy2
@@ -17,12 +33,18 @@ try:
     _gcd = gmpy2.gcd
     _iRoot = gmpy2.iroot
     _iSqrt = gmpy2.isqrt
+    _isPrime = gmpy2.is_prime
     def _perfectSqrt(x):
         s, r = gmpy2.isqrt_rem(x)
         return s if r == 0 else -1
     # f_mod(x, y int) -- The remainder will have the same sign as y
     _mod = gmpy2.f_mod
-    _modInverse = gmpy2.invert
+    def _modInverse(a, m):
+        '''Returns x such that a*x = 1 (mod m), 0 if there is none'''
+        try:
+            return gmpy2.invert(a, m)
+        except ZeroDivisionError:
+            return gmpy2.mpz(0)
     _mulProduct = gmpy2.mul
     _mpz = gmpy2.mpz
 except ImportError:
@@ -75,17 +97,22 @@ Returns (g, s, t) and such that a*s + b*t = g and g = gcd(a,b)
         return greatest_common_divisor(a, b)
 
     def _iRoot(x, n):
-        lo, hi = -1, (x + 1)
-        while (lo + 1) < hi:
-            y = (lo + hi) // 2
-            p = y**n
-            if p < x:
-                lo = y
-            else:
-                hi = y
-        exact = ((hi**n) == x)
-        y = hi if exact else lo
-        return (y, exact)
+        '''_iRoot(x, n) -> (y, exact)
+Returns the integer n-th root of x (int) and x >= 0, with Newton iteration.
+The seed 2**ceil(bits/n) is above the root, so the iteration decreases
+monotonically to floor(x**(1/n)).
+'''
+        if x < 0:
+            raise ValueError('Negative numbers: x = %d'%(x))
+        elif x == 0 or n == 1:
+            return (x, True)
+        y = 1 << -(-_bitLength(x) // n)
+        while True:
+            z = ((n - 1)*y + x // y**(n - 1)) // n
+            if z >= y:
+                break
+            y = z
+        return (y, y**n == x)
 
     def _iSqrt(n):
         '''Returns the integer square root of n (int) and n >= 0.'''
@@ -103,6 +130,8 @@ Returns (g, s, t) and such that a*s + b*t = g and g = gcd(a,b)
             x = y
         return x
 
+    _isPrime = myprime.is_probable_prime
+
     def _perfectSqrt(x):
         '''
         Returns s if s*s = x else -1
@@ -127,6 +156,301 @@ Returns (g, s, t) and such that a*s + b*t = g and g = gcd(a,b)
     def _mod(a,b): return a%b
 
 
+# Small moduli for the quadratic-residue sieve of fermat_factor(): a**2 - n
+# must be a square modulo each of them. Together they leave only a few
+# candidates in 100000 for the full square root test.
+_FERMAT_MODULI = (64, 63, 65, 11, 17, 19, 23, 29, 31, 37)
+
+def _squares_mod(m):
+    table = bytearray(m)
+    for x in range(m):
+        table[x * x % m] = 1
+    return table
+
+_SQUARES_MOD = [(m, _squares_mod(m)) for m in _FERMAT_MODULI]
+# one reduction modulo the product feeds every table
+_SQUARES_MODULUS = reduce(mul, _FERMAT_MODULI)
+
+# wiener_attack_batch() runs smaller batches in the current process: a
+# key takes well under a millisecond, less than shipping it to a worker
+_WIENER_POOL_MIN_KEYS = 2000
+
+_PRIME_TABLE = myprime.primes(0)
+_PRIME_LIMIT = 0
+
+def _primeTable(limit):
+    '''Returns array of primes below limit, sieved once and kept around'''
+    global _PRIME_TABLE, _PRIME_LIMIT
+    if limit > _PRIME_LIMIT:
+        _PRIME_TABLE, _PRIME_LIMIT = myprime.primes(limit), limit
+    return _PRIME_TABLE[:bisect.bisect_left(_PRIME_TABLE, limit)]
+
+
+# Polynomials are lists of integer coefficients, lowest degree first.
+
+def _polyMul(a, b):
+    result = [0] * (len(a) + len(b) - 1)
+    for (i, x) in enumerate(a):
+        if x:
+            for (j, y) in enumerate(b):
+                result[i + j] += x * y
+    return result
+
+def _polyEval(poly, x):
+    result = 0
+    for c in reversed(poly):
+        result = result * x + c
+    return result
+
+def _sign(x):
+    return (x > 0) - (x < 0)
+
+def _rootFloors(poly, lo, hi):
+    '''
+    Returns sorted list of s in [lo, hi] such that poly has a real root in
+    [s, s + 1), with exact integer arithmetic only. The floors of the roots
+    of the derivative split [lo, hi] into pieces where poly is monotone, and
+    each piece is searched by bisection.
+    '''
+    while poly and not poly[-1]:
+        poly = poly[:-1]
+    if len(poly) <= 1:
+        return []
+    cuts = _rootFloors([i * c for (i, c) in enumerate(poly)][1:], lo, hi)
+    pieces, start = [], lo
+    for cut in cuts:
+        pieces.append((start, cut))
+        start = cut + 1
+    pieces.append((start, hi))
+
+    floors = set()
+    previous = None
+    for (a, b) in pieces:
+        if a > b:
+            continue
+        fa, fb = _polyEval(poly, a), _polyEval(poly, b)
+        if previous is not None and _sign(previous) * _sign(fa) < 0:
+            floors.add(a - 1)
+        if fa == 0:
+            floors.add(a)
+        elif _sign(fa) * _sign(fb) < 0:
+            sa = _sign(fa)
+            while b - a > 1:
+                mid = (a + b) // 2
+                if _sign(_polyEval(poly, mid)) == sa:
+                    a = mid
+                else:
+                    b = mid
+            floors.add(b if _polyEval(poly, b) == 0 else a)
+        if fb == 0:
+            floors.add(b)
+        previous = fb
+    return sorted(floors)
+
+def _integerRoots(poly, lo, hi):
+    '''Returns sorted list of the integer roots of poly in [lo, hi]'''
+    return [x for x in _rootFloors(poly, lo, hi) if _polyEval(poly, x) == 0]
+
+
+def _lllIntegral(b, delta):
+    '''
+    LLL of the rows of b (list of lists of mpz, modified in place) with the
+    integral algorithm of de Weger (Cohen, A Course in Computational
+    Algebraic Number Theory, Algorithm 2.6.7). The Gram-Schmidt data is
+    kept as the Gram determinants d_i and lambda_ij = d_j * mu_ij, so every
+    division is exact. Exact but slow on large entries: d_i has i times the
+    size of the basis entries.
+    '''
+    p, q = delta.numerator, delta.denominator
+    n = len(b)
+    d = [_mpz(1)] * (n + 1)
+    lam = [[_mpz(0)] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1):
+            u = sum(_mulProduct(x, y) for (x, y) in zip(b[i], b[j]))
+            for k in range(j):
+                u = (d[k + 1] * u - lam[i][k] * lam[j][k]) // d[k]
+            if j < i:
+                lam[i][j] = u
+            else:
+                d[i + 1] = u
+        if d[i + 1] == 0:
+            raise ValueError('Basis vectors are linearly dependent')
+
+    def size_reduce(k, l):
+        if 2 * abs(lam[k][l]) > d[l + 1]:
+            r = (2 * lam[k][l] + d[l + 1]) // (2 * d[l + 1])
+            b[k] = [x - r * y for (x, y) in zip(b[k], b[l])]
+            lam[k][l] -= r * d[l + 1]
+            for i in range(l):
+                lam[k][i] -= r * lam[l][i]
+
+    k = 1
+    while k < n:
+        size_reduce(k, k - 1)
+        mu = lam[k][k - 1]
+        if q * d[k + 1] * d[k - 1] < p * d[k] * d[k] - q * mu * mu:
+            # Lovasz condition fails: swap b_k and b_(k-1)
+            b[k], b[k - 1] = b[k - 1], b[k]
+            for j in range(k - 1):
+                lam[k][j], lam[k - 1][j] = lam[k - 1][j], lam[k][j]
+            B = (d[k - 1] * d[k + 1] + mu * mu) // d[k]
+            for i in range(k + 1, n):
+                t = lam[i][k]
+                lam[i][k] = (d[k + 1] * lam[i][k - 1] - mu * t) // d[k]
+                lam[i][k - 1] = (B * t + mu * lam[i][k]) // d[k + 1]
+            d[k] = B
+            k = max(1, k - 1)
+        else:
+            for l in range(k - 2, -1, -1):
+                size_reduce(k, l)
+            k += 1
+    return b
+
+def _scaledFloat(x, shift):
+    '''Returns float(x * 2**-shift) for an int x of any size'''
+    bits = abs(x).bit_length()
+    if bits > 60:
+        return math.ldexp(float(x >> (bits - 60)), bits - 60 - shift)
+    return math.ldexp(float(x), -shift)
+
+def _lllFloat(b, delta, eta=0.51):
+    '''
+    Floating-point LLL of the rows of b in the style of Schnorr-Euchner and
+    Nguyen-Stehle's L2: the basis and its Gram matrix G are exact integers,
+    the Gram-Schmidt coefficients are doubles. Entries far outside the
+    range of a double are handled by scaling every quantity of rows i, j by
+    2**-(s_i + s_j), with 2**s_i ~ |b_i|; the Gram-Schmidt recurrence is
+    the same on the scaled values.
+
+    It gives up and returns the basis as it is when a size reduction stops
+    making progress (not enough precision), the swaps exceed a bound or a
+    double overflows; the result is not guaranteed to be reduced, see
+    _lllIntegral().
+    '''
+    try:
+        return _lllFloatPass(b, delta, eta)
+    except (OverflowError, ValueError, ZeroDivisionError):
+        # rows of b are replaced whole, so b is still a basis
+        return b
+
+def _lllFloatPass(b, delta, eta):
+    n = len(b)
+    G = [[None] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1):
+            G[i][j] = G[j][i] = sum(_mulProduct(x, y) for (x, y) in zip(b[i], b[j]))
+    s = [G[i][i].bit_length() // 2 for i in range(n)]
+    r = [[0.0] * n for _ in range(n)]    # r_ij = <b_i, b*_j>, scaled
+    mu = [[0.0] * n for _ in range(n)]   # mu_ij * 2**-(s_i - s_j)
+
+    def gso(k):
+        rk, mk, Gk, sk = r[k], mu[k], G[k], s[k]
+        for j in range(k + 1):
+            t = _scaledFloat(Gk[j], sk + s[j])
+            if j:
+                t -= sum(map(mul, mu[j][:j], rk[:j]))
+            rk[j] = t
+            if j < k:
+                mk[j] = t / r[j][j]
+        return rk[k] > 0
+
+    if not gso(0):
+        return b
+    max_swaps = n * n * (max(s) + 64)
+    k, swaps = 1, 0
+    while k < n:
+        stalled = 0
+        while True:
+            gso(k)
+            mk = mu[k]
+            steps = []
+            for j in range(k - 1, -1, -1):
+                # x = round(mu_kj), keeping 53 bits when it is huge
+                e = s[k] - s[j]
+                m, exponent = math.frexp(mk[j])
+                if exponent + e <= 53:
+                    y = math.ldexp(m, exponent + e)
+                    if abs(y) <= eta:
+                        continue
+                    x = int(round(y))
+                else:
+                    x = int(math.ldexp(m, 53)) << (exponent + e - 53)
+                if x:
+                    steps.append((j, x))
+                    xf = _scaledFloat(x, e)
+                    mj = mu[j]
+                    for i in range(j):
+                        mk[i] -= xf * mj[i]
+                    mk[j] -= xf
+            if not steps:
+                break
+            bk, Gk = b[k], G[k]
+            for (j, x) in steps:
+                bk = [y - x * z for (y, z) in zip(bk, b[j])]
+                Gj = G[j]
+                for i in range(n):
+                    if i != k:
+                        Gk[i] -= x * Gj[i]
+            b[k] = bk
+            for i in range(n):
+                G[i][k] = Gk[i]
+            Gk[k] = sum(_mulProduct(y, y) for y in bk)
+            old, s[k] = s[k], Gk[k].bit_length() // 2
+            if s[k] >= old:
+                stalled += 1
+                if stalled > 4:
+                    return b
+
+        # Lovasz condition (delta - mu**2) * r_(k-1) > r_k, scaled by 2**-2s_k
+        e = 2 * (s[k - 1] - s[k])
+        if abs(e) > 1000:
+            swap = e > 0
+        else:
+            m = mu[k][k - 1]
+            swap = (math.ldexp(delta * r[k - 1][k - 1], e)
+                    - m * m * r[k - 1][k - 1] > r[k][k])
+        if swap:
+            swaps += 1
+            if swaps > max_swaps:
+                return b
+            b[k - 1], b[k] = b[k], b[k - 1]
+            G[k - 1], G[k] = G[k], G[k - 1]
+            for row in G:
+                row[k - 1], row[k] = row[k], row[k - 1]
+            s[k - 1], s[k] = s[k], s[k - 1]
+            k = max(k - 1, 1)
+            if k == 1 and not gso(0):
+                return b
+        else:
+            k += 1
+    return b
+
+def _lllTruncated(b, delta):
+    '''
+    Reduces the rows of b on their top bits only, the way Lehmer speeds up
+    Euclid: the entries shifted down to W ~ 4*dim bits, with an identity
+    block appended to keep full rank, are LLL-reduced and the unimodular
+    transform read from the identity block is applied to the full basis.
+    Rounds stop when the largest entry no longer shrinks.
+    '''
+    n = len(b)
+    width = 4 * n + 64
+    size = max(abs(x).bit_length() for row in b for x in row)
+    while size > 2 * width:
+        shift = size - width
+        top = [[x >> shift for x in row] + [int(i == j) for j in range(n)]
+               for (i, row) in enumerate(b)]
+        U = [row[-n:] for row in _lllIntegral(top, delta)]
+        reduced = [[sum(_mulProduct(u, row[c]) for (u, row) in zip(Ui, b) if u)
+                    for c in range(len(b[0]))] for Ui in U]
+        new_size = max(abs(x).bit_length() for row in reduced for x in row)
+        if new_size >= size:
+            break
+        b, size = reduced, new_size
+    return b
+
+
 class RSACipher(object):
 
     """Mostly stuffs for RSA"""
@@ -151,13 +475,21 @@ class RSACipher(object):
             13  =   4 × 3   +   1
             3   =   3 × 1   +   0
         '''
+        return tuple(RSACipher.continued_fraction_iter(n, m))
+
+    @staticmethod
+    def continued_fraction_iter(n, m=1):
+        '''
+        Returns iterator to the partial quotients (a0, a1, .., a_n) of n/m.
+        Same as continued_fraction() but each quotient is computed on demand,
+        so a caller can stop early without paying for the whole expansion.
+        '''
         q, r = _divMod(n, m)
-        partial_quotients = [q]
+        yield q
         while r != 0:
             n, m = m, r
             q, r = _divMod(n, m)
-            partial_quotients.append(q)
-        return tuple(partial_quotients)
+            yield q
 
     @staticmethod
     def continued_fraction_convergents(pquotients):
@@ -181,18 +513,19 @@ class RSACipher(object):
         Reference:
         + https://oeis.org/wiki/Continued_fractions
         '''
-        if len(pquotients) == 0:
+        p_2, q_2 = 0, 1
+        p_1, q_1 = 1, 0
+        # pquotients may be any iterable, e.g. continued_fraction_iter()
+        for a_i in pquotients:
+            p = a_i*p_1 + p_2 # p[i] = a[i]*p[i-1] + p[i-2]
+            q = a_i*q_1 + q_2 # q[i] = a[i]*q[i-1] + q[i-2]
+            p_2, p_1 = p_1, p
+            q_2, q_1 = q_1, q
+            c = (p, q) # c_i = p_i / q_i, i>=0
+            yield c
+        if q_1 == 0:
+            # empty pquotients
             yield (0, 1)
-        else:
-            p_2, q_2 = 0, 1
-            p_1, q_1 = 1, 0
-            for a_i in pquotients:
-                p = a_i*p_1 + p_2 # p[i] = a[i]*p[i-1] + p[i-2]
-                q = a_i*q_1 + q_2 # q[i] = a[i]*q[i-1] + q[i-2]
-                p_2, p_1 = p_1, p
-                q_2, q_1 = q_1, q
-                c = (p, q) # c_i = p_i / q_i, i>=0
-                yield c
 
     @staticmethod
     def gcd(a,b):
@@ -213,21 +546,51 @@ class RSACipher(object):
         return x
 
     @staticmethod
-    def chinese_remainder(n, a):
+    def chinese_remainder(n, a, coefficients=None):
         '''
         Returns x (int) such that
             x = a_i (mod n_i) for i := 1 -> k
 
-        Reference: https://rosettacode.org/wiki/Chinese_remainder_theorem
-	    '''
+        `coefficients' is the result of crt_coefficients(n); pass it to solve
+        many systems with the same moduli without redoing the inverses.
 
-        prod = reduce(_mulProduct, n) # reduce is faster than equivalent for loop
+        Reference: https://rosettacode.org/wiki/Chinese_remainder_theorem
+        '''
+        if coefficients is None:
+            coefficients = RSACipher.crt_coefficients(n)
+        prod, basis = coefficients
         total = _mpz(0)
-        for (n_i, a_i) in zip(n, a):
-            p = prod // n_i
-            total += a_i * RSACipher.mod_inverse(p, n_i) * p
+        for (b_i, a_i) in zip(basis, a):
+            total += _mulProduct(b_i, a_i)
         return _mod(total, prod)
 
+    @staticmethod
+    def crt_coefficients(n):
+        '''
+        Returns (prod, basis) for the moduli n, where prod = n_1*n_2*..*n_k
+        and basis[i] = 1 (mod n_i), 0 (mod n_j) for j != i.
+        The cofactors prod // n_i are pushed down the product_tree() instead
+        of dividing prod by each n_i, and each inverse is taken on the
+        cofactor already reduced mod n_i.
+        '''
+        tree = RSACipher.product_tree([_mpz(n_i) for n_i in n])
+        cofactors = [_mpz(1)]
+        for level in reversed(tree[:-1]):
+            lower = []
+            for (i, v) in enumerate(level):
+                parent = cofactors[i // 2]
+                if (i ^ 1) < len(level):
+                    parent = _mulProduct(parent, level[i ^ 1])
+                lower.append(parent)
+            cofactors = lower
+        basis = []
+        for (n_i, p) in zip(tree[0], cofactors):
+            inverse = _modInverse(_mod(p, n_i), n_i)
+            if not inverse and n_i != 1:
+                raise ValueError('Moduli are not pairwise coprime')
+            basis.append(_mulProduct(p, inverse))
+        return (tree[-1][0], basis)
+
     @staticmethod
     def iroot(x, n):
         '''
@@ -238,18 +601,19 @@ class RSACipher(object):
         return _iRoot(x, n)
 
     @staticmethod
-    def hastad_broadcast_attack(N, C):
+    def hastad_broadcast_attack(N, C, e=None):
         '''
-        Retunrs plain text m in form long type such that e=len(N)=len(C) and
-        e is small and we knew `e' pairs module n, ciphertext c
+        Retunrs plain text m in form long type such that e is small and we
+        knew at least `e' pairs module n, ciphertext c (e defaults to len(N)).
+        Extra pairs are used too, they only make the CRT modulus larger.
 
         In short, returns m if
-            c_i = (m**k) (mod n_i) for i: 1->k
+            c_i = (m**e) (mod n_i) for i: 1->k, k >= e
         With chinese remainder theorem:
-            c'  = (m**k) (mod n_1*n_2*..*n_k) for i: 1->k
-	    '''
-        e = len(N)
-        assert(e == len(C))
+            c'  = (m**e) (mod n_1*n_2*..*n_k)
+        '''
+        e = len(N) if e is None else e
+        assert(len(N) == len(C) and len(N) >= e)
         remainder = RSACipher.chinese_remainder(N, C)
         for (n, c) in zip(N, C):
             assert(_mod(remainder, n) == c)
@@ -257,6 +621,129 @@ class RSACipher(object):
         assert(exact)
         return m
 
+    @staticmethod
+    def hastad_broadcast_attack_batch(N, C_sets, e=None):
+        '''
+        Yields m (or None when the CRT result is not an exact e-th power) for
+        each list of ciphertexts in `C_sets', all encrypted under the moduli N.
+        The CRT coefficients are computed once for the whole batch.
+        '''
+        e = len(N) if e is None else e
+        assert(len(N) >= e)
+        coefficients = RSACipher.crt_coefficients(N)
+        for C in C_sets:
+            assert(len(C) == len(N))
+            remainder = RSACipher.chinese_remainder(N, C, coefficients)
+            m, exact = RSACipher.iroot(remainder, e)
+            yield (m if exact else None)
+
+    @staticmethod
+    def lll_reduce(basis, delta=0.99):
+        '''
+        Returns LLL-reduced basis of the lattice spanned by the rows of
+        `basis' (list of lists of int), as a new list of lists.
+
+        The work is done in three passes, each one starting from the output
+        of the previous one:
+        1. _lllTruncated() reduces the top bits of the entries first, like
+           Lehmer's gcd, which takes care of knapsack-like lattices whose
+           reduced vectors are much shorter than the input;
+        2. _lllFloat() does most of the remaining swaps with floating-point
+           Gram-Schmidt on top of an exact Gram matrix;
+        3. _lllIntegral() finishes with exact integer arithmetic only, so the
+           result is always delta-reduced, whatever the floating-point pass
+           managed to do.
+        '''
+        from fractions import Fraction
+        delta = Fraction(delta).limit_denominator(1000)
+        b = [[_mpz(x) for x in row] for row in basis]
+        if len(b) < 2:
+            return b
+        b = _lllTruncated(b, delta)
+        b = _lllFloat(b, float(delta))
+        return _lllIntegral(b, delta)
+
+    @staticmethod
+    def stereotyped_message_attack(n, e, c, known_prefix, unknown_bits,
+                                   max_dimension=60):
+        '''
+        Returns m such that c = m**e (mod n) when all of m but its
+        `unknown_bits' low bits is known, or None if no such m is found.
+        `known_prefix' is the known high part, as int or as a string
+        (big-endian, e.g. 'The secret is: ').
+
+        Coppersmith's method in Howgrave-Graham's form: the small root x of
+        f(x) = (known_prefix * 2**unknown_bits + x)**e - c (mod n)
+        is a root over the integers of a short vector of the lattice of
+        x**j * n**(h-i) * f(x)**i, found with lll_reduce(). It works while
+        unknown_bits is a bit below log2(n)/e; the lattice dimension is
+        chosen from the LLL bound, up to `max_dimension'.
+
+        Example:
+        >>> m = RSACipher.stereotyped_message_attack(n, 3, c, 'flag{', 200)
+        '''
+        if isinstance(known_prefix, basestring):
+            known_prefix = int(known_prefix.encode('hex') or '0', 16)
+        h, t = RSACipher._coppersmith_parameters(_bitLength(n), e,
+                                                  unknown_bits, max_dimension)
+        X = 1 << unknown_bits
+        a = known_prefix << unknown_bits
+        N = n ** h
+
+        # f(x) = (a + x)**e - c, monic, coefficients mod n
+        f = [_mod(RSACipher._binomial(e, k) * pow(a, e - k, n), n)
+             for k in range(e + 1)]
+        f[0] = _mod(f[0] - c, n)
+
+        polys, f_i = [], [1]
+        for i in range(h):
+            for j in range(e):
+                polys.append([0] * j + [x * n ** (h - i) for x in f_i])
+            f_i = [_mod(x, N) for x in _polyMul(f_i, f)]
+        for j in range(t):
+            polys.append([0] * j + f_i)
+
+        dim = len(polys)
+        basis = [[poly[k] * X ** k if k < len(poly) else 0 for k in range(dim)]
+                 for poly in polys]
+        for row in RSACipher.lll_reduce(basis):
+            poly = [x // X ** k for (k, x) in enumerate(row)]
+            for x in _integerRoots(poly, 0, X - 1):
+                if pow(a + x, e, n) == c:
+                    return a + x
+        return None
+
+    @staticmethod
+    def _coppersmith_parameters(n_bits, e, unknown_bits, max_dimension):
+        '''
+        Returns the (h, t) giving the smallest lattice, of dimension e*h + t,
+        for which an LLL-reduced vector is guaranteed to be short enough:
+            2**((dim-1)/4) * det**(1/dim) < n**h / sqrt(dim)
+        where det = X**(dim*(dim-1)/2) * n**(e*h*(h+1)/2).
+        '''
+        best = None
+        for h in range(1, max_dimension // e + 1):
+            for t in range(e + 1):
+                dim = e * h + t
+                if dim > max_dimension or (best and dim >= best[0]):
+                    continue
+                log_det = (dim * (dim - 1) / 2.0 * unknown_bits
+                           + e * h * (h + 1) / 2.0 * n_bits)
+                if ((dim - 1) / 4.0 + log_det / dim
+                        < h * n_bits - math.log(dim, 2) / 2):
+                    best = (dim, h, t)
+        if best is None:
+            raise ValueError('%d unknown bits need a lattice larger than '
+                             'max_dimension = %d' % (unknown_bits, max_dimension))
+        return best[1:]
+
+    @staticmethod
+    def _binomial(n, k):
+        result = 1
+        for i in range(k):
+            result = result * (n - i) // (i + 1)
+        return result
+
     @staticmethod
     def wiener_attack(e, n):
         '''
@@ -282,23 +769,496 @@ class RSACipher(object):
         1. Size of data to be decrypted must be less than n
         2. plaintext=pow(ciphertext, d, n)
         '''
-        frac = RSACipher.continued_fraction(e, n)
-        convergents = RSACipher.continued_fraction_convergents(frac)
+        d = RSACipher._wiener(e, n)
+        return -1 if d is None else d
+
+    @staticmethod
+    def _wiener(e, n):
+        '''
+        Returns d or None. Convergents of e/n are generated one at a time and
+        the search stops at the first k/d that factors n.
+        '''
+        quotients = RSACipher.continued_fraction_iter(e, n)
+        convergents = RSACipher.continued_fraction_convergents(quotients)
 
         for (k, d) in convergents:
             #check if d is actually the key
-            if (k != 0) and ((e*d - 1)%k == 0):
-                phi = (e*d - 1)//k
-                s   = n - phi + 1
-                # check if the equation x^2 - s*x + n = 0
-                # has integer roots
-                discr = s*s - 4*n
-                if discr >= 0:
-                    t = _perfectSqrt(discr)
-                    if (t != -1) and ((s+t)%2 == 0):
-                        return d
+            if k == 0:
+                continue
+            phi, r = _divMod(e*d - 1, k)
+            if r != 0:
+                continue
+            s   = n - phi + 1
+            # check if the equation x^2 - s*x + n = 0
+            # has integer roots
+            discr = s*s - 4*n
+            if discr >= 0:
+                t = _perfectSqrt(discr)
+                if (t != -1) and ((s+t)%2 == 0):
+                    return d
+        return None
+
+    @staticmethod
+    def wiener_attack_extended(e, n, radius=8, processes=None):
+        '''
+        Returns d knowing (e, n), or -1, for keys a little above the Wiener
+        bound: d up to about radius * n**(1/4) (Verheul and van Tilborg).
+
+        k/d is then no longer a convergent of e/n but a combination
+            k/d = (r*k[m+1] + s*k[m]) / (r*d[m+1] + s*d[m])
+        of two consecutive convergents with small r and s. Every pair of
+        convergents with d[m] < sqrt(n) is searched for 1 <= r <= radius
+        and |s| <= radius, so the work grows as radius**2; radius=0 is the
+        plain Wiener attack. The pairs are spread over a process pool.
+
+        @param radius: bound on r and |s|, trades runtime for coverage
+        @param processes: size of the process pool, None for cpu_count().
+                          Use 1 to run in the current process.
+        '''
+        bound = _iSqrt(n)
+        def jobs():
+            quotients = RSACipher.continued_fraction_iter(e, n)
+            previous = (1, 0)
+            for current in RSACipher.continued_fraction_convergents(quotients):
+                if current[1] > bound:
+                    break
+                yield (e, n, previous, current, radius)
+                previous = current
+
+        if processes == 1:
+            for job in jobs():
+                d = _wiener_extended_worker(job)
+                if d is not None:
+                    return d
+            return -1
+
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        try:
+            for d in pool.imap_unordered(_wiener_extended_worker, jobs()):
+                if d is not None:
+                    return d
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
         return -1
 
+    @staticmethod
+    def _wiener_around(e, n, previous, current, radius):
+        '''
+        Returns d or None, trying k/d = (r*k1 + s*k0) / (r*d1 + s*d0) around
+        the convergents previous = (k0, d0) and current = (k1, d1).
+        Each candidate costs a division and a square; _perfectSqrt() only
+        runs when the discriminant is a square modulo _FERMAT_MODULI.
+        '''
+        k0, d0 = previous
+        k1, d1 = current
+        for r in xrange(1, max(radius, 1) + 1):
+            for s in xrange(-radius, radius + 1):
+                if _gcd(r, s) != 1:
+                    continue
+                k = r*k1 + s*k0
+                d = r*d1 + s*d0
+                # e and d are odd, since e*d = 1 (mod phi) and phi is even
+                if k <= 0 or d <= 0 or not d & 1:
+                    continue
+                phi, rem = _divMod(e*d - 1, k)
+                if rem != 0:
+                    continue
+                # p + q, then (p - q)**2 must be a square
+                b = n - phi + 1
+                discr = b*b - 4*n
+                if b & 1 or discr < 0:
+                    continue
+                x = int(discr % _SQUARES_MODULUS)
+                for (m, squares) in _SQUARES_MOD:
+                    if not squares[x % m]:
+                        break
+                else:
+                    if _perfectSqrt(discr) != -1:
+                        return d
+        return None
+
+    @staticmethod
+    def read_keys(source):
+        '''
+        Returns iterator to (e, n) pairs read from `source'.
+
+        `source' is a filename, an open file or an iterable of lines. Each
+        line holds e and n separated by whitespace or a comma, in decimal or
+        0x-prefixed hex. Blank lines and lines starting with '#' are skipped.
+        '''
+        if isinstance(source, basestring):
+            with open(source) as fd:
+                for key in RSACipher.read_keys(fd):
+                    yield key
+            return
+        for line in source:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            e, n = line.replace(',', ' ').split()
+            yield (int(e, 0), int(n, 0))
+
+    @staticmethod
+    def wiener_attack_batch(keys, processes=None, chunksize=64):
+        '''
+        Returns iterator to (index, d) for each (e, n) in `keys', where d is
+        None if the key is not Wiener-vulnerable. Results are streamed back
+        as soon as they are ready, so they are NOT in input order.
+
+        @param keys: iterable of (e, n) pairs, or a filename/file object
+                     in the format accepted by read_keys()
+        @param processes: size of the process pool, None for cpu_count().
+                          Use 1 to run in the current process, which is
+                          also done with a single CPU or fewer than
+                          _WIENER_POOL_MIN_KEYS keys.
+        @param chunksize: number of keys sent to a worker at once
+
+        Example:
+        >>> for (i, d) in RSACipher.wiener_attack_batch('keys.txt'):
+        ...     if d is not None:
+        ...         print(i, d)
+        '''
+        import itertools
+        import multiprocessing
+        if isinstance(keys, basestring) or hasattr(keys, 'readline'):
+            keys = RSACipher.read_keys(keys)
+        keys = iter(keys)
+        # the first keys tell a small batch, the rest is still streamed
+        head = list(itertools.islice(keys, _WIENER_POOL_MIN_KEYS))
+        jobs = enumerate(itertools.chain(head, keys))
+
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if processes == 1 or len(head) < _WIENER_POOL_MIN_KEYS:
+            for job in jobs:
+                yield _wiener_worker(job)
+            return
+
+        pool = multiprocessing.Pool(processes)
+        try:
+            for result in pool.imap_unordered(_wiener_worker, jobs, chunksize):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    @staticmethod
+    def fermat_factor(n, max_iterations=100000):
+        '''
+        Returns (p, q) such that p*q = n and 1 < p <= q with Fermat's method,
+        or None if no factor is found in `max_iterations' steps, or if n is
+        prime or below 4. Raises ValueError when n < 1. Keys whose primes
+        are close, |p - q| < n**(1/4), fall on the first step.
+
+        Fermat looks for a >= isqrt(n) such that a**2 - n = b**2, then
+        n = (a - b)*(a + b). Each candidate a is first checked against
+        per-modulus tables telling whether a**2 - n is a quadratic residue
+        modulo small moduli, so _perfectSqrt() only runs on the few
+        candidates that survive.
+        '''
+        if n < 1:
+            raise ValueError('Non-positive number: n = %d'%(n))
+        n = _mpz(n)
+        if n < 4:
+            return None
+        if n % 2 == 0:
+            return (_mpz(2), n // 2)
+        a = _mpz(_iSqrt(n))
+        if a * a == n:
+            return (a, a)
+        a += 1
+
+        # sieve[j][i % m] is 0 when (a + i)**2 - n is not a square mod m
+        sieve = []
+        for (m, squares) in _SQUARES_MOD:
+            a_m, n_m = int(a % m), int(n % m)
+            sieve.append((m, bytearray(squares[((a_m + i)**2 - n_m) % m]
+                                       for i in range(m))))
+        (m0, sieve0), sieve = sieve[0], sieve[1:]
+
+        for i in xrange(max_iterations):
+            if not sieve0[i % m0]:
+                continue
+            for (m, table) in sieve:
+                if not table[i % m]:
+                    break
+            else:
+                x = a + i
+                b = _perfectSqrt(x * x - n)
+                if b != -1:
+                    # (1, n) at x = (n + 1)/2: n is prime
+                    return (x - b, x + b) if x - b > 1 else None
+        return None
+
+    @staticmethod
+    def fermat_factor_batch(moduli, max_iterations=100000, processes=None,
+                            chunksize=16):
+        '''
+        Returns iterator to (index, factors) for each n in `moduli', where
+        factors is the result of fermat_factor(n, max_iterations). Results
+        are streamed back as soon as they are ready, NOT in input order.
+
+        @param processes: size of the process pool, None for cpu_count().
+                          Use 1 to run in the current process.
+        @param chunksize: number of moduli sent to a worker at once
+        '''
+        jobs = ((i, n, max_iterations) for (i, n) in enumerate(moduli))
+
+        if processes == 1:
+            for job in jobs:
+                yield _fermat_worker(job)
+            return
+
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        try:
+            for result in pool.imap_unordered(_fermat_worker, jobs, chunksize):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    @staticmethod
+    def factor(n, trial_bound=10000, smoothness_bound=100000, timeout=None):
+        '''
+        Returns sorted list of the prime factors of n, with multiplicity.
+
+        Small factors are removed by trial division by the primes below
+        `trial_bound'. What is left is split with Pollard p-1, which finds
+        p when p-1 is `smoothness_bound'-smooth, then with Brent's rho.
+        If `timeout' seconds pass before n is fully factored, composite
+        factors that are left are returned as they are. Raises ValueError
+        when n < 1; factor(1) is [].
+
+        Example:
+        >>> RSACipher.factor(2**4 * 3 * 1000003 * 1000033)
+        [2, 2, 2, 2, 3, 1000003, 1000033]
+        '''
+        if n < 1:
+            raise ValueError('Non-positive number: n = %d'%(n))
+        deadline = None if timeout is None else time.time() + timeout
+        n = _mpz(n)
+        factors = []
+        for p in _primeTable(trial_bound):
+            if p * p > n:
+                break
+            while n % p == 0:
+                factors.append(_mpz(p))
+                n //= p
+
+        composites = [n]
+        while composites:
+            m = composites.pop()
+            if m == 1:
+                continue
+            if _isPrime(m) or (deadline is not None and time.time() > deadline):
+                factors.append(m)
+                continue
+            d = RSACipher._pollard_pm1(m, smoothness_bound, deadline)
+            if d is None:
+                d = RSACipher._pollard_brent(m, deadline)
+            if d is None:
+                factors.append(m)
+                continue
+            composites.extend((d, m // d))
+        return sorted(factors)
+
+    @staticmethod
+    def _pollard_pm1(n, bound, deadline=None, batch=100):
+        '''
+        Returns a non-trivial factor of n or None with Pollard p-1.
+        2 is raised to every prime power up to `bound'; the gcd is only taken
+        once per `batch' primes, going back one batch prime by prime if it
+        overshoots to n.
+        '''
+        primes = _primeTable(bound + 1)
+        a = _mpz(2)
+        for i in range(0, len(primes), batch):
+            saved = a
+            for p in primes[i:i + batch]:
+                q = p
+                while q * p <= bound:
+                    q *= p
+                a = pow(a, q, n)
+            g = _gcd(a - 1, n)
+            if g == n:
+                a = saved
+                for p in primes[i:i + batch]:
+                    q = p
+                    while q * p <= bound:
+                        q *= p
+                    a = pow(a, q, n)
+                    g = _gcd(a - 1, n)
+                    if g != 1:
+                        break
+            if g == n:
+                return None
+            if g != 1:
+                return g
+            if deadline is not None and time.time() > deadline:
+                return None
+        return None
+
+    @staticmethod
+    def _pollard_brent(n, deadline=None, batch=100):
+        '''
+        Returns a non-trivial factor of n or None with Brent's variant of
+        Pollard rho. Differences are multiplied together and the gcd is
+        taken once per `batch' steps. Polynomials y**2 + c are tried for
+        c = 1, 2, .. until one splits n or the deadline passes.
+        '''
+        c = 0
+        while deadline is None or time.time() < deadline:
+            c += 1
+            y, r, q, g = _mpz(2), 1, _mpz(1), 1
+            while g == 1:
+                x = y
+                for _ in xrange(r):
+                    y = _mod(_mulProduct(y, y) + c, n)
+                k = 0
+                while k < r and g == 1:
+                    ys = y
+                    for _ in xrange(min(batch, r - k)):
+                        y = _mod(_mulProduct(y, y) + c, n)
+                        q = _mod(_mulProduct(q, x - y), n)
+                    g = _gcd(q, n)
+                    k += batch
+                    if deadline is not None and time.time() > deadline:
+                        return None
+                r *= 2
+            if g == n:
+                # the batch overshot, replay it one step at a time
+                g = 1
+                while g == 1:
+                    ys = _mod(_mulProduct(ys, ys) + c, n)
+                    g = _gcd(x - ys, n)
+            if g != n:
+                return g
+        return None
+
+    @staticmethod
+    def product_tree(values, pool=None):
+        '''
+        Returns product tree of `values' as a list of levels, from the leaves
+        (level 0 is `values') to the root (a one-element level).
+        If `pool' (multiprocessing.Pool) is given, each level is multiplied
+        in parallel.
+        '''
+        tree = [list(values)]
+        while len(tree[-1]) > 1:
+            level = tree[-1]
+            pairs = list(zip(level[0::2], level[1::2]))
+            if pool is None:
+                upper = [_mulProduct(a, b) for (a, b) in pairs]
+            else:
+                upper = pool.map(_mul_pair, pairs)
+            if len(level) % 2:
+                upper.append(level[-1])
+            tree.append(upper)
+        return tree
+
+    @staticmethod
+    def remainder_tree(tree, x, pool=None):
+        '''
+        Returns [x mod v**2 for v in tree[0]] walking down a product_tree(),
+        so each reduction is against a modulus half the size of the previous.
+        '''
+        remainders = [x]
+        for level in reversed(tree[:-1]):
+            jobs = [(remainders[i // 2], v) for (i, v) in enumerate(level)]
+            if pool is None:
+                remainders = [_mod(r, _mulProduct(v, v)) for (r, v) in jobs]
+            else:
+                remainders = pool.map(_mod_square, jobs)
+        return remainders
+
+    @staticmethod
+    def batch_gcd(moduli, chunk_size=None, processes=1):
+        '''
+        Returns list g where g[i] = gcd(n_i, product of all other moduli),
+        using Bernstein's product/remainder tree. g[i] == 1 means n_i shares
+        no prime with the others, 1 < g[i] < n_i is a shared prime and
+        g[i] == n_i means both primes are shared (e.g. a duplicated key).
+
+        @param moduli: sequence of RSA moduli
+        @param chunk_size: if set, trees are only built over `chunk_size'
+                           moduli at a time, which bounds memory to the
+                           chunk trees plus one product per chunk instead of
+                           a full tree over the whole corpus
+        @param processes: split each tree level over a process pool of this
+                          size, None for cpu_count(). 1 disables the pool.
+
+        Example:
+        >>> RSACipher.batch_gcd([15, 21, 11*13])
+        [3, 3, 1]
+        '''
+        moduli = [_mpz(n) for n in moduli]
+        if not moduli:
+            return []
+        if chunk_size is None:
+            chunk_size = len(moduli)
+
+        pool = None
+        if processes != 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(processes)
+        try:
+            chunks = [moduli[i:i + chunk_size]
+                      for i in range(0, len(moduli), chunk_size)]
+            if len(chunks) == 1:
+                tree = RSACipher.product_tree(chunks[0], pool)
+                return RSACipher._batch_gcd_leaves(tree, tree[-1][0], pool)
+
+            products = [RSACipher.product_tree(chunk, pool)[-1][0]
+                        for chunk in chunks]
+            result = []
+            for chunk in chunks:
+                tree = RSACipher.product_tree(chunk, pool)
+                root = tree[-1][0]
+                square = _mulProduct(root, root)
+                # product of every chunk reduced mod root**2, one at a time
+                total = _mpz(1)
+                for product in products:
+                    total = _mod(_mulProduct(total, _mod(product, square)),
+                                 square)
+                result.extend(RSACipher._batch_gcd_leaves(tree, total, pool))
+            return result
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+    @staticmethod
+    def _batch_gcd_leaves(tree, total, pool):
+        remainders = RSACipher.remainder_tree(tree, total, pool)
+        return [_gcd(r // n, n) for (r, n) in zip(remainders, tree[0])]
+
+
+# multiprocessing workers must be picklable, so they live at module level
+
+def _mul_pair(pair):
+    return _mulProduct(pair[0], pair[1])
+
+def _mod_square(job):
+    r, v = job
+    return _mod(r, _mulProduct(v, v))
+
+def _wiener_worker(job):
+    index, (e, n) = job
+    return (index, RSACipher._wiener(e, n))
+
+def _wiener_extended_worker(job):
+    return RSACipher._wiener_around(*job)
+
+def _fermat_worker(job):
+    index, n, max_iterations = job
+    return (index, RSACipher.fermat_factor(n, max_iterations))
+
 
 class AESCipher(object):
     '''
@@ -321,17 +1281,28 @@ class AESCipher(object):
         self.key = key
         self.bs = AES.block_size
         self.mode = mode
+        # ECB keeps no state between blocks, one cipher object is enough
+        self._ecb = (AES.new(self.key, AES.MODE_ECB)
+                     if mode == AES.MODE_ECB else None)
 
     def __repr__(self):
         return "AESCipher(key=%r, mode=%r)" % (self.key, self.mode)
 
+    def _new_iv(self):
+        return (Random.get_random_bytes(self.bs)
+                if (self.mode == AES.MODE_CBC) else b'')
+
+    def _new_aes(self, iv):
+        if self.mode == AES.MODE_CBC:
+            return AES.new(self.key, self.mode, iv)
+        return self._ecb
+
     def encrypt(self, raw):
         """Encrypt using AES in CBC or ECB mode."""
 
         raw = self.pad(raw)
-        iv = (Random.new().read(self.bs) if (self.mode == AES.MODE_CBC)
-              else '')
-        aes = AES.new(key=self.key, mode=self.mode, IV=iv)
+        iv = self._new_iv()
+        aes = self._new_aes(iv)
         return b64encode(iv + aes.encrypt(raw))
 
     def decrypt(self, enc):
@@ -342,11 +1313,76 @@ class AESCipher(object):
             iv = enc[:self.bs]
             enc = enc[self.bs:]
         else:
-            iv = ''
-        aes = AES.new(key=self.key, mode=self.mode, IV=iv)
+            iv = b''
+        aes = self._new_aes(iv)
         dec = aes.decrypt(enc)
         return self.unpad(dec)
 
+    def encrypt_stream(self, src, dst, chunk_size=1 << 20):
+        """Encrypt `src' into `dst' chunk by chunk.
+
+        The output is the same as encrypt(src): base64(IV + ciphertext).
+        Chunks are block aligned and one AES object carries the CBC chaining
+        state across them, so padding is only added to the last block and
+        base64 only buffers the 0-2 bytes that straddle two chunks.
+
+        src -- binary file object, or str/bytearray/memoryview (not copied)
+        dst -- object with a write() method, receives the base64 text
+        """
+
+        # multiple of both the AES block and a base64 group
+        align = 3 * self.bs
+        chunk_size = max(align, chunk_size - chunk_size % align)
+        iv = self._new_iv()
+        aes = self._new_aes(iv)
+        out = _Base64Writer(dst)
+        out.write(iv)
+
+        tail = b''
+        for chunk in _iter_chunks(src, chunk_size):
+            # only the last chunk can end with a partial block
+            n = len(chunk) - len(chunk) % self.bs
+            if n:
+                out.write(aes.encrypt(chunk[:n]))
+            tail = chunk[n:].tobytes()
+        out.write(aes.encrypt(self.pad(tail)))
+        out.close()
+
+    def decrypt_stream(self, src, dst, chunk_size=1 << 20):
+        """Decrypt base64 text from `src' into `dst' chunk by chunk.
+
+        Counterpart of encrypt_stream(); accepts anything encrypt() produced.
+        The last plaintext block is held back until the end of the stream so
+        that only it goes through unpad().
+
+        src -- file object, or str/bytearray/memoryview holding base64 text
+        dst -- object with a write() method, receives the plaintext
+        """
+
+        # 64 base64 chars decode to 48 bytes, a multiple of the AES block
+        chunk_size = max(64, chunk_size - chunk_size % 64)
+        aes = self._ecb
+        iv = b''
+        last = b''
+        for data in _iter_base64_chunks(src, chunk_size):
+            if aes is None:
+                # CBC: the IV is the first block of the stream
+                need = self.bs - len(iv)
+                iv += data[:need].tobytes()
+                data = data[need:]
+                if len(iv) < self.bs:
+                    continue
+                aes = self._new_aes(iv)
+            if not len(data):
+                continue
+            dec = memoryview(aes.decrypt(data))
+            if last:
+                dst.write(last)
+            dst.write(dec[:-self.bs])
+            last = dec[-self.bs:].tobytes()
+        if last:
+            dst.write(self.unpad(last))
+
     def unpad(self, text):
         """PKCS7 unpad"""
 
@@ -364,7 +1400,82 @@ class AESCipher(object):
         return text + chr(pad_num) * pad_num
 
 
+def _iter_chunks(src, chunk_size):
+    '''
+    Yields memoryviews of `chunk_size' bytes (the last one may be shorter)
+    over a file object or a buffer. Files are read into one reused buffer.
+    '''
+    if not hasattr(src, 'read'):
+        view = memoryview(src)
+        for i in range(0, len(view), chunk_size):
+            yield view[i:i + chunk_size]
+        return
+
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    readinto = getattr(src, 'readinto', None)
+    while True:
+        filled = 0
+        while filled < chunk_size:
+            if readinto is not None:
+                n = readinto(view[filled:])
+            else:
+                data = src.read(chunk_size - filled)
+                n = len(data)
+                view[filled:filled + n] = data
+            if not n:
+                break
+            filled += n
+        if filled:
+            yield view[:filled]
+        if filled < chunk_size:
+            return
+
+def _iter_base64_chunks(src, chunk_size):
+    '''Yields decoded memoryviews of base64 text read by _iter_chunks()'''
+    carry = b''
+    for chunk in _iter_chunks(src, chunk_size):
+        if carry:
+            chunk = memoryview(carry + chunk.tobytes())
+        n = len(chunk) - len(chunk) % 4
+        carry = chunk[n:].tobytes()
+        yield memoryview(b64decode(chunk[:n]))
+    if carry:
+        yield memoryview(b64decode(carry))
+
+class _Base64Writer(object):
+    '''
+    Base64-encodes everything written to it into `fd'. Bytes are encoded in
+    groups of 3, so the concatenated output equals b64encode() of the whole.
+    '''
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.carry = b''
+
+    def write(self, data):
+        data = memoryview(data)
+        if self.carry:
+            need = 3 - len(self.carry)
+            self.carry += data[:need].tobytes()
+            data = data[need:]
+            if len(self.carry) < 3:
+                return
+            self.fd.write(b64encode(self.carry))
+        n = len(data) - len(data) % 3
+        if n:
+            self.fd.write(b64encode(data[:n]))
+        self.carry = data[n:].tobytes()
+
+    def close(self):
+        if self.carry:
+            self.fd.write(b64encode(self.carry))
+            self.carry = b''
+
+
 class Checksum():
+    _CACHE_NAME = 'checksum-2.pickle'
+
     @staticmethod
     def _hashlib_wrapper(method, filename, block_size):
         check_sum_fun = method()
@@ -382,10 +1493,111 @@ Efficency when works with many file
 
     @staticmethod
     def sha1sum(filename, block_size=65536):
-    '''Return sha1 sum of a file'''
+        '''Return sha1 sum of a file'''
         return Checksum._hashlib_wrapper(hashlib.sha1, filename, block_size)
 
     @staticmethod
     def md5sum(filename, block_size=65536):
-    '''Return md5 sum of a file'''
+        '''Return md5 sum of a file'''
         return Checksum._hashlib_wrapper(hashlib.md5, filename, block_size)
+
+    @staticmethod
+    def scan(paths, algorithms=('sha256', 'sha1', 'md5'), threads=None,
+             cache=True, block_size=1 << 20, mmap_threshold=1 << 20):
+        '''
+        Returns {path: {algorithm: hexdigest}} for every file in `paths'.
+        Directories are walked recursively.
+
+        All `algorithms' are updated from the same block, so each file is
+        read only once. Files of `mmap_threshold' bytes or more are mapped
+        instead of read. Files are hashed on a pool of `threads' threads
+        (hashlib releases the GIL), None for cpu_count().
+
+        With `cache', digests are stored in the mypwn cache directory by
+        path with the (device, inode, size, mtime) of the file, and
+        unchanged files are not read again on the next scan. The cache is
+        merged under a lock, so concurrent scans keep each other's digests,
+        and bounded by mycache.FILES_LIMIT files.
+
+        Files that cannot be read (dangling symlinks, files deleted during
+        the scan, no permission) are left out of the result.
+
+        Example:
+        >>> Checksum.scan(['firmware/'], algorithms=('md5',))
+        {'firmware/bin/busybox': {'md5': '...'}, ...}
+        '''
+        if isinstance(paths, basestring):
+            paths = [paths]
+        algorithms = tuple(algorithms)
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                for (root, _, names) in os.walk(path):
+                    files.extend(os.path.join(root, name) for name in names)
+            else:
+                files.append(path)
+
+        cached = mycache.load_files(Checksum._CACHE_NAME) if cache else {}
+        result = {}
+        jobs = []
+        for path in files:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            key = mycache.file_identity(st)
+            entry = cached.get(os.path.abspath(path))
+            if entry is not None and entry[0] == key and \
+                    all(a in entry[1] for a in algorithms):
+                result[path] = dict((a, entry[1][a]) for a in algorithms)
+            else:
+                jobs.append((path, key, st.st_size))
+
+        if jobs:
+            from multiprocessing.pool import ThreadPool
+            def work(job):
+                path, key, size = job
+                try:
+                    return (path, key, Checksum._hash_file(
+                        path, size, algorithms, block_size, mmap_threshold))
+                except (IOError, OSError):
+                    return (path, key, None)
+            pool = ThreadPool(threads)
+            hashed = {}
+            try:
+                for (path, key, digests) in pool.imap_unordered(work, jobs):
+                    if digests is None:
+                        continue
+                    result[path] = digests
+                    hashed[os.path.abspath(path)] = (key, digests)
+            finally:
+                pool.terminate()
+                pool.join()
+            if cache:
+                mycache.update_files(Checksum._CACHE_NAME, hashed,
+                                     lambda old, new: dict(old, **new))
+        return result
+
+    @staticmethod
+    def _hash_file(filename, size, algorithms, block_size, mmap_threshold):
+        hashes = [hashlib.new(a) for a in algorithms]
+        with open(filename, 'rb') as fd:
+            if size and size >= mmap_threshold:
+                mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    for offset in range(0, len(mm), block_size):
+                        block = _buffer(mm, offset, block_size)
+                        for h in hashes:
+                            h.update(block)
+                        del block
+                finally:
+                    mm.close()
+            else:
+                buf = bytearray(block_size)
+                view = memoryview(buf)
+                n = fd.readinto(buf)
+                while n:
+                    for h in hashes:
+                        h.update(view[:n])
+                    n = fd.readinto(buf)
+        return dict((a, h.hexdigest()) for (a, h) in zip(algorithms, hashes))
@@ -0,0 +1,304 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+import hashlib
+import mmap
+import os
+import re
+from collections import namedtuple
+from struct import Struct
+
+from mypwn import mycache
+
+__all__ = [
+    'ELF', 'Section', 'Segment',
+  ]
+
+# bump when the layout of the cached index changes
+_INDEX_VERSION = 1
+_HASHES = 'elf-hashes-2'
+
+_CLASS = {1: 32, 2: 64}           # e_ident[EI_CLASS] -> bits
+_DATA = {1: '<', 2: '>'}          # e_ident[EI_DATA] -> struct byte order
+
+_PT_LOAD = 1
+_PF_X = 0x1
+
+_SHT_SYMTAB = 2
+_SHT_RELA = 4
+_SHT_REL = 9
+_SHT_DYNSYM = 11
+_SHF_ALLOC = 0x2
+_SHN_UNDEF = 0
+_SHN_XINDEX = 0xffff
+_STB_LOCAL = 0
+_STT_SECTION = 3
+_STT_FILE = 4
+
+_EM_386 = 3
+_EM_X86_64 = 62
+_ARCH = {
+  _EM_386: 'x86', _EM_X86_64: 'x64', 8: 'mips', 20: 'powerpc',
+  21: 'powerpc64', 40: 'arm', 183: 'aarch64',
+}
+
+# per class: header after e_ident, section header, symbol, rel, rela,
+# program header
+_LAYOUT = {
+  32: ('HHIIIIIHHHHHH', 'IIIIIIIIII', 'IIIBBH', 'II', 'IIi', 'IIIIIIII'),
+  64: ('HHIQQQIHHHHHH', 'IIQQQQIIQQ', 'IBBHQQ', 'QQ', 'QQq', 'IIQQQQQQ'),
+}
+
+# an indirect jump through a GOT slot, as found in x86 PLT stubs, with its
+# optional endbr and bnd prefixes:
+#   ff 25 <disp32>    jmp *disp(%rip) on x64, jmp *abs32 on x86
+#   ff a3 <disp32>    jmp *disp(%ebx), x86 PIC, ebx = .got.plt
+_PLT_JMP = re.compile(r'(?:\xf3\x0f\x1e[\xfa\xfb])?\xf2?\xff([\x25\xa3])(....)',
+                      re.DOTALL)
+
+Section = namedtuple('Section',
+    ['name', 'type', 'flags', 'addr', 'offset', 'size', 'link', 'info',
+     'addralign', 'entsize'])
+
+Segment = namedtuple('Segment',
+    ['type', 'flags', 'offset', 'vaddr', 'paddr', 'filesz', 'memsz', 'align'])
+
+class ELF(object):
+  '''
+  Reads an ELF file (32/64-bit, little/big endian) without any external
+  tool: the file is memory-mapped and only the parts asked for are parsed.
+
+  symbols, got and plt are dicts built together on first use, then cached
+  on disk (see mycache) under the sha256 of the file: opening the same
+  binary again costs one unpickle, a copy of it one hash more.
+
+  Example:
+  >>> elf = ELF('/opt/protostar/bin/format4')
+  >>> hex(elf.got['exit']), hex(elf.symbols['target'])
+  ('0x8049724', '0x80496e4')
+  >>> payload = fmt_four_bytes(elf.got['exit'], 4, elf.symbols['hello'])
+
+  replaces:
+  $ objdump -TR format4 | grep exit
+  $ nm format4 | grep target
+  '''
+  def __init__(self, path, cache=True):
+    self.path = path
+    self.cache = cache
+    with open(path, 'rb') as fd:
+      self._identity = mycache.file_identity(os.fstat(fd.fileno()))
+      try:
+        self._map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+      except ValueError:
+        raise ValueError('%s: not an ELF file' % path) # empty file
+    ident = self._map[:16]
+    if (len(ident) < 16 or ident[:4] != '\x7fELF'
+        or ord(ident[4]) not in _CLASS or ord(ident[5]) not in _DATA):
+      self._map.close()
+      raise ValueError('%s: not an ELF file' % path)
+    self.bits = _CLASS[ord(ident[4])]
+    self.endian = 'little' if ord(ident[5]) == 1 else 'big'
+    order = _DATA[ord(ident[5])]
+    (header, section, symbol, rel, rela, program) = [
+        Struct(order + fmt) for fmt in _LAYOUT[self.bits]]
+    (self.type, self.machine, _, self.entry, self._phoff, self._shoff, _, _,
+     self._phentsize, self._phnum, self._shentsize, self._shnum,
+     self._shstrndx) = header.unpack_from(self._map, 16)
+    self.arch = _ARCH.get(self.machine, 'em_%d' % self.machine)
+    self._section = section
+    self._program = program
+    self._symbol = symbol
+    self._rel = {_SHT_REL: rel, _SHT_RELA: rela}
+    self._word = Struct(order + 'i')
+    self._sections = None
+    self._segments = None
+    self._index = None
+    self._sha256 = None
+
+  def close(self):
+    self._map.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  @property
+  def sha256(self):
+    '''
+    Hex sha256 of the file. Hashes are remembered in the cache by path
+    with (device, inode, size, mtime), so an unchanged file is only read
+    once (see mycache.update_files for how the cache is bounded).
+    '''
+    if self._sha256 is None:
+      path = os.path.abspath(self.path)
+      entry = mycache.load_files(_HASHES).get(path) if self.cache else None
+      if entry is not None and entry[0] == self._identity:
+        self._sha256 = entry[1]
+      else:
+        self._sha256 = hashlib.sha256(self._map).hexdigest()
+        if self.cache:
+          mycache.update_files(_HASHES, {path: (self._identity, self._sha256)})
+    return self._sha256
+
+  @property
+  def sections(self):
+    '''List of Section, parsed from the section header table on first use'''
+    if self._sections is None:
+      self._sections = self._read_sections()
+    return self._sections
+
+  @property
+  def segments(self):
+    '''List of Segment, parsed from the program header table on first use'''
+    if self._segments is None:
+      self._segments = []
+      for i in xrange(self._phnum if self._phoff else 0):
+        entry = self._program.unpack_from(
+            self._map, self._phoff + i * self._phentsize)
+        if self.bits == 32:
+          # p_flags comes after p_memsz in 32-bit files
+          entry = entry[:1] + entry[6:7] + entry[1:6] + entry[7:]
+        self._segments.append(Segment(*entry))
+    return self._segments
+
+  def executable_segments(self):
+    '''Returns list of the loadable Segment mapped executable'''
+    return [seg for seg in self.segments
+            if seg.type == _PT_LOAD and seg.flags & _PF_X]
+
+  def get_section(self, name):
+    '''Returns the first Section called `name', or None'''
+    for sec in self.sections:
+      if sec.name == name:
+        return sec
+    return None
+
+  def section_data(self, name):
+    '''Returns the content of section `name' as a string, or None'''
+    sec = self.get_section(name)
+    if sec is None:
+      return None
+    return self._map[sec.offset:sec.offset + sec.size]
+
+  @property
+  def symbols(self):
+    '''Dict name -> address of the symbols defined in .symtab and .dynsym'''
+    return self._get_index()['symbols']
+
+  @property
+  def got(self):
+    '''Dict name -> address of the GOT slot relocated against the symbol'''
+    return self._get_index()['got']
+
+  @property
+  def plt(self):
+    '''Dict name -> address of the PLT stub jumping through got[name] (x86)'''
+    return self._get_index()['plt']
+
+  def _read_sections(self):
+    if self._shoff == 0:
+      return []
+    unpack = self._section.unpack_from
+    first = unpack(self._map, self._shoff)
+    # more than 0xff00 sections: the count is in sh_size of section 0,
+    # the index of the names in its sh_link
+    count = self._shnum or first[5]
+    shstrndx = self._shstrndx
+    if shstrndx == _SHN_XINDEX:
+      shstrndx = first[6]
+    raw = [first] + [unpack(self._map, self._shoff + i * self._shentsize)
+                     for i in xrange(1, count)]
+    names = ''
+    if shstrndx < len(raw):
+      names = self._map[raw[shstrndx][4]:raw[shstrndx][4] + raw[shstrndx][5]]
+    return [Section(_cstring(names, entry[0]), *entry[1:]) for entry in raw]
+
+  def _get_index(self):
+    if self._index is None:
+      name = 'elf-%d-%s.index' % (_INDEX_VERSION, self.sha256)
+      index = mycache.load(name) if self.cache else None
+      if index is None:
+        index = self._build_index()
+        if self.cache:
+          mycache.store(name, index)
+      self._index = index
+    return self._index
+
+  def _build_index(self):
+    sections = self.sections
+    symbols = {}
+    tables = {}
+    for (i, sec) in enumerate(sections):
+      if sec.type in (_SHT_DYNSYM, _SHT_SYMTAB):
+        tables[i] = self._read_symbols(sec)
+        for (name, value, shndx, info) in tables[i]:
+          if (not name or shndx == _SHN_UNDEF
+              or info & 0xf in (_STT_SECTION, _STT_FILE)):
+            continue
+          # a global definition wins over a local one of the same name
+          if name not in symbols or info >> 4 != _STB_LOCAL:
+            symbols[name] = value
+
+    got_sections = [sec for sec in sections if sec.name.startswith('.got')]
+    got = {}
+    for sec in sections:
+      if (sec.type not in self._rel or not sec.flags & _SHF_ALLOC
+          or sec.link not in tables):
+        continue
+      names = tables[sec.link]
+      for (offset, sym) in self._read_relocations(sec):
+        if sym and names[sym][0] and any(
+            s.addr <= offset < s.addr + s.size for s in got_sections):
+          got[names[sym][0]] = offset
+
+    plt = {}
+    if self.machine in (_EM_386, _EM_X86_64) and got:
+      slots = dict((addr, name) for (name, addr) in got.items())
+      got_plt = self.get_section('.got.plt') or self.get_section('.got')
+      for sec in sections:
+        if not sec.name.startswith('.plt'):
+          continue
+        data = self._map[sec.offset:sec.offset + sec.size]
+        for match in _PLT_JMP.finditer(data):
+          disp = self._word.unpack(match.group(2))[0]
+          if match.group(1) == '\xa3':
+            slot = (got_plt.addr if got_plt else 0) + disp
+          elif self.machine == _EM_X86_64:
+            slot = sec.addr + match.end() + disp
+          else:
+            slot = disp & 0xffffffff
+          if slot in slots:
+            plt.setdefault(slots[slot], sec.addr + match.start())
+    return {'symbols': symbols, 'got': got, 'plt': plt}
+
+  def _read_symbols(self, sec):
+    '''Returns list of (name, value, shndx, info), indexed like the table'''
+    strtab = ''
+    if sec.link < len(self.sections):
+      link = self.sections[sec.link]
+      strtab = self._map[link.offset:link.offset + link.size]
+    unpack = self._symbol.unpack_from
+    size = sec.entsize or self._symbol.size
+    symbols = []
+    for offset in xrange(sec.offset, sec.offset + sec.size - size + 1, size):
+      if self.bits == 32:
+        (name, value, _, info, _, shndx) = unpack(self._map, offset)
+      else:
+        (name, info, _, shndx, value, _) = unpack(self._map, offset)
+      symbols.append((_cstring(strtab, name), value, shndx, info))
+    return symbols
+
+  def _read_relocations(self, sec):
+    '''Returns iterator to (r_offset, symbol index)'''
+    layout = self._rel[sec.type]
+    unpack = layout.unpack_from
+    size = sec.entsize or layout.size
+    shift = 8 if self.bits == 32 else 32
+    for offset in xrange(sec.offset, sec.offset + sec.size - size + 1, size):
+      entry = unpack(self._map, offset)
+      yield (entry[0], entry[1] >> shift)
+
+def _cstring(table, offset):
+  end = table.find('\0', offset)
+  return table[offset:end if end >= 0 else len(table)]
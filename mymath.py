@@ -2,37 +2,158 @@
 # -*- coding: utf-8 -*-
 
 import hashlib
-from struct import pack, unpack
+import sys
+from array import array
+from struct import pack, unpack, Struct
 
 __all__ = [
-    'p32', 'u32', 'p64', 'u64', 'Convert', 'Checksum',
+    'p32', 'u32', 'p64', 'u64', 'Convert',
+    'pack_many', 'unpack_many',
+    'p32_many', 'u32_many', 'p64_many', 'u64_many',
 ]
 
+# Checksum moved to mycrypto, re-exported here for existing imports;
+# mycrypto needs pycryptodome, which mymath does not
+try:
+  from mypwn.mycrypto import Checksum
+  __all__.append('Checksum')
+except ImportError:
+  pass
+
+# format strings are parsed once here instead of on every call
+_U32 = Struct('<I')
+_U64 = Struct('<Q')
+
+_ENDIAN = {'little': '<', 'big': '>'}
+_WORD_CODE = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
 def p32(s):
   '''
   Returns a string containing value s packed to the
   little-endian unsigned int format (4 bytes)
   '''
-  return pack('<I', s)
+  return _U32.pack(s)
 
 def u32(s):
   '''
   Returns a little-endian unsigned int that packed by the string s
   '''
-  return unpack('<I', s)[0]
+  return _U32.unpack(s)[0]
 
 def p64(s):
   '''
   Returns a string containing value s packed to the
   little-endian unsigned long long format (8 bytes)
   '''
-  return pack('<Q', s)
+  return _U64.pack(s)
 
 def u64(s):
   '''
   Returns a little-endian unsigned long long that packed by the string s
   '''
-  return unpack('<Q', s)[0]
+  return _U64.unpack(s)[0]
+
+def _word_format(word_size, endian):
+  if word_size not in _WORD_CODE:
+    raise ValueError("word_size must be 1, 2, 4 or 8")
+  if endian not in _ENDIAN:
+    raise ValueError("endian must be 'little' or 'big'")
+  return _ENDIAN[endian], _WORD_CODE[word_size]
+
+def _array_typecode(word_size):
+  '''Returns the unsigned array typecode of `word_size' bytes, or None'''
+  for code in 'BHILQ':
+    try:
+      if array(code).itemsize == word_size:
+        return code
+    except ValueError: # no 'Q' on Python 2
+      pass
+  return None
+
+def _numpy_dtype(word_size, endian):
+  return '%su%d' % (_ENDIAN[endian], word_size)
+
+def _is_native(endian):
+  return endian == sys.byteorder
+
+def pack_many(values, word_size=8, endian='little'):
+  '''
+  Returns a string of all `values' packed as unsigned words in one pass.
+
+  Args:
+    values    -- iterable of int, array.array or NumPy array
+    word_size -- 1, 2, 4 or 8 bytes
+    endian    -- 'little' or 'big'
+
+  Example:
+    pack_many([0x41424344, 1], 4) == p32(0x41424344) + p32(1)
+  '''
+  order, code = _word_format(word_size, endian)
+  if hasattr(values, 'dtype'):
+    # NumPy array, converted without a Python loop
+    return values.astype(_numpy_dtype(word_size, endian)).tobytes()
+  if isinstance(values, array) and values.typecode == _array_typecode(word_size):
+    if not _is_native(endian):
+      values = array(values.typecode, values)
+      values.byteswap()
+    return values.tostring() if hasattr(values, 'tostring') \
+        else values.tobytes()
+  if not isinstance(values, (list, tuple)):
+    values = list(values)
+  return Struct('%s%d%s' % (order, len(values), code)).pack(*values)
+
+def unpack_many(data, word_size=8, endian='little', kind='list'):
+  '''
+  Returns the unsigned words packed in `data' in one pass.
+
+  Args:
+    data      -- str, bytearray, memoryview or anything with the buffer
+                 interface; len(data) must be a multiple of word_size
+    word_size -- 1, 2, 4 or 8 bytes
+    endian    -- 'little' or 'big'
+    kind      -- 'list', 'array' (array.array) or 'numpy' (NumPy array
+                 sharing memory with `data' when possible)
+  '''
+  order, code = _word_format(word_size, endian)
+  if len(data) % word_size:
+    raise ValueError("len(data) must be a multiple of %d" % word_size)
+  count = len(data) // word_size
+  if kind == 'list':
+    return list(Struct('%s%d%s' % (order, count, code)).unpack_from(data))
+  elif kind == 'array':
+    typecode = _array_typecode(word_size)
+    if typecode is None:
+      raise ValueError("array has no unsigned type of %d bytes" % word_size)
+    words = array(typecode)
+    if hasattr(words, 'frombytes'):
+      words.frombytes(data)
+    elif isinstance(data, memoryview):
+      words.fromstring(data.tobytes())
+    else:
+      words.fromstring(bytes(data))
+    if not _is_native(endian):
+      words.byteswap()
+    return words
+  elif kind == 'numpy':
+    import numpy
+    return numpy.frombuffer(data, dtype=_numpy_dtype(word_size, endian))
+  raise ValueError("kind must be 'list', 'array' or 'numpy'")
+
+def p32_many(values, endian='little'):
+  '''Returns pack_many(values, 4, endian), the bulk version of p32'''
+  return pack_many(values, 4, endian)
+
+def u32_many(data, endian='little', kind='list'):
+  '''Returns unpack_many(data, 4, endian, kind), the bulk version of u32'''
+  return unpack_many(data, 4, endian, kind)
+
+def p64_many(values, endian='little'):
+  '''Returns pack_many(values, 8, endian), the bulk version of p64'''
+  return pack_many(values, 8, endian)
+
+def u64_many(data, endian='little', kind='list'):
+  '''Returns unpack_many(data, 8, endian, kind), the bulk version of u64'''
+  return unpack_many(data, 8, endian, kind)
 
 
 class Convert():
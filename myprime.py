@@ -0,0 +1,231 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+import bisect
+import mmap
+import os
+import re
+import tempfile
+from array import array
+from itertools import compress
+from struct import Struct
+
+from mypwn import mycache
+
+__all__ = [
+    'sieve', 'iter_primes', 'primes', 'prime_table', 'PrimeTable',
+    'is_probable_prime',
+  ]
+
+# tables are stored as native uint32, the cache file is the raw array
+_U32 = Struct('=I')
+assert array('I').itemsize == _U32.size
+
+_SEGMENT = 1 << 20
+_CACHE_NAME = re.compile(r'^primes-(\d+)\.u32$')
+
+def _isqrt(n):
+  '''Returns floor(sqrt(n)) for n >= 0'''
+  if n < 2:
+    return n
+  x = 1 << ((n.bit_length() + 1) // 2)
+  while True:
+    y = (x + n // x) // 2
+    if y >= x:
+      return x
+    x = y
+
+def sieve(limit):
+  '''
+  Returns bytearray f of length `limit' such that f[i] == 1 iff i is prime.
+  One byte per number: for large limits use iter_primes() or primes().
+  '''
+  flags = bytearray([1]) * limit
+  flags[:2] = bytearray(min(limit, 2))
+  for i in range(2, _isqrt(max(limit - 1, 0)) + 1):
+    if flags[i]:
+      flags[i*i::i] = bytearray((limit - 1 - i*i) // i + 1)
+  return flags
+
+def _segments(limit, segment_size):
+  '''
+  Yields (low, flags) covering the odd numbers below `limit', where
+  flags[j] == 1 iff low + 2*j is prime. Only the odd base primes up to
+  sqrt(limit) and one segment of `segment_size' bytes are in memory.
+  '''
+  root = _isqrt(max(limit - 1, 0))
+  base_flags = sieve(root + 1)
+  base = [p for p in range(3, root + 1, 2) if base_flags[p]]
+  span = 2 * segment_size
+  for low in xrange(1, limit, span):
+    high = min(low + span, limit)
+    size = (high - low + 1) // 2
+    flags = bytearray([1]) * size
+    if low == 1:
+      flags[0] = 0
+    for p in base:
+      start = p * p
+      if start >= high:
+        break
+      if start < low:
+        # first odd multiple of p that is >= low
+        start = (low + p - 1) // p * p
+        if not start & 1:
+          start += p
+      j = (start - low) // 2
+      flags[j::p] = bytearray((size - 1 - j) // p + 1)
+    yield (low, flags)
+
+def iter_primes(limit, segment_size=_SEGMENT):
+  '''
+  Returns iterator to the primes below `limit' in increasing order, with a
+  segmented sieve of Eratosthenes. Memory stays around `segment_size' bytes
+  whatever the limit.
+  '''
+  if limit > 2:
+    yield 2
+  for (low, flags) in _segments(limit, segment_size):
+    for p in compress(xrange(low, low + 2 * len(flags), 2), flags):
+      yield p
+
+def _check_limit(limit):
+  if limit > 1 << 32:
+    raise ValueError('Prime tables are uint32, limit must be <= 2**32')
+
+def primes(limit, segment_size=_SEGMENT):
+  '''
+  Returns array('I') of the primes below `limit' (4 bytes per prime,
+  the primes below 10**9 take about 200MB).
+  '''
+  _check_limit(limit)
+  table = array('I', [2] if limit > 2 else [])
+  for (low, flags) in _segments(limit, segment_size):
+    table.extend(compress(xrange(low, low + 2 * len(flags), 2), flags))
+  return table
+
+class PrimeTable(object):
+  '''
+  Read-only sequence of the primes below `limit', read from a cache file
+  of raw uint32 through mmap: opening is instant whatever the size, pages
+  are loaded by the OS as they are touched. Slicing returns array('I').
+  '''
+  def __init__(self, path, limit):
+    self.path = path
+    self.limit = limit
+    if os.path.getsize(path) == 0:
+      self._map = b'' # mmap refuses empty files
+    else:
+      with open(path, 'rb') as fd:
+        self._map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    self._len = len(self._map) // _U32.size
+    if self._len and self[self._len - 1] >= limit:
+      # the file was built for a larger limit
+      self._len = bisect.bisect_left(self, limit)
+
+  def __len__(self):
+    return self._len
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      start, stop, step = index.indices(self._len)
+      if step != 1:
+        return array('I', [self[i] for i in xrange(start, stop, step)])
+      stop = max(start, stop)
+      return array('I', self._map[start * _U32.size:stop * _U32.size])
+    if index < 0:
+      index += self._len
+    if not 0 <= index < self._len:
+      raise IndexError('PrimeTable index out of range')
+    return _U32.unpack_from(self._map, index * _U32.size)[0]
+
+  def __iter__(self):
+    for i in xrange(self._len):
+      yield self[i]
+
+  def __contains__(self, n):
+    i = bisect.bisect_left(self, n)
+    return i < self._len and self[i] == n
+
+  def count(self, n):
+    '''Returns the number of primes <= n, n < limit'''
+    return bisect.bisect_right(self, n)
+
+  def close(self):
+    if isinstance(self._map, mmap.mmap):
+      self._map.close()
+
+def _cached_table(limit):
+  '''Returns path of the smallest cached table covering limit, or None'''
+  best = None
+  for name in os.listdir(mycache.cache_dir()):
+    match = _CACHE_NAME.match(name)
+    if match and int(match.group(1)) >= limit:
+      if best is None or int(match.group(1)) < best:
+        best = int(match.group(1))
+  if best is None:
+    return None
+  return mycache.cache_path('primes-%d.u32' % best)
+
+def prime_table(limit, segment_size=_SEGMENT):
+  '''
+  Returns PrimeTable of the primes below `limit', mapped from the on-disk
+  cache (see mycache). The table is sieved and written segment by segment
+  the first time, any later call with the same or a smaller limit only
+  maps the file.
+
+  Example:
+  >>> table = prime_table(10**9)    # first run sieves, later runs are instant
+  >>> len(table), table[-1], 999999937 in table
+  (50847534, 999999937, True)
+  '''
+  _check_limit(limit)
+  path = _cached_table(limit)
+  if path is None:
+    path = mycache.cache_path('primes-%d.u32' % limit)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        if limit > 2:
+          array('I', [2]).tofile(f)
+        for (low, flags) in _segments(limit, segment_size):
+          odd = xrange(low, low + 2 * len(flags), 2)
+          array('I', compress(odd, flags)).tofile(f)
+      os.rename(tmp, path)
+    except Exception:
+      os.unlink(tmp)
+      raise
+  return PrimeTable(path, limit)
+
+# Miller-Rabin bases: the 7 bases of Jim Sinclair are deterministic for
+# every n < 2**64, the first 13 primes for n < 3.3 * 10**24
+_SMALL_PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+_BASES_64 = (2, 325, 9375, 28178, 450775, 9780504, 1795265022)
+
+def is_probable_prime(n):
+  '''
+  Returns True if n is prime with Miller-Rabin. The answer is exact for
+  n < 3.3 * 10**24 (which covers every 64-bit n) and a probable prime
+  beyond that.
+  '''
+  if n < 2:
+    return False
+  for p in _SMALL_PRIMES:
+    if n % p == 0:
+      return n == p
+  d, s = n - 1, 0
+  while not d & 1:
+    d >>= 1
+    s += 1
+  for a in (_BASES_64 if n < 1 << 64 else _SMALL_PRIMES):
+    a %= n
+    if a == 0:
+      continue
+    x = pow(a, d, n)
+    if x == 1 or x == n - 1:
+      continue
+    for _ in range(s - 1):
+      x = x * x % n
+      if x == n - 1:
+        break
+    else:
+      return False
+  return True
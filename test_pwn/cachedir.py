@@ -0,0 +1,38 @@
+#!/usr/bin/env python2
+'''
+Points MYPWN_CACHE_DIR to a fresh temporary directory, so tests never
+read nor fill the user's cache.
+'''
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+@contextmanager
+def temp_cache_dir():
+	'''
+	Yields a temporary directory, removed on exit, whose 'cache' subdir is
+	MYPWN_CACHE_DIR meanwhile. The previous MYPWN_CACHE_DIR is restored.
+	'''
+	tmpdir = tempfile.mkdtemp()
+	old_cache_dir = os.environ.get('MYPWN_CACHE_DIR')
+	os.environ['MYPWN_CACHE_DIR'] = os.path.join(tmpdir, 'cache')
+	try:
+		yield tmpdir
+	finally:
+		shutil.rmtree(tmpdir)
+		if old_cache_dir is None:
+			del os.environ['MYPWN_CACHE_DIR']
+		else:
+			os.environ['MYPWN_CACHE_DIR'] = old_cache_dir
+
+class TempCacheDirMixin(object):
+	'''
+	TestCase mixin: every test runs with its own temp_cache_dir(), as
+	self.tmpdir (scratch space) and self.cache_dir (MYPWN_CACHE_DIR).
+	'''
+	def setUp(self):
+		context = temp_cache_dir()
+		self.tmpdir = context.__enter__()
+		self.addCleanup(context.__exit__, None, None, None)
+		self.cache_dir = os.environ['MYPWN_CACHE_DIR']
@@ -0,0 +1,377 @@
+#!/usr/bin/env python2
+import unittest
+import logging
+import os
+import time
+import timeit
+from StringIO import StringIO
+from mypwn.log import *
+from mypwn.log import Logger, Formatter
+
+class _Boom(object):
+	'''Fails the test if anything tries to format it'''
+	def __str__(self):
+		raise AssertionError('formatted a disabled record')
+	__repr__ = __str__
+
+def _make_logger(name, level=logging.INFO, stream=None):
+	'''Returns (Logger, stream) for a fresh logger writing into a StringIO'''
+	if stream is None:
+		stream = StringIO()
+	logger = logging.getLogger(name)
+	logger.propagate = False
+	logger.setLevel(level)
+	handler = TerminalHandler(stream)
+	handler.setFormatter(Formatter())
+	logger.addHandler(handler)
+	return Logger(logger), stream
+
+
+class TestLogger(unittest.TestCase):
+	def test_disabled_level(self):
+		print("\nTesting mypwn.log.Logger disabled levels ...")
+		log, stream = _make_logger('mypwn.test.disabled')
+		log.debug('%s', _Boom())
+		log.setLevel('WARNING')
+		log.info('%s %r', _Boom(), _Boom())
+		log.info_once('%s', _Boom())
+		log.warning_once('%s', 'printed')
+		log.warning_once('%s', 'printed')
+		self.assertEqual(stream.getvalue(), '[!] printed\n')
+
+		# the cache follows level changes made on the stdlib logger
+		logging.getLogger('mypwn.test.disabled').setLevel(logging.DEBUG)
+		log.debug('now %s', 'enabled')
+		self.assertTrue(stream.getvalue().endswith('[DEBUG] now enabled\n'))
+		logging.disable(logging.CRITICAL)
+		try:
+			log.critical('%s', _Boom())
+		finally:
+			logging.disable(logging.NOTSET)
+		print("    OK.")
+
+	def test_lazy(self):
+		print("\nTesting mypwn.log.Lazy ...")
+		log, stream = _make_logger('mypwn.test.lazy')
+		calls = []
+		def expensive(x):
+			calls.append(x)
+			return 'x' * x
+		log.debug('%s', Lazy(expensive, 3))
+		self.assertEqual(calls, [])
+		log.info('%s|%r', Lazy(expensive, 2), Lazy(expensive, 1))
+		self.assertEqual(calls, [2, 1])
+		self.assertEqual(stream.getvalue(), "[*] xx|'x'\n")
+		log.info('a\nb')
+		self.assertTrue(stream.getvalue().endswith('[*] a\n    b\n'))
+		print("    OK.")
+
+
+class _SlowStream(object):
+	def __init__(self, delay=0.01):
+		self.delay = delay
+		self.chunks = []
+	def write(self, data):
+		time.sleep(self.delay)
+		self.chunks.append(data)
+	def flush(self):
+		pass
+	def getvalue(self):
+		return ''.join(self.chunks)
+
+class TestQueuedHandler(unittest.TestCase):
+	def test_queued_handler(self):
+		print("\nTesting mypwn.log.QueuedHandler ...")
+		stream = StringIO()
+		handler = QueuedHandler(stream, batch=8)
+		log = getLogger('mypwn.test.queued', handler=handler)
+		logging.getLogger('mypwn.test.queued').propagate = False
+		for i in range(100):
+			log.info('line %d', i)
+		handler.flush()
+		self.assertEqual(stream.getvalue(),
+		                 ''.join('[*] line %d\n' % i for i in range(100)))
+		self.assertEqual(handler.dropped, 0)
+
+		# a second getLogger() with a handler replaces the first one
+		other = StringIO()
+		log = getLogger('mypwn.test.queued', handler=logging.StreamHandler(other))
+		log.success('direct')
+		# the replaced handler was closed: its writer thread is gone
+		self.assertFalse(handler._thread.is_alive())
+		handler.close()
+		self.assertEqual(other.getvalue(), '[+] direct\n')
+		# passing the attached handler again keeps it open
+		queued = QueuedHandler(StringIO())
+		getLogger('mypwn.test.queued', handler=queued)
+		getLogger('mypwn.test.queued', handler=queued)
+		self.assertTrue(queued._thread.is_alive())
+		queued.close()
+		print("    OK.")
+
+	def test_dropped(self):
+		print("\nTesting mypwn.log.QueuedHandler overflow ...")
+		stream = _SlowStream()
+		handler = QueuedHandler(stream, maxsize=4, batch=2)
+		log = getLogger('mypwn.test.dropped', handler=handler)
+		logging.getLogger('mypwn.test.dropped').propagate = False
+		for i in range(200):
+			log.info('line %d', i)
+		handler.close()
+		lines = stream.getvalue().splitlines()
+		written = [l for l in lines if l.startswith('[*] line')]
+		reports = [int(l.split()[1]) for l in lines if l.endswith('records dropped')]
+		self.assertTrue(handler.dropped > 0)
+		self.assertEqual(sum(reports), handler.dropped)
+		self.assertEqual(len(written) + handler.dropped, 200)
+
+		# several threads overflowing at once, emit() called directly
+		import threading
+		stream = _SlowStream()
+		handler = QueuedHandler(stream, maxsize=4, batch=2)
+		handler.setFormatter(Formatter())
+		record = logging.makeLogRecord({'msg': 'line', 'levelno': logging.INFO,
+		                                'levelname': 'INFO'})
+		threads = [threading.Thread(target=lambda: [handler.emit(record)
+		                                            for _ in range(500)])
+		           for _ in range(4)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+		handler.close()
+		written = [l for l in stream.getvalue().splitlines() if l.endswith('line')]
+		self.assertTrue(handler.dropped > 0)
+		self.assertEqual(len(written) + handler.dropped, 2000)
+		print("    OK.")
+
+
+	def test_write_error(self):
+		print("\nTesting mypwn.log.QueuedHandler write errors ...")
+		class FullDisk(object):
+			def write(self, data):
+				raise IOError(28, 'No space left on device')
+			def flush(self):
+				pass
+		handler = QueuedHandler(FullDisk())
+		errors = []
+		handler.handleError = errors.append
+		log = getLogger('mypwn.test.queued.error', handler=handler)
+		logging.getLogger('mypwn.test.queued.error').propagate = False
+		log.info('lost')
+		handler.close()
+		self.assertEqual([r.getMessage() for r in errors], ['lost'])
+		print("    OK.")
+
+
+class _Terminal(StringIO):
+	def isatty(self):
+		return True
+
+class TestProgress(unittest.TestCase):
+	def test_animated(self):
+		print("\nTesting mypwn.log.Progress on a terminal ...")
+		log, term = _make_logger('mypwn.test.progress', stream=_Terminal())
+		p = log.progress('brute', total=1000, rate=10)
+		self.assertTrue(p.animated)
+		start = time.time()
+		while time.time() - start < 0.35:
+			p.status('trying %d', p.count)
+		redraws = term.getvalue().count('\r\x1b[K[x] brute: trying ')
+		# one right away, then at most 10 per second
+		self.assertTrue(2 <= redraws <= 5, redraws)
+		self.assertTrue('/s, ETA ' in term.getvalue())
+
+		# another record goes above the status line, which is drawn again
+		status = term.getvalue().rsplit('\r\x1b[K', 1)[1]
+		log.info('leak %s', '0x41')
+		self.assertTrue(term.getvalue().endswith('\r\x1b[K[*] leak 0x41\n' + status))
+		# the line is cleared before the last record
+		p.success('found %d', 42)
+		(before, last) = term.getvalue().rsplit('\r\x1b[K', 1)
+		self.assertTrue(before.endswith(status))
+		self.assertTrue(last.startswith('[+] brute: found 42 ('))
+		log.info('after')
+		self.assertTrue(term.getvalue().endswith(')\n[*] after\n'))
+		print("    OK.")
+
+	def test_queued(self):
+		print("\nTesting mypwn.log.Progress through a QueuedHandler ...")
+		term = _Terminal()
+		handler = QueuedHandler(term)
+		log = getLogger('mypwn.test.progress.queued', handler=handler)
+		logging.getLogger('mypwn.test.progress.queued').propagate = False
+		p = log.progress('brute', rate=1000)
+		self.assertTrue(p.animated)
+		p.status('a')
+		log.info('between')
+		p.failure()
+		handler.close()
+		lines = term.getvalue().split('\r\x1b[K')
+		self.assertEqual(len(lines), 4)
+		self.assertTrue(lines[1].startswith('[x] brute: a (1 attempts, '))
+		self.assertEqual(lines[2], '[*] between\n' + lines[1])
+		self.assertTrue(lines[3].startswith('[-] brute: Failed (1 attempts in '))
+		print("    OK.")
+
+	def test_plain(self):
+		print("\nTesting mypwn.log.Progress without a terminal ...")
+		log, stream = _make_logger('mypwn.test.progress.plain')
+		p = log.progress('leak', interval=0.1)
+		self.assertFalse(p.animated)
+		start = time.time()
+		while time.time() - start < 0.25:
+			p.status('%s', 'x')
+		p.failure()
+		lines = stream.getvalue().splitlines()
+		self.assertTrue(2 <= len([l for l in lines if l.startswith('[x] leak: x (')]) <= 4)
+		self.assertTrue(lines[-1].startswith('[-] leak: Failed ('))
+		self.assertFalse('\x1b' in stream.getvalue())
+
+		# nothing is drawn for a disabled level
+		log, term = _make_logger('mypwn.test.progress.quiet', stream=_Terminal())
+		log.setLevel('WARNING')
+		p = log.progress('quiet')
+		p.status('%s', _Boom())
+		p.success()
+		self.assertEqual(term.getvalue(), '')
+		print("    OK.")
+
+
+class TestJsonLinesHandler(unittest.TestCase):
+	def test_json_lines(self):
+		print("\nTesting mypwn.log.JsonLinesHandler ...")
+		import json
+		stream = StringIO()
+		handler = JsonLinesHandler(stream=stream, capacity=3)
+		log = getLogger('mypwn.test.json', handler=handler)
+		logging.getLogger('mypwn.test.json').propagate = False
+		log.success('got %s', 'shell', extra={'target': '10.0.0.1', 'latency': 0.5})
+		log.info('attempt %d', 2, extra={'obj': object()})
+		self.assertEqual(stream.getvalue(), '') # still buffered
+		log.failure('attempt %d', 3)
+		lines = [json.loads(l) for l in stream.getvalue().splitlines()]
+		self.assertEqual(len(lines), 3)
+		first = lines[0]
+		self.assertEqual(first['msg'], 'got shell')
+		self.assertEqual(first['msgtype'], 'success')
+		self.assertEqual(first['level'], 'INFO')
+		self.assertEqual(first['target'], '10.0.0.1')
+		self.assertEqual(first['latency'], 0.5)
+		self.assertEqual(first['process'], os.getpid())
+		self.assertTrue(lines[1]['obj'].startswith('<object object'))
+		self.assertTrue(lines[0]['mono'] <= lines[1]['mono'] <= lines[2]['mono'])
+		self.assertEqual(lines[2]['msgtype'], 'failure')
+
+		# errors are written at once
+		log.warning('w')
+		try:
+			log.error('boom %d', 1)
+		except Exception:
+			pass
+		lines = stream.getvalue().splitlines()
+		self.assertEqual(json.loads(lines[-1])['level'], 'ERROR')
+
+		# extra fields never overwrite the record's own
+		log.info('clash', extra={'time': 1, 'level': 'x', 'mono': 2, 'exc': 3})
+		handler.flush()
+		line = json.loads(stream.getvalue().splitlines()[-1])
+		self.assertEqual(line['level'], 'INFO')
+		self.assertNotEqual(line['time'], 1)
+		self.assertNotEqual(line['mono'], 2)
+		self.assertFalse('exc' in line)
+		self.assertEqual((line['extra_time'], line['extra_level'],
+		                  line['extra_mono'], line['extra_exc']), (1, 'x', 2, 3))
+		print("    OK.")
+
+	def test_binary(self):
+		print("\nTesting mypwn.log.JsonLinesHandler with binary data ...")
+		import json
+		stream = StringIO()
+		handler = JsonLinesHandler(stream=stream, capacity=1)
+		log = getLogger('mypwn.test.json.binary', handler=handler)
+		logging.getLogger('mypwn.test.json.binary').propagate = False
+		handler.handleError = lambda record: self.fail('record dropped')
+		log.info('leak %s', '\xde\xad\xbe\xef',
+		         extra={'leak': 'A\xff', 'leaks': ['\x80', 'ok'], 'text': 'caf\xc3\xa9'})
+		line = json.loads(stream.getvalue())
+		self.assertEqual(line['msg'], 'leak \\xde\\xad\\xbe\\xef')
+		self.assertEqual(line['leak'], 'A\\xff')
+		self.assertEqual(line['leaks'], ['\\x80', 'ok'])
+		self.assertEqual(line['text'], u'caf\xe9')
+		print("    OK.")
+
+	def test_monotonic(self):
+		print("\nTesting mypwn.log._monotonic resolution ...")
+		from mypwn.log import _monotonic
+		start = _monotonic()
+		time.sleep(0.002)
+		elapsed = _monotonic() - start
+		# os.times() would give 0 or 0.01
+		self.assertTrue(0.002 <= elapsed < 0.009, elapsed)
+		print("    OK.")
+
+	def test_rotation(self):
+		print("\nTesting mypwn.log.JsonLinesHandler rotation ...")
+		import gzip
+		import json
+		import shutil
+		import tempfile
+		tmpdir = tempfile.mkdtemp()
+		try:
+			filename = os.path.join(tmpdir, 'run.jsonl')
+			handler = JsonLinesHandler(filename, capacity=1, max_bytes=500,
+			                           backup_count=2)
+			log = getLogger('mypwn.test.json.rotate', handler=handler)
+			logging.getLogger('mypwn.test.json.rotate').propagate = False
+			for i in range(20):
+				log.info('attempt %d', i)
+			handler.close()
+			self.assertEqual(sorted(os.listdir(tmpdir)),
+			                 ['run.jsonl', 'run.jsonl.1.gz', 'run.jsonl.2.gz'])
+			with open(filename) as fd:
+				last = [json.loads(l)['msg'] for l in fd.read().splitlines()]
+			with gzip.open(filename + '.1.gz') as fd:
+				previous = [json.loads(l)['msg'] for l in fd.read().splitlines()]
+			self.assertEqual(int(previous[-1].split()[1]) + 1,
+			                 int(last[0].split()[1]) if last else 20)
+		finally:
+			shutil.rmtree(tmpdir)
+		print("    OK.")
+
+
+class BenchLogger(unittest.TestCase):
+	def _report(self, name, fun, number=100000):
+		best = min(timeit.repeat(fun, number=number, repeat=3))
+		print("    %-32s %8.0f ns/call" % (name, best / number * 1e9))
+
+	def test_bench_overhead(self):
+		print("\nBenchmark mypwn.log per-call overhead ...")
+		log, _ = _make_logger('mypwn.test.bench')
+		raw = logging.getLogger('mypwn.test.bench')
+		self._report("logging.Logger.debug (disabled)", lambda: raw.debug('%d', 1))
+		self._report("Logger.debug (disabled)", lambda: log.debug('%d', 1))
+		self._report("Logger.info_once (disabled)",
+		             lambda: log.info_once('%d', 1), number=10000)
+		self._report("Logger.info (enabled)", lambda: log.info('%d', 1),
+		             number=10000)
+		self._report("logging.Logger.info (enabled)", lambda: raw.info('%d', 1),
+		             number=10000)
+
+		log, _ = _make_logger('mypwn.test.bench.progress', stream=_Terminal())
+		p = log.progress('bench')
+		self._report("Progress.status (throttled)", lambda: p.status('%d', 1))
+
+		# a stream as slow as a busy terminal
+		for (name, handler) in (
+				('StreamHandler', logging.StreamHandler(_SlowStream(0.0001))),
+				('QueuedHandler', QueuedHandler(_SlowStream(0.0001), maxsize=0))):
+			slow = getLogger('mypwn.test.bench.' + name, handler=handler)
+			logging.getLogger('mypwn.test.bench.' + name).propagate = False
+			self._report("Logger.info (slow %s)" % name,
+			             lambda: slow.info('%d', 1), number=2000)
+			handler.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
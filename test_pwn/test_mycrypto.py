@@ -2,6 +2,26 @@
 import unittest
 from mypwn.mycrypto import *
 from base64 import b64encode, b64decode
+import os
+import time
+from mypwn import mycache
+from cachedir import TempCacheDirMixin
+
+# two 256-bit primes used to build test keys
+_P = 0x9e2feb89414c343c1027c4d1c386bbc4cd613e30d8f16adf91b7584a2265b227
+_Q = 0xb5bf992dc9e9c616612e7696a6cecc1b78e510617311d8a3c2ce6f447ed4d64b
+
+def _make_wiener_keys(count, small_d=True):
+    '''Returns list of (e, n, d), d is small enough for Wiener when small_d'''
+    n = _P * _Q
+    phi = (_P - 1) * (_Q - 1)
+    keys = []
+    d = (2**100 if small_d else 2**400) + 1
+    while len(keys) < count:
+        if RSACipher.gcd(d, phi) == 1:
+            keys.append((int(RSACipher.mod_inverse(d, phi)), n, d))
+        d += 2
+    return keys
 
 class TestRSACipher(unittest.TestCase):
     def test_bit_length(self):
@@ -112,6 +132,170 @@ class TestRSACipher(unittest.TestCase):
     	    result = RSACipher.chinese_remainder(a, b)
     	    self.assertEqual(result, solution)
 
+    	# same exceptions with and without gmpy2
+    	self.assertRaises(ValueError, RSACipher.chinese_remainder, (6, 4), (1, 3))
+    	self.assertRaises(ValueError, RSACipher.crt_coefficients, (3, 5, 9))
+    	self.assertRaises(ValueError, RSACipher.mod_inverse, 2, 4)
+
+    def test_hastad_broadcast_attack(self):
+        from Crypto.Util.number import getPrime
+        print("\nTesting RSACipher.hastad_broadcast_attack() ...")
+        e = 3
+        N = [getPrime(256) * getPrime(256) for _ in range(5)]
+        messages = [int(os.urandom(40).encode('hex'), 16)
+                    for _ in range(3)]
+        C_sets = [[pow(m, e, n) for n in N] for m in messages]
+
+        # exactly e pairs, and more pairs than e
+        self.assertEqual(RSACipher.hastad_broadcast_attack(N[:e], C_sets[0][:e]),
+                         messages[0])
+        self.assertEqual(RSACipher.hastad_broadcast_attack(N, C_sets[0], e),
+                         messages[0])
+
+        # a set that is not a broadcast of one message is reported as None
+        C_sets.append([pow(m, e, n) for (m, n) in zip(messages, N)] + C_sets[0][3:])
+        result = list(RSACipher.hastad_broadcast_attack_batch(N, C_sets, e))
+        self.assertEqual(result, messages + [None])
+
+    def test_fermat_factor(self):
+        from Crypto.Util.number import getPrime, isPrime
+        print("\nTesting RSACipher.fermat_factor() ...")
+        self.assertEqual(RSACipher.fermat_factor(5959), (59, 101))
+        self.assertEqual(RSACipher.fermat_factor(1997**2), (1997, 1997))
+        self.assertEqual(RSACipher.fermat_factor(2 * 1997), (2, 1997))
+        self.assertEqual(RSACipher.fermat_factor(4), (2, 2))
+        self.assertEqual(RSACipher.fermat_factor(9), (3, 3))
+        # no nontrivial factors
+        for n in (1, 2, 3, 5, 1997, 1000003):
+            self.assertEqual(RSACipher.fermat_factor(n), None)
+        for n in (0, -15):
+            self.assertRaises(ValueError, RSACipher.fermat_factor, n)
+
+        moduli, expected = [], []
+        for gap in (2**100, 2**258, 2**262):
+            p = getPrime(512)
+            q = p + gap
+            while not isPrime(q):
+                q += 2
+            moduli.append(p * q)
+            expected.append((p, q))
+        for (n, factors) in zip(moduli, expected):
+            self.assertEqual(RSACipher.fermat_factor(n), factors)
+        # far apart primes are out of reach
+        n = getPrime(512) * getPrime(512)
+        self.assertEqual(RSACipher.fermat_factor(n, 1000), None)
+
+        moduli.append(n)
+        result = dict(RSACipher.fermat_factor_batch(moduli, 100000,
+                                                    processes=2, chunksize=1))
+        self.assertEqual([result[i] for i in range(len(moduli))],
+                         expected + [None])
+
+    def test_factor(self):
+        from Crypto.Util.number import getPrime, isPrime
+        print("\nTesting RSACipher.factor() ...")
+        # testcases: each is a tuple (n, factors) where factor(n) = factors
+        testcases = [
+            (1, []),
+            (97, [97]),
+            (3 * 10007**2, [3, 10007, 10007]),
+            (2**4 * 3 * 1000003 * 1000033, [2, 2, 2, 2, 3, 1000003, 1000033]),
+        ]
+        for n, factors in testcases:
+            self.assertEqual(RSACipher.factor(n), factors)
+        self.assertRaises(ValueError, RSACipher.factor, 0)
+        self.assertRaises(ValueError, RSACipher.factor, -12)
+
+        # p-1 is smooth: Pollard p-1
+        p = 2
+        while not (p.bit_length() > 256 and isPrime(p + 1)):
+            p = 2 if p.bit_length() > 256 else p * getPrime(16)
+        p, q = p + 1, getPrime(256)
+        self.assertEqual(RSACipher.factor(p * q), sorted([p, q]))
+
+        # medium sized factors: Brent rho
+        factors = sorted([getPrime(32), getPrime(32), getPrime(128)])
+        self.assertEqual(RSACipher.factor(factors[0] * factors[1] * factors[2]),
+                         factors)
+
+        # out of reach in the time budget, n is given back unfactored
+        n = getPrime(256) * getPrime(256)
+        start = time.time()
+        self.assertEqual(RSACipher.factor(n, timeout=0.5), [n])
+        self.assertLess(time.time() - start, 2)
+
+    def test_lll_reduce(self):
+        from fractions import Fraction
+        from Crypto.Util.number import getPrime, getRandomNBitInteger
+        print("\nTesting RSACipher.lll_reduce() ...")
+        self.assertEqual(RSACipher.lll_reduce([[1, 1, 1], [-1, 0, 2], [3, 5, 6]]),
+                         [[0, 1, 0], [1, 0, 1], [-1, 0, 2]])
+        self.assertEqual(RSACipher.lll_reduce([[5, 7]]), [[5, 7]])
+
+        def is_reduced(b, delta):
+            # exact Gram-Schmidt over the rationals
+            dot = lambda u, v: sum(Fraction(x) * y for (x, y) in zip(u, v))
+            bstar, mu = [], [[0] * len(b) for _ in b]
+            for i in range(len(b)):
+                v = [Fraction(x) for x in b[i]]
+                for j in range(i):
+                    mu[i][j] = dot(b[i], bstar[j]) / dot(bstar[j], bstar[j])
+                    v = [x - mu[i][j] * y for (x, y) in zip(v, bstar[j])]
+                bstar.append(v)
+            for i in range(1, len(b)):
+                if any(abs(mu[i][j]) > Fraction(1, 2) for j in range(i)):
+                    return False
+                if (dot(bstar[i], bstar[i]) < (Fraction(delta) - mu[i][i - 1]**2)
+                        * dot(bstar[i - 1], bstar[i - 1])):
+                    return False
+            return True
+
+        # low density knapsack: the planted 0/1 solution is found
+        size = 12
+        weights = [getRandomNBitInteger(256) for _ in range(size)]
+        solution = [int(x) for x in bin(getRandomNBitInteger(size))[2:]]
+        target = sum(w * x for (w, x) in zip(weights, solution))
+        basis = [[int(i == j) for j in range(size)] + [w]
+                 for (i, w) in enumerate(weights)]
+        basis.append([0] * size + [-target])
+        reduced = RSACipher.lll_reduce(basis)
+        self.assertTrue(is_reduced(reduced, Fraction(99, 100)))
+        self.assertTrue(any(row == solution + [0] or
+                            row == [-x for x in solution] + [0]
+                            for row in reduced))
+
+        # the lattice of a Coppersmith attack, entries of a few thousand bits
+        n = getPrime(512) * getPrime(512)
+        basis = [[n * i + j + 1 if i == j else (i * j + 7) * n // 3 ** j
+                  for j in range(6)] for i in range(6)]
+        self.assertTrue(is_reduced(RSACipher.lll_reduce(basis, 0.75),
+                                   Fraction(3, 4)))
+
+    def test_stereotyped_message_attack(self):
+        from Crypto.Util.number import getPrime
+        print("\nTesting RSACipher.stereotyped_message_attack() ...")
+        e = 3
+        while True:
+            p, q = getPrime(512), getPrime(512)
+            if RSACipher.gcd((p - 1) * (q - 1), e) == 1:
+                break
+        n = p * q
+        prefix = 'The secret key is: '
+        for unknown_bits in (64, 200, 250):
+            secret = int(os.urandom(unknown_bits // 8).encode('hex'), 16)
+            m = (int(prefix.encode('hex'), 16) << unknown_bits) + secret
+            c = pow(m, e, n)
+            self.assertEqual(RSACipher.stereotyped_message_attack(
+                n, e, c, prefix, unknown_bits), m)
+            self.assertEqual(RSACipher.stereotyped_message_attack(
+                n, e, c, m >> unknown_bits, unknown_bits), m)
+            # a wrong prefix gives nothing
+            self.assertEqual(RSACipher.stereotyped_message_attack(
+                n, e, c, 'The secret key was: ', unknown_bits), None)
+        # beyond log2(n) / e no lattice can do it
+        self.assertRaises(ValueError, RSACipher.stereotyped_message_attack,
+                          n, e, 1, prefix, 400)
+
     def test_perfectSqrt(self):
         from mypwn.mycrypto import _perfectSqrt
         print("\nTesting _perfectSqrt() ...")
@@ -133,6 +317,170 @@ class TestRSACipher(unittest.TestCase):
             result = _perfectSqrt(x)
             self.assertEqual(result, solution)
 
+    def test_wiener_attack(self):
+        print("\nTesting RSACipher.wiener_attack() ...")
+        self.assertEqual(RSACipher.wiener_attack(17993, 90581), 5)
+        for (e, n, d) in _make_wiener_keys(3):
+            self.assertEqual(RSACipher.wiener_attack(e, n), d)
+        for (e, n, d) in _make_wiener_keys(3, small_d=False):
+            self.assertEqual(RSACipher.wiener_attack(e, n), -1)
+
+    def test_wiener_attack_extended(self):
+        print("\nTesting RSACipher.wiener_attack_extended() ...")
+        for (e, n, d) in _make_wiener_keys(2):
+            self.assertEqual(RSACipher.wiener_attack_extended(e, n, 0), d)
+        # d a little above n**(1/4): out of reach of the plain attack
+        n = _P * _Q
+        phi = (_P - 1) * (_Q - 1)
+        for d in (2**130 + 1, 2**130 + 3, 2**130 + 7):
+            e = int(RSACipher.mod_inverse(d, phi))
+            self.assertEqual(RSACipher.wiener_attack(e, n), -1)
+            self.assertEqual(RSACipher.wiener_attack_extended(e, n, 0), -1)
+            for processes in (1, 2):
+                self.assertEqual(RSACipher.wiener_attack_extended(
+                    e, n, 16, processes=processes), d)
+        for (e, n, d) in _make_wiener_keys(2, small_d=False):
+            self.assertEqual(RSACipher.wiener_attack_extended(e, n, 4), -1)
+
+    def test_wiener_attack_batch(self):
+        print("\nTesting RSACipher.wiener_attack_batch() ...")
+        keys = _make_wiener_keys(4) + _make_wiener_keys(4, small_d=False)
+        solution = [(i, d if i < 4 else None)
+                    for (i, (_, _, d)) in enumerate(keys)]
+        pairs = [(e, n) for (e, n, _) in keys]
+        for processes in (1, 2, None):
+            result = RSACipher.wiener_attack_batch(pairs, processes=processes,
+                                                   chunksize=2)
+            self.assertEqual(sorted(result), solution)
+        # a batch this small only goes to the pool below the threshold
+        import mypwn.mycrypto
+        threshold = mypwn.mycrypto._WIENER_POOL_MIN_KEYS
+        mypwn.mycrypto._WIENER_POOL_MIN_KEYS = 2
+        try:
+            result = RSACipher.wiener_attack_batch(iter(pairs), processes=2,
+                                                   chunksize=2)
+            self.assertEqual(sorted(result), solution)
+        finally:
+            mypwn.mycrypto._WIENER_POOL_MIN_KEYS = threshold
+
+        lines = ['# e n', ''] + ['0x%x, %d' % key for key in pairs]
+        result = RSACipher.wiener_attack_batch(
+            RSACipher.read_keys(lines), processes=1)
+        self.assertEqual(sorted(result), solution)
+
+    def test_batch_gcd(self):
+        print("\nTesting RSACipher.batch_gcd() ...")
+        # test cases: each entry is a tuple
+        #   (moduli, gcds) where gcds[i] = gcd(moduli[i], prod(others))
+        testcases = [
+            ((15, 21, 11*13), [3, 3, 1]),
+            ((35,), [1]),
+            ((1009*1013, 1019*1021, 1009*1031, 1033*1039, 1019*1013),
+             [1009*1013, 1019, 1009, 1, 1019*1013]),
+            ((_P*_Q, _P*1031, _Q*1033, 1039*1021),
+             [_P*_Q, _P, _Q, 1]),
+        ]
+        for moduli, solution in testcases:
+            self.assertEqual(RSACipher.batch_gcd(moduli), solution)
+            for chunk_size in (1, 2, 3):
+                result = RSACipher.batch_gcd(moduli, chunk_size=chunk_size)
+                self.assertEqual(result, solution)
+            result = RSACipher.batch_gcd(moduli, chunk_size=2, processes=2)
+            self.assertEqual(result, solution)
+
+
+class BenchRSACipher(unittest.TestCase):
+    def test_bench_wiener_attack_batch(self):
+        print("\nBenchmark RSACipher.wiener_attack_batch() ...")
+        keys = [(e, n) for (e, n, _) in _make_wiener_keys(200, small_d=False)]
+
+        start = time.time()
+        for (e, n) in keys:
+            RSACipher.wiener_attack(e, n)
+        single = len(keys) / (time.time() - start)
+
+        start = time.time()
+        for _ in RSACipher.wiener_attack_batch(keys):
+            pass
+        batch = len(keys) / (time.time() - start)
+
+        # past the threshold, on a pool when there are several CPUs
+        keys = keys * 10
+        start = time.time()
+        for _ in RSACipher.wiener_attack_batch(keys):
+            pass
+        large = len(keys) / (time.time() - start)
+        print("    wiener_attack loop: %10.1f keys/sec" % single)
+        print("    wiener_attack_batch: %9.1f keys/sec" % batch)
+        print("    wiener_attack_batch, %d keys: %9.1f keys/sec"
+              % (len(keys), large))
+
+    def test_bench_wiener_attack_extended(self):
+        from Crypto.Util.number import getPrime
+        print("\nBenchmark RSACipher.wiener_attack_extended() ...")
+        keys = []
+        while len(keys) < 10:
+            p, q = getPrime(256), getPrime(256)
+            phi = (p - 1) * (q - 1)
+            d = int(os.urandom(17).encode('hex'), 16) >> 3 | 1 << 132 | 1
+            if RSACipher.gcd(d, phi) == 1:
+                keys.append((int(RSACipher.mod_inverse(d, phi)), p * q, d))
+        for radius in (4, 16, 64):
+            start = time.time()
+            found = sum(RSACipher.wiener_attack_extended(e, n, radius) == d
+                        for (e, n, d) in keys)
+            print("    radius %2d: %2d/%d keys (133-bit d), %7.3f sec/key"
+                  % (radius, found, len(keys), (time.time() - start) / len(keys)))
+
+    def test_bench_fermat_factor(self):
+        from mypwn.mycrypto import _iSqrt, _perfectSqrt
+        from Crypto.Util.number import getPrime
+        print("\nBenchmark RSACipher.fermat_factor() ...")
+        n = getPrime(512) * getPrime(512)
+        iterations = 200000
+
+        start = time.time()
+        a = _iSqrt(n) + 1
+        for i in range(iterations):
+            x = a + i
+            if _perfectSqrt(x * x - n) != -1:
+                break
+        plain = iterations / (time.time() - start)
+
+        start = time.time()
+        RSACipher.fermat_factor(n, iterations)
+        sieved = iterations / (time.time() - start)
+
+        moduli = [getPrime(512) * getPrime(512) for _ in range(32)]
+        start = time.time()
+        for _ in RSACipher.fermat_factor_batch(moduli, iterations):
+            pass
+        batch = len(moduli) * iterations / (time.time() - start)
+        print("    _perfectSqrt loop:    %12.1f candidates/sec" % plain)
+        print("    fermat_factor:        %12.1f candidates/sec" % sieved)
+        print("    fermat_factor_batch:  %12.1f candidates/sec" % batch)
+
+    def test_bench_lll_reduce(self):
+        from Crypto.Util.number import getPrime, getRandomNBitInteger
+        print("\nBenchmark RSACipher.lll_reduce() ...")
+        for size in (10, 20, 30, 40, 50, 59):
+            weights = [getRandomNBitInteger(2048) for _ in range(size)]
+            basis = [[int(i == j) for j in range(size)] + [w]
+                     for (i, w) in enumerate(weights)]
+            start = time.time()
+            RSACipher.lll_reduce(basis)
+            print("    knapsack, 2048-bit, dim %2d:   %8.3f sec"
+                  % (size + 1, time.time() - start))
+
+        n = getPrime(512) * getPrime(512)
+        m = int(os.urandom(127).encode('hex'), 16)
+        for unknown_bits in (200, 250, 280):
+            start = time.time()
+            RSACipher.stereotyped_message_attack(
+                n, 3, pow(m, 3, n), m >> unknown_bits, unknown_bits)
+            print("    stereotyped, %d unknown bits: %8.3f sec"
+                  % (unknown_bits, time.time() - start))
+
 
 class TestAESCipher(unittest.TestCase):
     def test_ECB_AES(self):
@@ -157,6 +505,146 @@ class TestAESCipher(unittest.TestCase):
 
         self.assertEqual(solution, plain)
 
+    def test_stream_AES(self):
+        print("\nTesting AES encrypt_stream/decrypt_stream ...")
+        from io import BytesIO
+        key = b64decode('r7y1dhmTvjQrcra7A1UQFw==')
+        ciphertext = 'mU5Hq6nHEy1VHvz1q9s55x+/oGDzOaNSj/6pB3KXYla+YG60wXUNBHfmRJEzc6GczmaTIzD9Yd87K5elPG/oVA=='
+        cbc_cipher = AESCipher(key=key, mode=AESCipher.MODE_CBC)
+        dst = BytesIO()
+        cbc_cipher.decrypt_stream(BytesIO(ciphertext), dst, chunk_size=64)
+        self.assertEqual(dst.getvalue(), r'flag{do_not_let_machines_win_6a68a292}')
+
+        for mode in (AESCipher.MODE_ECB, AESCipher.MODE_CBC):
+            cipher = AESCipher(key=key, mode=mode)
+            for size in (0, 1, 15, 16, 17, 47, 48, 49, 200, 1000):
+                plain = ''.join(chr(i % 251) for i in range(size))
+                for chunk_size in (48, 100, 1 << 20):
+                    for src in (plain, bytearray(plain), BytesIO(plain)):
+                        enc = BytesIO()
+                        cipher.encrypt_stream(src, enc, chunk_size)
+                        self.assertEqual(cipher.decrypt(enc.getvalue()), plain)
+
+                        dec = BytesIO()
+                        src = memoryview(enc.getvalue())
+                        cipher.decrypt_stream(src, dec, chunk_size)
+                        self.assertEqual(dec.getvalue(), plain)
+
+                    dec = BytesIO()
+                    cipher.decrypt_stream(BytesIO(cipher.encrypt(plain)), dec,
+                                          chunk_size)
+                    self.assertEqual(dec.getvalue(), plain)
+
+
+class TestChecksum(TempCacheDirMixin, unittest.TestCase):
+    def test_scan(self):
+        print("\nTesting Checksum.scan() ...")
+        import hashlib
+        tree = os.path.join(self.tmpdir, 'tree')
+        os.makedirs(os.path.join(tree, 'sub'))
+        contents = {
+            os.path.join(tree, 'empty'): b'',
+            os.path.join(tree, 'small'): b'mypwn' * 100,
+            os.path.join(tree, 'sub', 'big'): os.urandom(3 * 4096 + 7),
+        }
+        for (path, data) in contents.items():
+            with open(path, 'wb') as fd:
+                fd.write(data)
+
+        def solution(algorithms):
+            return dict((path, dict((a, hashlib.new(a, data).hexdigest())
+                                    for a in algorithms))
+                        for (path, data) in contents.items())
+
+        # every file actually read goes through _hash_file
+        hashed = []
+        hash_file = Checksum.__dict__['_hash_file']
+        def counting(filename, *args):
+            hashed.append(filename)
+            if nested:
+                # another scan stores its digests while this one hashes
+                Checksum.scan(nested.pop())
+            return hash_file.__func__(filename, *args)
+        nested = []
+        Checksum._hash_file = staticmethod(counting)
+        self.addCleanup(setattr, Checksum, '_hash_file', hash_file)
+        def scan(*args, **kwargs):
+            del hashed[:]
+            result = Checksum.scan(*args, **kwargs)
+            return (result, sorted(hashed))
+
+        # mmap_threshold=4096 sends the big file through mmap
+        result = Checksum.scan([tree], block_size=4096, mmap_threshold=4096)
+        self.assertEqual(result, solution(('sha256', 'sha1', 'md5')))
+        self.assertEqual(len(hashed), 3)
+        # served from the cache, no file is read
+        self.assertEqual(scan(tree), (result, []))
+        self.assertEqual(scan(tree, algorithms=('md5', 'sha512')),
+                         (solution(('md5', 'sha512')), sorted(contents)))
+        # the new digests were merged with the old ones
+        self.assertEqual(scan(tree, algorithms=('sha1', 'sha512')),
+                         (solution(('sha1', 'sha512')), []))
+
+        path = os.path.join(tree, 'small')
+        contents[path] = b'changed'
+        with open(path, 'wb') as fd:
+            fd.write(contents[path])
+        self.assertEqual(scan(tree, cache=False),
+                         (solution(('sha256', 'sha1', 'md5')), sorted(contents)))
+        self.assertEqual(scan(tree), (solution(('sha256', 'sha1', 'md5')), [path]))
+
+        # concurrent scans: neither loses the other's entries
+        other = os.path.join(self.tmpdir, 'other')
+        os.makedirs(other)
+        for name in ('a', 'b'):
+            with open(os.path.join(other, name), 'wb') as fd:
+                fd.write(name)
+        os.utime(path, (0, 0))
+        nested.append(other)
+        self.assertEqual(scan(tree)[1], sorted([path, os.path.join(other, 'a'),
+                                                os.path.join(other, 'b')]))
+        self.assertEqual(scan([tree, other])[1], [])
+
+        # past the limit, deleted files go first, then the oldest entries
+        os.remove(os.path.join(other, 'a'))
+        old_limit = mycache.FILES_LIMIT
+        mycache.FILES_LIMIT = 4
+        try:
+            with open(os.path.join(other, 'c'), 'wb') as fd:
+                fd.write('c')
+            scan(other)
+        finally:
+            mycache.FILES_LIMIT = old_limit
+        cached = mycache.load_files(Checksum._CACHE_NAME)
+        self.assertEqual(len(cached), 3)
+        self.assertFalse(os.path.join(other, 'a') in cached)
+        self.assertTrue(os.path.join(other, 'c') in cached)
+
+    def test_scan_unreadable(self):
+        print("\nTesting Checksum.scan() on unreadable files ...")
+        import hashlib
+        tree = os.path.join(self.tmpdir, 'tree')
+        os.makedirs(tree)
+        for name in ('a', 'gone'):
+            with open(os.path.join(tree, name), 'wb') as fd:
+                fd.write(name)
+        os.symlink(os.path.join(tree, 'missing'), os.path.join(tree, 'dangling'))
+
+        # 'gone' is deleted between os.stat() and reading it
+        hash_file = Checksum.__dict__['_hash_file']
+        def deleting(filename, *args):
+            if filename.endswith('gone'):
+                os.remove(filename)
+            return hash_file.__func__(filename, *args)
+        Checksum._hash_file = staticmethod(deleting)
+        self.addCleanup(setattr, Checksum, '_hash_file', hash_file)
+
+        path = os.path.join(tree, 'a')
+        solution = {path: {'md5': hashlib.md5('a').hexdigest()}}
+        self.assertEqual(Checksum.scan(tree, algorithms=('md5',)), solution)
+        self.assertEqual(list(mycache.load_files(Checksum._CACHE_NAME)), [path])
+        print("    OK.")
+
 
 if __name__ == '__main__':
 	unittest.main()
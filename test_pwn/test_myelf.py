@@ -0,0 +1,218 @@
+#!/usr/bin/env python2
+import unittest
+import os
+import re
+import shutil
+import subprocess
+import time
+from struct import pack
+from mypwn import mycache
+from mypwn.myelf import *
+from cachedir import TempCacheDirMixin, temp_cache_dir
+
+def _make_elf(path, bits, endian):
+	'''
+	Writes a minimal ELF with .symtab (target, a local and an undefined
+	symbol) and a relocation section patching the .got slot of exit.
+	'''
+	order = '<' if endian == 'little' else '>'
+	word = 'I' if bits == 32 else 'Q'
+	shstrtab = '\0.shstrtab\0.strtab\0.symtab\0.got\0.rel.got\0'
+	strtab = '\0target\0counter\0exit\0'
+	if bits == 32:
+		sym = lambda name, value, info, shndx: pack(order + 'IIIBBH',
+				name, value, 4, info, 0, shndx)
+		rel = pack(order + 'II', 0x1008, 3 << 8 | 7)
+	else:
+		sym = lambda name, value, info, shndx: pack(order + 'IBBHQQ',
+				name, info, 0, shndx, value, 8)
+		rel = pack(order + 'QQ', 0x1008, 3 << 32 | 7)
+	symtab = (sym(0, 0, 0, 0) + sym(1, 0x2000, 0x11, 4)
+			+ sym(8, 0x2010, 0x01, 4) + sym(16, 0, 0x12, 0))
+	got = '\0' * 16
+	blobs = [shstrtab, strtab, symtab, got, rel]
+	ehsize = 52 if bits == 32 else 64
+	offsets = []
+	offset = ehsize
+	for blob in blobs:
+		offsets.append(offset)
+		offset += len(blob)
+	shoff = offset
+	# (name, type, flags, addr, link, entsize)
+	headers = [
+		(0, 0, 0, 0, 0, 0),
+		(1, 3, 0, 0, 0, 0),
+		(11, 3, 0, 0, 0, 0),
+		(19, 2, 0, 0, 2, len(symtab) // 4),
+		(27, 1, 3, 0x1000, 0, 0),
+		(32, 9, 2, 0, 3, len(rel)),
+	]
+	shfmt = order + ('IIIIIIIIII' if bits == 32 else 'IIQQQQIIQQ')
+	sections = ''
+	for (i, (name, type, flags, addr, link, entsize)) in enumerate(headers):
+		size = len(blobs[i - 1]) if i else 0
+		sections += pack(shfmt, name, type, flags, addr,
+				offsets[i - 1] if i else 0, size, link, 0, 1, entsize)
+	ident = '\x7fELF' + chr(bits // 32) + chr(1 if endian == 'little' else 2) + '\x01'
+	header = ident.ljust(16, '\0') + pack(order + 'HHI' + word * 3 + 'IHHHHHH',
+			2, 62, 1, 0x400000, 0, shoff, 0, ehsize, 0, 0,
+			len(sections) // len(headers), len(headers), 1)
+	with open(path, 'wb') as fd:
+		fd.write(header + ''.join(blobs) + sections)
+
+def _has_tools():
+	try:
+		subprocess.check_output(['gcc', '--version'])
+		subprocess.check_output(['readelf', '--version'])
+		subprocess.check_output(['objdump', '--version'])
+	except (OSError, subprocess.CalledProcessError):
+		return False
+	return True
+
+class TestMyElf(TempCacheDirMixin, unittest.TestCase):
+	def test_classes(self):
+		print("\nTesting mypwn.myelf.ELF 32/64-bit, little/big endian ...")
+		for bits in (32, 64):
+			for endian in ('little', 'big'):
+				path = os.path.join(self.tmpdir, 'elf%d%s' % (bits, endian))
+				_make_elf(path, bits, endian)
+				with ELF(path, cache=False) as elf:
+					self.assertEqual((elf.bits, elf.endian), (bits, endian))
+					self.assertEqual(elf.entry, 0x400000)
+					self.assertEqual(elf.arch, 'x64')
+					self.assertEqual([sec.name for sec in elf.sections],
+							['', '.shstrtab', '.strtab', '.symtab', '.got', '.rel.got'])
+					self.assertEqual(elf.get_section('.got').addr, 0x1000)
+					self.assertEqual(elf.section_data('.got'), '\0' * 16)
+					self.assertEqual(elf.get_section('.text'), None)
+					self.assertEqual(elf.symbols, {'target': 0x2000, 'counter': 0x2010})
+					self.assertEqual(elf.got, {'exit': 0x1008})
+					self.assertEqual(elf.plt, {})
+		print("    OK.")
+
+	def test_not_elf(self):
+		print("\nTesting mypwn.myelf.ELF on other files ...")
+		for data in ('', '#!/bin/sh\n', '\x7fELF' + '\x03' * 12):
+			path = os.path.join(self.tmpdir, 'notelf')
+			with open(path, 'wb') as fd:
+				fd.write(data)
+			self.assertRaises(ValueError, ELF, path)
+		print("    OK.")
+
+	def test_cache(self):
+		import mypwn.myelf
+		print("\nTesting mypwn.myelf.ELF on-disk index ...")
+		def fail(*args):
+			raise AssertionError('index rebuilt')
+		path = os.path.join(self.tmpdir, 'elf')
+		_make_elf(path, 64, 'little')
+		elf = ELF(path)
+		self.assertEqual(elf.got, {'exit': 0x1008})
+		self.assertEqual(sorted(os.listdir(self.cache_dir)),
+				['elf-1-%s.index' % elf.sha256, 'elf-hashes-2', 'elf-hashes-2.lock'])
+		elf.close()
+
+		# unchanged file: neither hashed nor parsed again
+		hashlib = mypwn.myelf.hashlib
+		mypwn.myelf.hashlib = None
+		try:
+			elf = ELF(path)
+			elf._build_index = fail
+			self.assertEqual(elf.got, {'exit': 0x1008})
+			elf.close()
+		finally:
+			mypwn.myelf.hashlib = hashlib
+
+		# a copy has the same hash: the index is loaded, not rebuilt
+		copy = os.path.join(self.tmpdir, 'copy')
+		shutil.copy(path, copy)
+		elf = ELF(copy)
+		elf._build_index = fail
+		self.assertEqual(elf.symbols, {'target': 0x2000, 'counter': 0x2010})
+		self.assertEqual(elf.got, {'exit': 0x1008})
+		elf.close()
+
+		# hashes of files that are gone are dropped past the limit
+		old_limit = mycache.FILES_LIMIT
+		mycache.FILES_LIMIT = 1
+		try:
+			os.remove(path)
+			other = os.path.join(self.tmpdir, 'other')
+			_make_elf(other, 32, 'big')
+			ELF(other).sha256
+		finally:
+			mycache.FILES_LIMIT = old_limit
+		self.assertEqual(sorted(mycache.load_files('elf-hashes-2')), [other])
+		print("    OK.")
+
+	@unittest.skipUnless(_has_tools(), 'needs gcc, readelf and objdump')
+	def test_compiled(self):
+		print("\nTesting mypwn.myelf.ELF against readelf/objdump ...")
+		source = os.path.join(self.tmpdir, 'format.c')
+		with open(source, 'w') as fd:
+			fd.write('#include <stdio.h>\n#include <stdlib.h>\n'
+				'int target;\nstatic int hidden = 3;\n'
+				'int main() { printf("%d", target + hidden); puts("");'
+				' exit(0); }\n')
+		for flags in ([], ['-no-pie'], ['-fcf-protection=none'], ['-Wl,-z,now']):
+			binary = os.path.join(self.tmpdir, 'format')
+			subprocess.check_call(['gcc'] + flags + [source, '-o', binary])
+			elf = ELF(binary, cache=False)
+
+			relocs = subprocess.check_output(['readelf', '-W', '-r', binary])
+			got = dict((m.group(2), int(m.group(1), 16)) for m in re.finditer(
+				r'^([0-9a-f]+)\s+\S+\s+R_X86_64_(?:JUMP_SLO|GLOB_DA)T\s+\S+\s+(\w+)',
+				relocs, re.M))
+			self.assertEqual(elf.got, got)
+			self.assertTrue('exit' in elf.got and 'puts' in elf.got)
+
+			code = subprocess.check_output(['objdump', '-d', binary])
+			plt = dict((m.group(2), int(m.group(1), 16)) for m in re.finditer(
+				r'^([0-9a-f]+) <(\w+)@plt>:', code, re.M))
+			self.assertEqual(elf.plt, plt)
+
+			syms = subprocess.check_output(['readelf', '-W', '-s', binary])
+			for name in ('main', 'target', 'hidden'):
+				value = re.search(r'\s([0-9a-f]+)\s+\d+\s+\w+\s+\w+\s+\w+\s+\d+\s+%s$' % name,
+					syms, re.M).group(1)
+				self.assertEqual(elf.symbols[name], int(value, 16))
+			elf.close()
+		print("    OK.")
+
+
+class BenchMyElf(unittest.TestCase):
+	def test_bench_index(self):
+		libc = '/lib/x86_64-linux-gnu/libc.so.6'
+		if not os.path.exists(libc):
+			return
+		print("\nBenchmark mypwn.myelf.ELF on libc ...")
+		with temp_cache_dir():
+			start = time.time()
+			ELF(libc).symbols
+			built = time.time() - start
+
+			start = time.time()
+			elf = ELF(libc)
+			symbols = elf.symbols
+			cached = time.time() - start
+
+			names = list(symbols) * 10
+			start = time.time()
+			for name in names:
+				symbols[name]
+			lookup = (time.time() - start) / len(names)
+			elf.close()
+
+			start = time.time()
+			try:
+				subprocess.check_output(['nm', '-D', '--defined-only', libc])
+				nm = '%8.3f sec' % (time.time() - start)
+			except OSError:
+				nm = 'n/a'
+			print("    first open, index built:  %8.3f sec" % built)
+			print("    next open, index cached:  %8.3f sec" % cached)
+			print("    symbols[name]:            %8.1f ns" % (lookup * 1e9))
+			print("    nm -D --defined-only:     %s" % nm)
+
+if __name__ == '__main__':
+	unittest.main()
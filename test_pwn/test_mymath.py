@@ -1,14 +1,16 @@
 #!/usr/bin/env python2
 import unittest
+import timeit
+from array import array
 from mypwn.mymath import *
 
 class TestMyMath(unittest.TestCase):
 	def test_Checksum(self):
 		print("\nTesting mypwn.mymath.Checksum class ...")
 		filepath = '../LICENSE'
-		LICENSE_sha256 = '83915bf9601d28b10378f57d17e47b686e5d584979ebba50ef6eb5ac3d2b654a'
-		LICENSE_sha1   = 'b412883eb74a0bb7cd2aa0cb221137678a876ff8'
-		LICENSE_md5    = '5a57e6c0fd3f83f420a708ef88294d46'
+		LICENSE_sha256 = 'a6ab0a790de240d28efc084663325dc9a5ef6e86e4b5264362f88f7c819513af'
+		LICENSE_sha1   = '8aa670719521d47c018d8c43b279b9fa557b8b86'
+		LICENSE_md5    = '30bd8f3988e4788cf55702696321dfc0'
 		self.assertEqual(Checksum.sha256sum(filepath), LICENSE_sha256)
 		self.assertEqual(Checksum.sha1sum(filepath), LICENSE_sha1)
 		self.assertEqual(Checksum.md5sum(filepath), LICENSE_md5)
@@ -22,6 +24,75 @@ class TestMyMath(unittest.TestCase):
 		self.assertEqual(Convert.llong_to_double(4616189618054758400), 4.0)
 		print("    OK.")
 
+	def test_pack_many(self):
+		print("\nTesting mypwn.mymath.pack_many/unpack_many ...")
+		words = [0, 1, 0x41424344, 0xffffffff]
+		packed = ''.join(p32(w) for w in words)
+		self.assertEqual(p32_many(words), packed)
+		self.assertEqual(p32_many(iter(words)), packed)
+		self.assertEqual(p32_many(array('I', words)), packed)
+		for data in (packed, bytearray(packed), memoryview(packed)):
+			self.assertEqual(u32_many(data), words)
+			self.assertEqual(list(u32_many(data, kind='array')), words)
+
+		words = [0, 0xdeadbeefcafebabe, 0x00007fffffffe000]
+		packed = ''.join(p64(w) for w in words)
+		self.assertEqual(p64_many(words), packed)
+		self.assertEqual(u64_many(packed), words)
+		self.assertEqual(list(u64_many(packed, kind='array')), words)
+
+		# endianness and word sizes
+		self.assertEqual(pack_many([0x0102], 2, 'big'), '\x01\x02')
+		self.assertEqual(pack_many([0x0102], 2, 'little'), '\x02\x01')
+		self.assertEqual(unpack_many('\x01\x02\x03', 1), [1, 2, 3])
+		self.assertEqual(u32_many('\x00\x00\x00\x01', 'big'), [1])
+		self.assertEqual(list(u32_many('\x00\x00\x00\x01', 'big', 'array')),
+		                 [1])
+		self.assertEqual(p32_many(array('I', [1]), 'big'), '\x00\x00\x00\x01')
+		self.assertRaises(ValueError, pack_many, [1], 3)
+		self.assertRaises(ValueError, unpack_many, '\x00' * 7, 4)
+		print("    OK.")
+
+	def test_pack_many_numpy(self):
+		try:
+			import numpy
+		except ImportError:
+			raise unittest.SkipTest("numpy is not installed")
+		print("\nTesting mypwn.mymath.pack_many/unpack_many with numpy ...")
+		words = numpy.array([1, 2, 0xffffffffffffffff], dtype=numpy.uint64)
+		packed = ''.join(p64(int(w)) for w in words)
+		self.assertEqual(p64_many(words), packed)
+		self.assertEqual(list(u64_many(packed, kind='numpy')), list(words))
+		self.assertEqual(p32_many(u32_many(packed, 'big', 'numpy'), 'big'),
+		                 packed)
+		print("    OK.")
+
+
+class BenchMyMath(unittest.TestCase):
+	WORDS = 10000
+
+	def _report(self, name, fun, number=20):
+		best = min(timeit.repeat(fun, number=number, repeat=3))
+		print("    %-28s %8.1f ns/word" % (name, best / number / self.WORDS * 1e9))
+
+	def test_bench_pack_many(self):
+		print("\nBenchmark mypwn.mymath scalar vs bulk (%d words) ..." % self.WORDS)
+		words = [(0x4141414100000000 + i) for i in range(self.WORDS)]
+		packed = p64_many(words)
+		chunks = [packed[i:i + 8] for i in range(0, len(packed), 8)]
+		self._report("p64 loop", lambda: ''.join([p64(w) for w in words]))
+		self._report("p64_many(list)", lambda: p64_many(words))
+		self._report("u64 loop", lambda: [u64(c) for c in chunks])
+		self._report("u64_many(list)", lambda: u64_many(packed))
+		self._report("u64_many(array)", lambda: u64_many(packed, kind='array'))
+		self._report("p32_many(array)",
+		             lambda: p32_many(u32_many(packed, kind='array')))
+		try:
+			import numpy
+		except ImportError:
+			return
+		self._report("u64_many(numpy)", lambda: u64_many(packed, kind='numpy'))
+
 
 if __name__ == '__main__':
 	unittest.main()
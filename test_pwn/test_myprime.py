@@ -0,0 +1,106 @@
+#!/usr/bin/env python2
+import unittest
+import os
+import time
+from array import array
+from mypwn.myprime import *
+from cachedir import TempCacheDirMixin, temp_cache_dir
+
+def _naive_primes(limit):
+	return [n for n in range(2, limit) if all(n % d for d in range(2, int(n ** 0.5) + 1))]
+
+class TestMyPrime(TempCacheDirMixin, unittest.TestCase):
+	def test_sieve(self):
+		print("\nTesting sieve() ...")
+		expected = _naive_primes(5000)
+		flags = sieve(5000)
+		self.assertEqual(len(flags), 5000)
+		self.assertEqual([n for n in range(5000) if flags[n]], expected)
+		self.assertEqual(sieve(0), bytearray())
+		self.assertEqual(sieve(1), bytearray(1))
+
+	def test_primes(self):
+		print("\nTesting primes() and iter_primes() ...")
+		expected = _naive_primes(5000)
+		# tiny segments put segment boundaries everywhere
+		for limit in list(range(0, 100)) + [4999, 5000, 5001]:
+			wanted = [p for p in expected if p < limit]
+			for segment_size in (1, 2, 7, 64, 1 << 20):
+				table = primes(limit, segment_size)
+				self.assertEqual(table.typecode, 'I')
+				self.assertEqual(list(table), wanted)
+				self.assertEqual(list(iter_primes(limit, segment_size)), wanted)
+		# pi(10**7)
+		self.assertEqual(len(primes(10**7)), 664579)
+		self.assertRaises(ValueError, primes, 2**32 + 1)
+
+	def test_prime_table(self):
+		print("\nTesting prime_table() ...")
+		table = prime_table(10**6)
+		self.assertEqual(len(table), 78498)
+		self.assertEqual(table[0], 2)
+		self.assertEqual(table[-1], 999983)
+		self.assertEqual(table[:5], array('I', [2, 3, 5, 7, 11]))
+		self.assertEqual(table[::20000], primes(10**6)[::20000])
+		self.assertTrue(999983 in table)
+		self.assertFalse(999981 in table)
+		self.assertEqual(table.count(100), 25)
+		self.assertEqual(table[:], primes(10**6))
+		self.assertRaises(IndexError, lambda: table[78498])
+		self.assertEqual(os.listdir(self.cache_dir), ['primes-1000000.u32'])
+
+		# smaller limits are served by the same file
+		small = prime_table(1000)
+		self.assertEqual(small.path, table.path)
+		self.assertEqual(list(small), _naive_primes(1000))
+		self.assertEqual(list(prime_table(2)), [])
+		self.assertEqual(os.listdir(self.cache_dir), ['primes-1000000.u32'])
+		table.close()
+		small.close()
+
+	def test_is_probable_prime(self):
+		print("\nTesting is_probable_prime() ...")
+		flags = sieve(20000)
+		for n in range(-5, 20000):
+			self.assertEqual(is_probable_prime(n), n >= 0 and bool(flags[n]), n)
+		known_primes = [
+			2**31 - 1, 2**61 - 1, 2**64 - 59, 2**89 - 1, 2**127 - 1,
+			18446744073709551557,
+		]
+		composites = [
+			561, 41041, 825265,                  # Carmichael numbers
+			3215031751,                          # strong pseudoprime to 2, 3, 5, 7
+			3825123056546413051,                 # strong pseudoprime to 2 .. 23
+			318665857834031151167461,            # strong pseudoprime to 2 .. 37
+			2**64 - 1, (2**31 - 1) * (2**61 - 1), (2**61 - 1)**2,
+		]
+		for n in known_primes:
+			self.assertTrue(is_probable_prime(n), n)
+		for n in composites:
+			self.assertFalse(is_probable_prime(n), n)
+
+
+class BenchMyPrime(unittest.TestCase):
+	def test_bench_primes(self):
+		print("\nBenchmark primes() and prime_table() ...")
+		with temp_cache_dir():
+			limit = 10**8
+			start = time.time()
+			count = len(primes(limit))
+			sieved = time.time() - start
+
+			start = time.time()
+			prime_table(limit).close()
+			cached = time.time() - start
+
+			start = time.time()
+			table = prime_table(limit)
+			self.assertEqual(len(table), count)
+			mapped = time.time() - start
+			table.close()
+			print("    primes(10**8):           %8.3f sec" % sieved)
+			print("    prime_table(), first:    %8.3f sec" % cached)
+			print("    prime_table(), cached:   %8.3f sec" % mapped)
+
+if __name__ == '__main__':
+	unittest.main()
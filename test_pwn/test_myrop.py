@@ -0,0 +1,160 @@
+#!/usr/bin/env python2
+import unittest
+import os
+import time
+from struct import pack
+import mypwn.myrop
+from mypwn.myrop import *
+from cachedir import TempCacheDirMixin, temp_cache_dir
+
+def _make_exec(path, bits, code, vaddr, machine=None):
+	'''Writes an ELF whose only segment maps `code' executable at vaddr'''
+	if machine is None:
+		machine = 3 if bits == 32 else 62
+	ident = ('\x7fELF' + chr(bits // 32) + '\x01\x01').ljust(16, '\0')
+	if bits == 32:
+		header = ident + pack('<HHIIIIIHHHHHH', 2, machine, 1, vaddr, 52, 0, 0,
+				52, 32, 1, 40, 0, 0)
+		program = pack('<IIIIIIII', 1, 84, vaddr, vaddr, len(code), len(code), 5,
+				0x1000)
+	else:
+		header = ident + pack('<HHIQQQIHHHHHH', 2, machine, 1, vaddr, 64, 0, 0,
+				64, 56, 1, 64, 0, 0)
+		program = pack('<IIQQQQQQ', 1, 5, 120, vaddr, vaddr, len(code), len(code),
+				0x1000)
+	with open(path, 'wb') as fd:
+		fd.write(header + program + code)
+
+# pop rdi; ret | nop | pop rax; pop rbx; ret | mov [rdi], rax; ret
+# | syscall; ret | jmp rax; ret | mov eax, 0xc35e ('pop rsi; ret' inside)
+_CODE64 = ('\x5f\xc3' '\x90' '\x58\x5b\xc3' '\x48\x89\x07\xc3' '\x0f\x05\xc3'
+		'\xff\xe0\xc3' '\xb8\x5e\xc3\x00\x00')
+
+class TestMyRop(TempCacheDirMixin, unittest.TestCase):
+	def test_disasm(self):
+		print("\nTesting mypwn.myrop.disasm ...")
+		testcases = [
+			('\x5f\xc3', 64, 'pop rdi; ret'),
+			('\x41\x5e\x41\x5f\xc3', 64, 'pop r14; pop r15; ret'),
+			('\x48\x83\xc4\x18\xc2\x08\x00', 64, 'add rsp, 0x18; ret 0x8'),
+			('\x48\x83\xec\x80', 64, 'sub rsp, -0x80'),
+			('\x48\x89\x44\x24\x08', 64, 'mov qword ptr [rsp + 0x8], rax'),
+			('\x8b\x44\x8b\xfc', 64, 'mov eax, dword ptr [rbx + rcx*4 - 0x4]'),
+			('\x48\x8d\x05\x10\x00\x00\x00', 64, 'lea rax, [rip + 0x10]'),
+			('\x31\xc0\x48\x31\xd2\x0f\x05', 64, 'xor eax, eax; xor rdx, rdx; syscall'),
+			('\x49\xbb\x88\x77\x66\x55\x44\x33\x22\x11', 64,
+				'mov r11, 0x1122334455667788'),
+			('\x48\xc1\xe8\x03\x48\xd1\xe0\x48\xf7\xd8', 64,
+				'shr rax, 0x3; shl rax, 1; neg rax'),
+			('\xff\x34\x24\x48\xff\xc1\xc9\x90\x48\x97', 64,
+				'push qword ptr [rsp]; inc rcx; leave; nop; xchg rax, rdi'),
+			('\x58\x5b\xcd\x80\xc3', 32, 'pop eax; pop ebx; int 0x80; ret'),
+			('\x89\x0d\x10\x20\x04\x08\x40\x4b', 32,
+				'mov dword ptr [0x8042010], ecx; inc eax; dec ebx'),
+		]
+		for (code, bits, text) in testcases:
+			self.assertEqual(disasm(code, bits), text)
+		# branches, prefixes and 8-bit operands are not gadget material
+		for code in ('\xff\xe0', '\xe8\x00\x00\x00\x00', '\x74\x02', '\x66\x58',
+				'\x88\xc0', '\x48\x8d\xc0', '\x48\x83'):
+			self.assertRaises(ValueError, disasm, code)
+		print("    OK.")
+
+	def test_gadgets(self):
+		print("\nTesting mypwn.myrop.Gadgets ...")
+		path = os.path.join(self.tmpdir, 'x64')
+		_make_exec(path, 64, _CODE64, 0x400000)
+		rop = Gadgets(path, cache=False)
+		self.assertEqual(rop.search('pop rdi; ret'), [(0x400000, 'pop rdi; ret')])
+		self.assertEqual(rop.find('pop rsi ;ret'), 0x400011)
+		self.assertEqual(rop.find('pop  rax ; pop rbx;ret'), 0x400003)
+		self.assertEqual(rop.find('mov qword ptr [rdi],rax ; ret'), 0x400006)
+		self.assertEqual(rop.find('syscall; ret'), 0x40000a)
+		self.assertEqual(rop.find('pop rcx; ret'), None)
+		self.assertEqual(rop.search('pop ?; ret'), [
+			(0x400000, 'pop rdi; ret'), (0x400004, 'pop rbx; ret'),
+			(0x400011, 'pop rsi; ret')])
+		self.assertEqual(rop.search('mov ? ptr [?], ?; ret'),
+			[(0x400006, 'mov qword ptr [rdi], rax; ret'),
+			 (0x400007, 'mov dword ptr [rdi], eax; ret')])
+		self.assertEqual([a for (a, text) in rop.search('ret')],
+			[0x400001, 0x400005, 0x400009, 0x40000c, 0x40000f, 0x400012])
+		# a gadget stops at the first ret and never goes through the jmp
+		self.assertEqual(rop.find('nop; pop rax; pop rbx; ret'), 0x400002)
+		self.assertEqual(rop.find('pop rdi; ret; nop; pop rax; pop rbx; ret'), None)
+		self.assertFalse(any('jmp' in text for (_, text) in rop))
+		self.assertEqual(len(list(rop)), 14)
+
+		path = os.path.join(self.tmpdir, 'x86')
+		_make_exec(path, 32, '\x58\x5b\xcd\x80\xc3', 0x8048000)
+		rop = Gadgets(path, cache=False)
+		self.assertEqual(rop.search('pop ?; pop ?; int 0x80; ret'),
+			[(0x8048000, 'pop eax; pop ebx; int 0x80; ret')])
+
+		path = os.path.join(self.tmpdir, 'arm')
+		_make_exec(path, 32, '\x1e\xff\x2f\xe1', 0x10000, machine=40)
+		self.assertRaises(ValueError, Gadgets, path)
+		print("    OK.")
+
+	def test_chunks(self):
+		print("\nTesting mypwn.myrop.Gadgets chunks and cache ...")
+		path = os.path.join(self.tmpdir, 'x64')
+		_make_exec(path, 64, _CODE64 * 50, 0x400000)
+		whole = Gadgets(path, cache=False).gadgets
+		chunk = mypwn.myrop._CHUNK
+		mypwn.myrop._CHUNK = 7
+		try:
+			for processes in (1, 2):
+				self.assertEqual(Gadgets(path, processes=processes).gadgets, whole)
+		finally:
+			mypwn.myrop._CHUNK = chunk
+
+		# the index is loaded from the cache, not rebuilt
+		def fail(*args):
+			raise AssertionError('index rebuilt')
+		build = Gadgets._build
+		Gadgets._build = fail
+		try:
+			self.assertEqual(Gadgets(path).gadgets, whole)
+		finally:
+			Gadgets._build = build
+		print("    OK.")
+
+
+class BenchMyRop(unittest.TestCase):
+	def test_bench_gadgets(self):
+		libc = '/lib/x86_64-linux-gnu/libc.so.6'
+		if not os.path.exists(libc):
+			return
+		print("\nBenchmark mypwn.myrop.Gadgets on libc ...")
+		with temp_cache_dir():
+			start = time.time()
+			Gadgets(libc, processes=1, cache=False)
+			single = time.time() - start
+
+			start = time.time()
+			Gadgets(libc)
+			built = time.time() - start
+
+			start = time.time()
+			rop = Gadgets(libc)
+			cached = time.time() - start
+
+			start = time.time()
+			for _ in range(100):
+				rop.find('pop rdi; ret')
+			exact = (time.time() - start) / 100
+
+			start = time.time()
+			for _ in range(10):
+				rop.search('pop ?; pop ?; ret')
+			wildcard = (time.time() - start) / 10
+			print("    %d gadgets" % len(list(rop)))
+			print("    index built, 1 process:   %8.3f sec" % single)
+			print("    index built, pool:        %8.3f sec" % built)
+			print("    index cached:             %8.3f sec" % cached)
+			print("    find('pop rdi; ret'):     %8.3f ms" % (exact * 1000))
+			print("    search('pop ?; pop ?; ret'): %5.3f ms" % (wildcard * 1000))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python2
+import unittest
+import os
+import socket
+import threading
+import time
+from mypwn.mysocket import *
+try:
+	import SocketServer as socketserver
+except ImportError:
+	import socketserver
+
+def _serve(chunks, delay=0, echo=False):
+	'''
+	Starts a one-shot local TCP server that sends `chunks' (sleeping `delay'
+	between them), then echoes what it receives if `echo'.
+	Returns the port it listens on.
+	'''
+	server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	server.bind(('127.0.0.1', 0))
+	server.listen(1)
+
+	def run():
+		conn, _ = server.accept()
+		server.close()
+		for chunk in chunks:
+			conn.sendall(chunk)
+			if delay:
+				time.sleep(delay)
+		if echo:
+			data = conn.recv(4096)
+			while data:
+				conn.sendall(data)
+				data = conn.recv(4096)
+		conn.close()
+
+	t = threading.Thread(target=run)
+	t.daemon = True
+	t.start()
+	return server.getsockname()[1]
+
+
+class TestTube(unittest.TestCase):
+	def test_recvuntil(self):
+		print("\nTesting mypwn.mysocket.Tube.recvuntil ...")
+		port = _serve(['hel', 'lo wo', 'rld\nname', ': rest'])
+		# tiny recv_size makes every pattern straddle two recvs
+		t = Tube(myconnect('127.0.0.1', port), recv_size=3)
+		self.assertEqual(t.recvuntil('wor'), 'hello wor')
+		self.assertEqual(t.recvline(), 'ld\n')
+		self.assertEqual(t.recvuntil(': ', drop=True), 'name')
+		self.assertEqual(t.recvn(2), 're')
+		t.unrecv('XY')
+		self.assertEqual(t.recvall(), 'XYst')
+		self.assertEqual(t.recvuntil('never'), '')
+		self.assertRaises(ValueError, t.recvuntil, '')
+		self.assertRaises(ValueError, t.recvuntil, '', drop=True)
+		t.close()
+		print("    OK.")
+
+	def test_eof_and_timeout(self):
+		print("\nTesting mypwn.mysocket.Tube timeouts ...")
+		port = _serve(['abc', 'def'], delay=0.5)
+		t = Tube(myconnect('127.0.0.1', port), timeout=0.1)
+		self.assertEqual(t.recvuntil('abc'), 'abc')
+		# 'def' arrives after the timeout, nothing is lost
+		self.assertEqual(t.recvn(3), '')
+		self.assertEqual(t.recvline(timeout=None), 'def')
+		self.assertTrue(t.eof)
+		t.close()
+
+		port = _serve(['x'], echo=True)
+		t = Tube(myconnect('127.0.0.1', port), timeout=5)
+		self.assertEqual(t.recvn(1), 'x')
+		t.sendline('ping')
+		self.assertEqual(t.recvline(keepends=False), 'ping')
+		t.close()
+		print("    OK.")
+
+
+@unittest.skipUnless(os.path.exists('/bin/cat') and os.path.exists('/bin/sh'),
+		'needs /bin/cat and /bin/sh')
+class TestProcess(unittest.TestCase):
+	def test_process(self):
+		print("\nTesting mypwn.mysocket.Process ...")
+		p = Process(['/bin/cat'], timeout=5)
+		p.sendline('hello')
+		self.assertEqual(p.recvuntil('ll'), 'hell')
+		self.assertEqual(p.recvline(), 'o\n')
+		self.assertEqual(p.recv(timeout=0.1), '')
+		self.assertEqual(p.poll(), None)
+		p.send('abc\ndef')
+		p.shutdown()
+		self.assertEqual(p.recvline(keepends=False), 'abc')
+		self.assertEqual(p.recvall(), 'def')
+		self.assertTrue(p.eof)
+		self.assertEqual(p.wait(), 0)
+		p.close()
+		p.close()
+
+		script = 'echo $0 $FOO; test -t 1 && echo tty; echo err >&2; exit 3'
+		for pty in (False, True):
+			p = Process(['/bin/sh', '-c', script], env={'FOO': 'bar'},
+					argv0='target', pty=pty, timeout=5)
+			self.assertEqual(p.recvall(), 'target bar\n' + 'tty\n' * pty + 'err\n')
+			self.assertEqual(p.wait(), 3)
+			p.close()
+		print("    OK.")
+
+	def test_no_deadlock(self):
+		print("\nTesting mypwn.mysocket.Process with full pipes ...")
+		# cat writes back while we write: without reading during send()
+		# both sides block once the pipes are full
+		data = os.urandom(4 << 20)
+		for pty in (False, True):
+			p = Process(['/bin/cat'], pty=pty, timeout=30)
+			p.send(data)
+			self.assertEqual(p.recvn(len(data)), data)
+			p.close()
+
+		p = Process(['/bin/sleep', '10'], timeout=0.1)
+		self.assertEqual(p.recvline(), '')
+		self.assertFalse(p.eof)
+		p.close()
+		self.assertEqual(p.poll(), -9)
+
+		# nobody reads stdin: send() gives up after the timeout
+		p = Process(['/bin/sleep', '10'], timeout=0.2)
+		self.assertRaises(socket.timeout, p.send, 'A' * (4 << 20))
+		p.close()
+		print("    OK.")
+
+
+class _SlowEcho(socketserver.BaseRequestHandler):
+	def handle(self):
+		try:
+			self.request.sendall('> ')
+			data = self.request.recv(4096)
+			time.sleep(0.2)
+			self.request.sendall(data)
+		except socket.error:
+			# the client hung up early
+			pass
+
+class _Server(socketserver.ThreadingTCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+	request_queue_size = 64
+
+class TestRunMany(unittest.TestCase):
+	def setUp(self):
+		self.server = _Server(('127.0.0.1', 0), _SlowEcho)
+		t = threading.Thread(target=self.server.serve_forever)
+		t.daemon = True
+		t.start()
+		self.target = '127.0.0.1:%d' % self.server.server_address[1]
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+	def test_run_many(self):
+		print("\nTesting mypwn.mysocket.run_many ...")
+		def task(t):
+			yield t.recvuntil('> ')
+			yield t.sendline('hello')
+			line = yield t.recvline(keepends=False)
+			raise StopIteration(line)
+
+		start = time.time()
+		results = list(run_many(task, [self.target], repeat=20,
+		                        concurrency=10, timeout=5))
+		elapsed = time.time() - start
+		self.assertEqual(sorted(r.index for r in results), list(range(20)))
+		for r in results:
+			self.assertEqual(r.value, 'hello')
+			self.assertEqual(r.error, None)
+			self.assertEqual(r.target, ('127.0.0.1', self.server.server_address[1]))
+			self.assertTrue(r.latency >= 0.2)
+		# 20 connections of 0.2s, 10 at a time; 4s if they were serial
+		self.assertTrue(0.4 <= elapsed < 2, elapsed)
+		print("    20 connections in %.2fs" % elapsed)
+
+		# all in flight at once
+		start = time.time()
+		results = list(run_many(task, [self.target], repeat=60, timeout=5))
+		elapsed = time.time() - start
+		self.assertEqual([r.value for r in results], ['hello'] * 60)
+		self.assertTrue(elapsed < 2, elapsed)
+		print("    60 connections in %.2fs" % elapsed)
+
+		# errors are collected per connection
+		closed = socket.socket()
+		closed.bind(('127.0.0.1', 0))
+		closed_port = closed.getsockname()[1]
+		closed.close()
+		def fail(t):
+			yield t.recvuntil('> ')
+			raise ValueError('boom')
+		results = sorted(run_many(fail, [self.target, ('127.0.0.1', closed_port)]))
+		self.assertTrue(isinstance(results[0].error, ValueError))
+		self.assertTrue(isinstance(results[1].error, socket.error))
+		self.assertEqual(results[1].value, None)
+
+		# timeouts: receives give '', sends raise socket.timeout
+		def slow(t):
+			data = yield t.recvuntil('never', timeout=0.1)
+			buffered = yield t.recv()
+			raise StopIteration((data, buffered))
+		(result,) = run_many(slow, [self.target])
+		self.assertEqual(result.value, ('', '> '))
+		self.assertTrue(result.latency < 0.2)
+		def bad(t):
+			yield 'recvline'
+		(result,) = run_many(bad, [self.target])
+		self.assertTrue(isinstance(result.error, TypeError))
+		# plain functions just return their result
+		(result,) = run_many(lambda t: 42, [self.target])
+		self.assertEqual((result.value, result.error), (42, None))
+		print("    OK.")
+
+	def test_async_tube(self):
+		print("\nTesting mypwn.mysocket.AsyncTube ...")
+		port = _serve(['hel', 'lo wo', 'rld\nname', ': rest'], delay=0.01)
+		def task(t):
+			# tiny recv_size makes every pattern straddle two recvs
+			t.recv_size = 3
+			got = []
+			got.append((yield t.recvuntil('wor')))
+			got.append((yield t.recvline()))
+			got.append((yield t.recvuntil(': ', drop=True)))
+			got.append((yield t.recvn(2)))
+			t.unrecv('XY')
+			got.append((yield t.recvall()))
+			got.append((yield t.recvuntil('never')))
+			self.assertRaises(ValueError, t.recvuntil, '')
+			raise StopIteration(got)
+		(result,) = run_many(task, [('127.0.0.1', port)], timeout=5)
+		self.assertEqual(result.error, None)
+		self.assertEqual(result.value, ['hello wor', 'ld\n', 'name', 're', 'XYst', ''])
+		print("    OK.")
+
+	def test_run_many_threads(self):
+		print("\nTesting mypwn.mysocket.run_many_threads ...")
+		def task(t):
+			t.recvuntil('> ')
+			t.sendline('hello')
+			return t.recvline(keepends=False)
+
+		start = time.time()
+		results = list(run_many_threads(task, [self.target], repeat=20,
+		                                concurrency=10, timeout=5))
+		elapsed = time.time() - start
+		self.assertEqual(sorted(r.index for r in results), list(range(20)))
+		for r in results:
+			self.assertEqual(r.value, 'hello')
+			self.assertEqual(r.error, None)
+			self.assertTrue(r.latency >= 0.2)
+		self.assertTrue(elapsed < 2, elapsed)
+
+		def fail(t):
+			raise ValueError('boom')
+		(result,) = run_many_threads(fail, [self.target])
+		self.assertTrue(isinstance(result.error, ValueError))
+		print("    OK.")
+
+
+class BenchTube(unittest.TestCase):
+	SIZE = 1 << 20
+
+	def _report(self, name, fun):
+		port = _serve(['A' * 4096] * (self.SIZE // 4096) + ['END', 'tail'])
+		sock = myconnect('127.0.0.1', port)
+		start = time.time()
+		data = fun(sock)
+		elapsed = time.time() - start
+		sock.close()
+		self.assertTrue('END' in data)
+		print("    %-28s %8.1f MB/s" % (name, len(data) / elapsed / 1e6))
+
+	def test_bench_recvuntil(self):
+		print("\nBenchmark mypwn.mysocket recvuntil (%d bytes) ..." % self.SIZE)
+		self._report("recvuntil()", lambda s: recvuntil(s, 'END'))
+		self._report("Tube.recvuntil()",
+		             lambda s: Tube(s).recvuntil('END'))
+		self._report("Tube.recvuntil(), 64K recvs",
+		             lambda s: Tube(s, recv_size=1 << 16).recvuntil('END'))
+
+
+class _Echo(socketserver.BaseRequestHandler):
+	def handle(self):
+		try:
+			self.request.sendall('> ')
+			self.request.sendall(self.request.recv(4096))
+		except socket.error:
+			pass
+
+class BenchRunMany(unittest.TestCase):
+	CONNECTIONS = 2000
+
+	def test_bench_run_many(self):
+		print("\nBenchmark mypwn.mysocket.run_many (%d connections) ..." % self.CONNECTIONS)
+		server = _Server(('127.0.0.1', 0), _Echo)
+		t = threading.Thread(target=server.serve_forever)
+		t.daemon = True
+		t.start()
+		target = ('127.0.0.1', server.server_address[1])
+		def task(t):
+			yield t.recvuntil('> ')
+			yield t.sendline('hello')
+			line = yield t.recvline()
+			raise StopIteration(line)
+		def blocking_task(t):
+			t.recvuntil('> ')
+			t.sendline('hello')
+			return t.recvline()
+		try:
+			for (name, run, fun) in (('run_many', run_many, task),
+			                         ('run_many_threads', run_many_threads, blocking_task)):
+				start = time.time()
+				results = list(run(fun, [target], repeat=self.CONNECTIONS,
+				                   concurrency=32, timeout=10))
+				elapsed = time.time() - start
+				self.assertEqual([r.value for r in results], ['hello\n'] * self.CONNECTIONS)
+				print("    %-18s %8.1f connections/sec" % (name, self.CONNECTIONS / elapsed))
+		finally:
+			server.shutdown()
+			server.server_close()
+
+
+class BenchProcess(unittest.TestCase):
+	SIZE = 64 << 20
+
+	def test_bench_process(self):
+		if not os.path.exists('/bin/cat'):
+			return
+		print("\nBenchmark mypwn.mysocket.Process (%d MB through cat) ..." % (self.SIZE >> 20))
+		data = 'A' * self.SIZE
+		for pty in (False, True):
+			p = Process(['/bin/cat'], pty=pty, timeout=60)
+			start = time.time()
+			p.send(data)
+			received = len(p.recvn(self.SIZE))
+			elapsed = time.time() - start
+			p.close()
+			self.assertEqual(received, self.SIZE)
+			print("    send() + recvn(), pty=%-5s %8.1f MB/s" % (pty, self.SIZE / elapsed / 1e6))
+
+
+if __name__ == '__main__':
+	unittest.main()
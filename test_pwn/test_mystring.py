@@ -0,0 +1,114 @@
+#!/usr/bin/env python2
+import unittest
+import logging
+import os
+import time
+from mypwn.mystring import *
+
+class TestHexdump(unittest.TestCase):
+	def test_hexdump(self):
+		print("\nTesting mypwn.mystring.hexdump ...")
+		data = 'A' * 40 + 'mypwn'
+		self.assertEqual(hexdump(data),
+			'00000000  41 41 41 41 41 41 41 41  41 41 41 41 41 41 41 41  |AAAAAAAAAAAAAAAA|\n'
+			'*\n'
+			'00000020  41 41 41 41 41 41 41 41  6d 79 70 77 6e           |AAAAAAAAmypwn|\n'
+			'0000002d\n')
+		self.assertEqual(hexdump(data, skip=False).count('\n'), 4)
+		self.assertEqual(hexdump(''), '00000000\n')
+		self.assertEqual(hexdump(bytearray(range(256)), 0x7a, 0x82),
+			'0000007a  7a 7b 7c 7d 7e 7f 80 81                           |z{|}~...|\n'
+			'00000082\n')
+
+		# repeated lines on both sides of an internal chunk boundary
+		data = '\x00' * 64 + 'a' * 16 + '\x00' * 32 + 'aa'
+		self.assertEqual(hexdump(memoryview(data)),
+			'00000000  00 00 00 00 00 00 00 00  00 00 00 00 00 00 00 00  |................|\n'
+			'*\n'
+			'00000040  61 61 61 61 61 61 61 61  61 61 61 61 61 61 61 61  |aaaaaaaaaaaaaaaa|\n'
+			'00000050  00 00 00 00 00 00 00 00  00 00 00 00 00 00 00 00  |................|\n'
+			'*\n'
+			'00000070  61 61                                             |aa|\n'
+			'00000072\n')
+		print("    OK.")
+
+	def test_log_hexdump(self):
+		print("\nTesting mypwn.log.Logger.hexdump ...")
+		from mypwn.log import log
+		# a disabled level must not even look at the data
+		log.hexdump(object(), level=logging.DEBUG)
+		self.assertRaises(TypeError, log.hexdump, object(), level=logging.CRITICAL)
+		print("    OK.")
+
+
+class TestBadChars(unittest.TestCase):
+	def test_find_badchars(self):
+		print("\nTesting mypwn.mystring.find_badchars ...")
+		self.assertEqual(find_badchars('AAAA\x00\x0b\x04\x08 \n', '\x00\x0a'),
+			[(4, '\x00'), (9, '\n')])
+		self.assertEqual(find_badchars('AAAA\x00\x0b\x04\x08 \n'),
+			[(4, '\x00'), (8, ' '), (9, '\n')])
+		self.assertEqual(find_badchars(''), [])
+		self.assertEqual(find_badchars('\x00\x01', ''), [])
+		self.assertEqual(find_badchars(bytearray('\xff\x00\xff'), '\xff'),
+			[(0, '\xff'), (2, '\xff')])
+		data = os.urandom(4096)
+		bad = '\x00\x80\xff'
+		self.assertEqual(find_badchars(data, bad),
+			[(i, c) for (i, c) in enumerate(data) if c in bad])
+
+		import mypwn.mystring
+		default = mypwn.mystring.BADCHARS
+		mypwn.mystring.BADCHARS = '\x0b'
+		try:
+			self.assertEqual(find_badchars('\x00\x0b'), [(1, '\x0b')])
+		finally:
+			mypwn.mystring.BADCHARS = default
+		print("    OK.")
+
+	def test_badchar_warnings(self):
+		print("\nTesting mypwn.mystring.badchar_warnings ...")
+		self.assertEqual(badchar_warnings('ABCD'), [])
+		self.assertEqual(badchar_warnings('\x00AB C\x00\r\x0b', '\x00\r\x0b '), [
+			'NULL byte detected at 0, 5 !!!',
+			'\\x0b byte detected at 7 !!!',
+			'CR byte detected at 6 !!!',
+			'SPACE detected at 3 !!!'])
+		self.assertEqual(badchar_warnings('\n' * 10, limit=3),
+			['LF byte detected at 0, 1, 2, ... (10 times) !!!'])
+		print("    OK.")
+
+
+class BenchHexdump(unittest.TestCase):
+	SIZE = 100 << 20
+
+	def test_bench_hexdump(self):
+		print("\nBenchmark mypwn.mystring.hexdump_iter (%d MB) ..." % (self.SIZE >> 20))
+		data = os.urandom(self.SIZE // 2) + '\x00' * (self.SIZE // 2)
+		for skip in (False, True):
+			start = time.time()
+			for _ in hexdump_iter(data, skip=skip):
+				pass
+			elapsed = time.time() - start
+			print("    skip=%-5s %8.1f MB/s" % (skip, self.SIZE / elapsed / 1e6))
+
+
+class BenchBadChars(unittest.TestCase):
+	SIZE = 100 << 20
+
+	def test_bench_find_badchars(self):
+		print("\nBenchmark mypwn.mystring.find_badchars (%d MB) ..." % (self.SIZE >> 20))
+		data = 'A' * self.SIZE
+		start = time.time()
+		self.assertEqual(find_badchars(data), [])
+		elapsed = time.time() - start
+		print("    find_badchars(), clean:  %8.1f MB/s" % (self.SIZE / elapsed / 1e6))
+		start = time.time()
+		for c in '\x00\x0a\x0d\x20':
+			c in data
+		elapsed = time.time() - start
+		print("    one `in' per bad char:   %8.1f MB/s" % (self.SIZE / elapsed / 1e6))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python2
+import unittest
+import os
+import platform
+import string
+import subprocess
+import sys
+import time
+from itertools import islice
+from struct import pack
+from mypwn.stacktools import *
+from mypwn.stacktools import SHELLCODE
+from mypwn.mystring import find_badchars
+
+# runs encode_shellcode(code, badchars, 64, methods) from RWX memory, prints
+# what the decoded code returns
+_RUN64 = '''
+import ctypes, mmap, sys
+from mypwn.stacktools import encode_shellcode
+code = encode_shellcode(*eval(sys.argv[1]))
+buf = mmap.mmap(-1, 1 << 16, prot=mmap.PROT_READ | mmap.PROT_WRITE | mmap.PROT_EXEC)
+buf.write(code)
+print ctypes.CFUNCTYPE(ctypes.c_int)(ctypes.addressof(ctypes.c_char.from_buffer(buf)))()
+'''
+
+class TestCyclic(unittest.TestCase):
+	def test_cyclic(self):
+		print("\nTesting mypwn.stacktools.cyclic ...")
+		self.assertEqual(cyclic(20), 'aaaabaaacaaadaaaeaaa')
+		self.assertEqual(cyclic(alphabet='ab', n=3), 'aaababbb')
+		self.assertEqual(cyclic(alphabet='01', n=4), '0000100110101111')
+		self.assertEqual(cyclic(alphabet='x', n=4), 'x')
+		self.assertRaises(ValueError, cyclic, 9, 'ab', 3)
+		self.assertRaises(ValueError, cyclic, 4, 'aab', 3)
+
+		# every subsequence occurs exactly once
+		for (alphabet, n) in (('abc', 5), ('abcdef', 3), (string.ascii_lowercase, 4)):
+			pattern = cyclic(alphabet=alphabet, n=n)
+			self.assertEqual(len(pattern), len(alphabet) ** n)
+			windows = set(pattern[i:i + n] for i in range(len(pattern) - n + 1))
+			self.assertEqual(len(windows), len(pattern) - n + 1)
+
+		# chunks are streamed, and join to the same sequence
+		chunks = list(cyclic_iter('abcde', 6, chunk_size=100))
+		self.assertTrue(all(len(chunk) < 110 for chunk in chunks))
+		self.assertEqual(''.join(chunks), cyclic(alphabet='abcde', n=6))
+		chunks = islice(cyclic_iter(n=8, chunk_size=10), 100)
+		self.assertEqual(cyclic(1000, n=8), ''.join(chunks)[:1000])
+		print("    OK.")
+
+	def test_cyclic_find(self):
+		print("\nTesting mypwn.stacktools.cyclic_find ...")
+		pattern = cyclic()
+		self.assertEqual(cyclic_find('aaab'), 1)
+		self.assertEqual(cyclic_find(0x61616162), 4)
+		for offset in (0, 1, 1000, 123456, len(pattern) - 4):
+			self.assertEqual(cyclic_find(pattern[offset:offset + 4]), offset)
+			if offset + 8 <= len(pattern):
+				# x64: 8 bytes of rip are checked after the first 4
+				self.assertEqual(cyclic_find(pattern[offset:offset + 8]), offset)
+		self.assertEqual(cyclic_find(pack('<Q', 0x6161616361616162)), 4)
+		self.assertEqual(cyclic_find(0x6161616361616162), 4)
+		self.assertEqual(cyclic_find('aaabzzzz'), -1)
+		self.assertEqual(cyclic_find('AAAA'), -1)
+		self.assertEqual(cyclic_find('aab'), 2)
+
+		# n = 8, the index is hashed
+		pattern = cyclic(100000, n=8)
+		for offset in (0, 7, 4096, 99992):
+			value = pattern[offset:offset + 8]
+			self.assertEqual(cyclic_find(value, n=8, length=100000), offset)
+		self.assertEqual(cyclic_find('aaaaaaaa', n=8, length=100000), 0)
+		self.assertEqual(cyclic_find('zzzzzzzz', n=8, length=100000), -1)
+		self.assertEqual(cyclic_find(0x6161616261616161, n=8, length=100000), 4)
+
+		pattern = cyclic(alphabet='0123456789', n=5)
+		for offset in range(0, len(pattern) - 5, 997):
+			self.assertEqual(cyclic_find(pattern[offset:offset + 5], '0123456789', 5),
+					offset)
+		print("    OK.")
+
+
+class TestEncoder(unittest.TestCase):
+	BADCHARS = ('\x00\x0a\x0d\x20', '\x00\x0a\x0b\x0c\x0d\x20', '\x0d\x0e\xcd\xee',
+			'\x00\x01\x02\x03\x04\x06\x07\x18\x2f')
+
+	def test_encode_shellcode(self):
+		print("\nTesting mypwn.stacktools.encode_shellcode ...")
+		for badchars in self.BADCHARS:
+			for bits in (32, 64):
+				for method in ('xor', 'add'):
+					for shellcode in (SHELLCODE, SHELLCODE * 20, '\x00' * 5):
+						encoded = encode_shellcode(shellcode, badchars, bits, (method,))
+						self.assertEqual(find_badchars(encoded, badchars), [])
+						# the decoder loop carries the key, the payload follows the call
+						key = ord(encoded[encoded.index('\x80' + '\x36\x2e'[method == 'add']) + 2])
+						payload = bytearray(encoded[encoded.index('\xff\xff\xff') + 3:])
+						if method == 'xor':
+							decoded = bytearray(b ^ key for b in payload)
+						else:
+							decoded = bytearray((b - key) & 0xff for b in payload)
+						self.assertEqual(bytes(decoded[:len(shellcode)]), shellcode)
+						self.assertEqual(decoded[len(shellcode):], '\x90' * (len(decoded) - len(shellcode)))
+		self.assertEqual(find_badchars(encode_shellcode()), [])
+		self.assertRaises(ValueError, encode_shellcode, SHELLCODE, '\xeb')
+		self.assertRaises(ValueError, encode_shellcode, ''.join(map(chr, range(256))), '\x00')
+		print("    OK.")
+
+	@unittest.skipUnless(platform.machine() == 'x86_64', 'runs x64 code')
+	def test_encode_shellcode_run(self):
+		print("\nTesting mypwn.stacktools.encode_shellcode decoder on x64 ...")
+		env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+		# mov eax, 42; ret
+		code = '\xb8\x2a\x00\x00\x00\xc3'
+		for (shellcode, badchars) in ((code, '\x00'), (code * 100, '\x00\xc3\x2a')):
+			for method in ('xor', 'add'):
+				args = repr((shellcode, badchars, 64, (method,)))
+				try:
+					out = subprocess.check_output([sys.executable, '-c', _RUN64, args], env=env)
+				except subprocess.CalledProcessError as e:
+					if e.returncode == 1: # no RWX mappings here
+						continue
+					raise
+				self.assertEqual(out, '42\n')
+		print("    OK.")
+
+	def test_encode_address(self):
+		print("\nTesting mypwn.stacktools.encode_address ...")
+		for badchars in self.BADCHARS:
+			for (address, size) in ((0x0804a00a, 4), (0x00000000, 4), (0xffffffff, 4),
+					(0x00007ffff7a0d000, 8)):
+				for method in ('xor', 'add'):
+					(encoded, key) = encode_address(address, badchars, size, method)
+					if method == 'xor':
+						self.assertEqual(encoded ^ key, address)
+					else:
+						self.assertEqual((encoded + key) % (1 << 8 * size), address)
+					fmt = '<I' if size == 4 else '<Q'
+					self.assertEqual(find_badchars(pack(fmt, encoded) + pack(fmt, key), badchars), [])
+		self.assertEqual(encode_address(0x0804a00a, '\x00\x0a'), (0x0905a10b, 0x01010101))
+		self.assertRaises(ValueError, encode_address, 0x41, ''.join(map(chr, range(1, 256))))
+		print("    OK.")
+
+	def test_return2ShellcodeInStack(self):
+		print("\nTesting mypwn.stacktools.return2ShellcodeInStack badchars ...")
+		exploit = return2ShellcodeInStack(300, 0xbffff770, debug=False)
+		self.assertTrue(SHELLCODE in exploit)
+		exploit = return2ShellcodeInStack(300, 0xbffff770, debug=False, badchars='\x00\x0b')
+		self.assertFalse(SHELLCODE in exploit)
+		self.assertEqual(find_badchars(exploit, '\x00\x0b'), [])
+		print("    OK.")
+
+
+class BenchCyclic(unittest.TestCase):
+	def test_bench_cyclic(self):
+		print("\nBenchmark mypwn.stacktools.cyclic (4 MB, n = 8) ...")
+		length = 4 << 20
+		start = time.time()
+		pattern = cyclic(length, n=8)
+		generated = time.time() - start
+
+		start = time.time()
+		cyclic_find(pattern[:8], n=8, length=length)
+		indexed = time.time() - start
+
+		offsets = range(0, length - 8, length // 1000)
+		start = time.time()
+		for offset in offsets:
+			cyclic_find(pattern[offset:offset + 8], n=8, length=length)
+		lookup = (time.time() - start) / len(offsets)
+
+		start = time.time()
+		for offset in offsets[-100:]:
+			pattern.find(pattern[offset:offset + 8])
+		scan = (time.time() - start) / 100
+		print("    cyclic(4 MB):             %8.3f sec" % generated)
+		print("    cyclic_find(), index:     %8.3f sec" % indexed)
+		print("    cyclic_find(), lookup:    %8.1f us" % (lookup * 1e6))
+		print("    str.find(), end of 4 MB:  %8.1f us" % (scan * 1e6))
+
+
+class BenchEncoder(unittest.TestCase):
+	def test_bench_encode_shellcode(self):
+		print("\nBenchmark mypwn.stacktools.encode_shellcode (64 KB) ...")
+		shellcode = (SHELLCODE * 3000)[:0xffe0]
+		badchars = '\x00\x0a\x0b\x0c\x0d\x20'
+		start = time.time()
+		for _ in range(10):
+			encode_shellcode(shellcode, badchars)
+		elapsed = (time.time() - start) / 10
+		start = time.time()
+		for key in range(1, 256):
+			encoded = bytearray(b ^ key for b in bytearray(shellcode))
+			if not find_badchars(encoded, badchars):
+				break
+		naive = time.time() - start
+		print("    encode_shellcode():       %8.3f ms" % (elapsed * 1e3))
+		print("    key by key, per byte:     %8.3f ms" % (naive * 1e3))
+
+if __name__ == '__main__':
+	unittest.main()